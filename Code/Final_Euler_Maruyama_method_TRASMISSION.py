@@ -17,24 +17,19 @@ except ImportError:
     else:
         print("You chose not to install the required libraries.")
 
+from rsv_sim.cache import cached_ensemble
+from rsv_sim.plotting import draw_ensemble
+from rsv_sim.sde import Euler_Maruyama_ensemble
+
 #############################################################################################################
 # Perturbation Trasmission
 # Euler-Maruyama
 
-def dW(delta_t: float) -> float:
-    """Sample a random number at each call.
-
-    Parameters:
-    - delta_t (float): Time step.
-
-    Returns:
-    - float: Random number sampled.
-    """
-    return np.random.normal(loc=0.0, scale=np.sqrt(delta_t))
-
-def Euler_Maruyama_method(t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in):
+def Euler_Maruyama_method(t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in, seed=None):
     """Simulate a stochastic SIR model using the Euler-Maruyama method.
 
+    A single realization of rsv_sim.sde.Euler_Maruyama_ensemble.
+
     Parameters:
     - t_in (int): Initial time.
     - t_end (int): End time.
@@ -49,36 +44,14 @@ def Euler_Maruyama_method(t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_i
     - S_in (float): Initial susceptible population.
     - I_in (float): Initial infected population.
     - R_in (float): Initial recovered population.
+    - seed (int): Seed of the realization, fresh entropy if None.
 
     Returns:
     - Time steps and simulated populations.
     """
-    dt = float((t_end - t_in) / N)
-    TS = np.arange(t_in, t_end + dt, dt)
-    assert TS.size == N + 1
-
-    Ss = np.zeros(TS.size)
-    Is = np.zeros(TS.size)
-    Rs = np.zeros(TS.size)
-
-    Ss[0] = S_in
-    Is[0] = I_in
-    Rs[0] = R_in
-
-    for i in range(1, TS.size):
-        t = t_in + (i - 1) * dt
-        S = Ss[i - 1]
-        I = Is[i - 1]
-        R = Rs[i - 1]
-
-        b0_tilde = b0 + alpha * dW(dt)
-        beta = b0_tilde * (1 + b1 * np.cos(2 * np.pi * t + phi))
-
-        Ss[i] = S + ((mu - mu * S - beta * S * I + gamma * R) * dt - (alpha / b0_tilde) * beta * S * I * dW(dt))
-        Is[i] = I + ((beta * S * I - ni * I - mu * I) * dt - (alpha / b0_tilde) * beta * S * I * dW(dt))
-        Rs[i] = R + (ni * I - mu * R - gamma * R) * dt
-
-    return TS, [Ss, Is, Rs]
+    TS, results = Euler_Maruyama_ensemble(1, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                                          model='transmission', seed=seed)
+    return TS, list(results[0].T)
 
 # Function to simulate and plot multiple simulations
 def simulate_and_plot(parameters):
@@ -96,13 +69,17 @@ def simulate_and_plot(parameters):
     lables_on_y = {0: "Susceptible S(t)",
                    1:"Infectives I(t)",
                    2: "Recovered R(t)"}
+    # The semi-implicit scheme stays stable with much larger time steps, e.g. for long horizons
+    schemes = {"Euler-Maruyama": 'euler_maruyama',
+               "Semi-implicit Euler-Maruyama": 'semi_implicit'}
+    scheme = questionary.select("Choose the integration scheme:", choices=list(schemes), default="Euler-Maruyama").ask()
+    # Every realization is simulated once and reused for S, I and R; seeded runs are cached on disk
+    ts, results = cached_ensemble(num_simulations, parameters, model='transmission', seed=0, scheme=schemes[scheme], verbose=True)
     for n in range(0,3):
-        for r in range(num_simulations):
-            np.random.seed(r)
-            ts, results = Euler_Maruyama_method(**parameters)
-            plt.plot(ts, results[n], linewidth=0.9, label=f'Simulation {r + 1}')
+        # Lines decimated to the pixel columns, or a fan chart of the ensemble beyond a few realizations
+        draw_ensemble(plt.gca(), ts, results[:, :, n])
 
-        plt.title(f'Euler-Maruyama, {num_simulations} {plural} with transmission rate perturbation')
+        plt.title(f'{scheme}, {num_simulations} {plural} with transmission rate perturbation')
         plt.xlabel('Time t (years)')
         plt.ylabel(lables_on_y[n])
         plt.yscale('linear')
@@ -158,4 +135,6 @@ def modify_input():
         # Call the function to simulate and plot
         simulate_and_plot(parameters)
 
-modify_input()
+# Worker processes re-import this script, so only the main process asks for inputs
+if __name__ == "__main__":
+    modify_input()
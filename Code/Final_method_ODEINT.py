@@ -42,18 +42,38 @@ def sir_model(y, t, params):
 
     return [dSdt, dIdt, dRdt]
 
-def solve_sir_model(initial_conditions, t, params):
+def sir_jacobian(y, t, params):
+    """Jacobian of the SIR model ODE system, used by odeint in its stiff mode.
+
+    Parameters:
+    - y (list): List of S, I, R values.
+    - t (float): Time.
+    - params (dict): Dictionary containing model parameters.
+
+    Returns:
+    - numpy.ndarray: 3x3 matrix of the derivatives of [dS/dt, dI/dt, dR/dt] with respect to S, I, R.
+    """
+    S, I, R = y
+
+    beta = params['b0'] * (1 + params['b1'] * np.cos(2 * np.pi * t + params['phi']))
+
+    return np.array([[-params['mu'] - beta * I, -beta * S, params['gamma']],
+                     [beta * I, beta * S - params['ni'] - params['mu'], 0],
+                     [0, params['ni'], -params['mu'] - params['gamma']]])
+
+def solve_sir_model(initial_conditions, t, params, jacobian=True):
     """Solves the SIR model ODE using odeint.
 
     Parameters:
     - initial_conditions (list): List of initial conditions [S0, I0, R0].
     - t (numpy.ndarray): Time array.
     - params (dict): Dictionary containing model parameters.
+    - jacobian (bool): Give odeint the analytic Jacobian instead of finite differences.
 
     Returns:
     - numpy.ndarray: Solution of the ODE.
     """
-    solution = odeint(sir_model, initial_conditions, t, args=(params,))
+    solution = odeint(sir_model, initial_conditions, t, args=(params,), Dfun=sir_jacobian if jacobian else None)
     return solution
 
 def simulate_and_plot(t, parameters, initial_conditions):
@@ -75,11 +95,12 @@ def simulate_and_plot(t, parameters, initial_conditions):
     lables_on_y = {0: "Susceptible S(t)",
                    1: "Infectives I(t)",
                    2: "Recovered R(t)"}
+    if num_simulations > 0:
+        # The model is deterministic: every simulation is the same solve, done once and shared by S, I and R
+        solution = solve_sir_model([initial_conditions['S0'], initial_conditions['I0'], initial_conditions['R0']], t, parameters)
     for n in range(0, 3):
         if num_simulations > 0:
             for r in range(num_simulations):
-                np.random.seed(r)
-                solution = solve_sir_model([initial_conditions['S0'], initial_conditions['I0'], initial_conditions['R0']], t, parameters)
                 plt.plot(t, solution[:, n], linewidth=0.9, label=f'Simulation {r + 1}')
 
             plt.title(f'Adaptive step-size Runge-Kutta, {num_simulations} {plural}')
@@ -140,8 +161,6 @@ def modify_input():
         # Call the function to simulate and plot
         simulate_and_plot(t,parameters,initial_conditions)
 
-modify_input()
-
 def real_data():
     """Plots real data using Matplotlib."""
     data = {
@@ -167,4 +186,6 @@ def real_data():
     plt.tight_layout()
     plt.show()
 
-real_data()
+if __name__ == "__main__":
+    modify_input()
+    real_data()
@@ -42,23 +42,49 @@ def sir_model(t, y, params):
 
     return [dSdt, dIdt, dRdt]
 
-def solve_sir_model(t_span, initial_conditions, params):
+def sir_jacobian(t, y, params):
+    """Jacobian of the SIR model ODE system, used by the implicit solvers.
+
+    Parameters:
+    - t (float): Time.
+    - y (list): List of S, I, R values.
+    - params (dict): Dictionary containing model parameters.
+
+    Returns:
+    - numpy.ndarray: 3x3 matrix of the derivatives of [dS/dt, dI/dt, dR/dt] with respect to S, I, R.
+    """
+    S, I, R = y
+
+    beta = params['b0'] * (1 + params['b1'] * np.cos(2 * np.pi * t + params['phi']))
+
+    return np.array([[-params['mu'] - beta * I, -beta * S, params['gamma']],
+                     [beta * I, beta * S - params['ni'] - params['mu'], 0],
+                     [0, params['ni'], -params['mu'] - params['gamma']]])
+
+def solve_sir_model(t_span, initial_conditions, params, method='RK45', t_eval=None):
     """Solves the SIR model ODE using scipy's solve_ivp.
 
     Parameters:
     - t_span (list): List containing start and end times.
     - initial_conditions (list): List of initial conditions [S0, I0, R0].
     - params (dict): Dictionary containing model parameters.
+    - method (str): solve_ivp method; 'LSODA', 'BDF' or 'Radau' for long horizons.
+    - t_eval (numpy.ndarray): Times to store the solution at. If None, a dense output is built instead
+      so the solution can be evaluated anywhere with solution.sol.
 
     Returns:
-    - scipy.integrate.OdeResult: Solution of the ODE.
+    - scipy.integrate.OdeResult: Solution of the ODE, with the nfev, njev and nlu counters.
     """
+    # Implicit methods use the analytic Jacobian instead of finite differences
+    jac = {'jac': lambda t, y: sir_jacobian(t, y, params)} if method in ('LSODA', 'BDF', 'Radau') else {}
     solution = solve_ivp(
         fun=lambda t, y: sir_model(t, y, params),
         t_span=t_span,
         y0=initial_conditions,
-        method='RK45',  # You can choose other methods like 'RK23', 'DOP853', etc.
-        dense_output=True
+        method=method,
+        t_eval=t_eval,
+        dense_output=t_eval is None,
+        **jac
     )
     return solution
 
@@ -81,12 +107,12 @@ def simulate_and_plot(t, parameters, initial_conditions):
     lables_on_y = {0: "Susceptible S(t)",
                    1: "Infectives I(t)",
                    2: "Recovered R(t)"}
+    if num_simulations > 0:
+        # The model is deterministic: every simulation is the same solve, done once onto t and shared by S, I and R
+        simulated_solution = solve_sir_model([t[0], t[-1]], [initial_conditions['S0'], initial_conditions['I0'], initial_conditions['R0']], parameters, t_eval=t).y
     for n in range(0, 3):
         if num_simulations > 0:
             for r in range(num_simulations):
-                np.random.seed(r)
-                solution = solve_sir_model([t[0], t[-1]], [initial_conditions['S0'], initial_conditions['I0'], initial_conditions['R0']], parameters)
-                simulated_solution = solution.sol(t)
                 plt.plot(t, simulated_solution[n], linewidth=0.9, label=f'Simulation {r + 1}')
 
             plt.title(f'Runge-Kutta 45, {num_simulations} {plural}')
@@ -140,8 +166,6 @@ def modify_input():
 
         simulate_and_plot(t, parameters, initial_conditions)
 
-modify_input()
-
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -170,4 +194,6 @@ def real_data():
     plt.tight_layout()
     plt.show()
 
-real_data()
+if __name__ == "__main__":
+    modify_input()
+    real_data()
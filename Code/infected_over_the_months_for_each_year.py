@@ -26,4 +26,5 @@ def real_data():
     plt.tight_layout()
     plt.show()
 
-real_data()
+if __name__ == "__main__":
+    real_data()
@@ -0,0 +1,56 @@
+"""Simulation engines for the seasonal SIRS model of RSV transmission in Valencia.
+
+The scripts in ``Code/`` are the interactive front ends; this package holds the
+numerical code they share. Submodules are imported on first use, so importing
+the package does not load scipy, matplotlib, pandas or questionary.
+"""
+
+# Public name -> submodule defining it
+_API = {
+    'Euler_Maruyama_ensemble': 'rsv_sim.sde',
+    'run_ensemble': 'rsv_sim.parallel',
+    'stream_ensemble': 'rsv_sim.statistics',
+    'EnsembleStatistics': 'rsv_sim.statistics',
+    'solve_sir_sweep': 'rsv_sim.ode',
+    'calibrate': 'rsv_sim.calibration',
+    'monthly_series': 'rsv_sim.data',
+    'load_scenarios': 'rsv_sim.scenarios',
+    'run_scenario': 'rsv_sim.scenarios',
+    'save_scenario': 'rsv_sim.scenarios',
+    'run_ensemble_to_store': 'rsv_sim.parallel',
+    'open_store': 'rsv_sim.storage',
+    'ResultCache': 'rsv_sim.cache',
+    'cached_ensemble': 'rsv_sim.cache',
+    'read_window': 'rsv_sim.storage',
+    'simulate_ensemble': 'rsv_sim.integrators',
+    'convergence_study': 'rsv_sim.integrators',
+    'solve_sir': 'rsv_sim.solvers',
+    'solve_deterministic': 'rsv_sim.solvers',
+    'periodic_orbit': 'rsv_sim.periodic',
+    'seasonal_peak': 'rsv_sim.periodic',
+    'bifurcation_diagram': 'rsv_sim.continuation',
+    'gillespie_ensemble': 'rsv_sim.gillespie',
+    'coupling_matrix': 'rsv_sim.metapopulation',
+    'coupling_bandwidth': 'rsv_sim.metapopulation',
+    'solve_metapopulation': 'rsv_sim.metapopulation',
+    'metapopulation_ensemble': 'rsv_sim.metapopulation',
+    'age_structure': 'rsv_sim.age',
+    'solve_age_structured': 'rsv_sim.age',
+    'age_structured_ensemble': 'rsv_sim.age',
+    'ParticleFilter': 'rsv_sim.filtering',
+    'assimilate': 'rsv_sim.filtering',
+    'sensitivity_analysis': 'rsv_sim.sensitivity',
+    'Emulator': 'rsv_sim.emulator',
+    'Recorder': 'rsv_sim.instrumentation',
+    'run_windowed': 'rsv_sim.checkpoint',
+}
+
+__all__ = sorted(_API)
+
+def __getattr__(name):
+    if name not in _API:
+        raise AttributeError(f"module 'rsv_sim' has no attribute '{name}'")
+    import importlib
+    value = getattr(importlib.import_module(_API[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,7 @@
+import sys
+
+from rsv_sim.cli import main
+
+# Worker processes re-import the main module, so only the parent runs the command
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from rsv_sim.integrators import seasonality
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, increment_chunks, realization_streams, root_entropy
+from rsv_sim.sde import time_grid
+
+#############################################################################################################
+# Age-structured SIRS model
+# The population is split into K age classes of sizes n_k (fractions of the population). X_k = (S_k, I_k,
+# R_k) are fractions of the whole population, so they sum to n_k. Births (rate mu) enter S_0, everyone
+# dies at rate mu, and class k ages into class k + 1 at rate a_k = 1 / width_k, carrying its compartments.
+# Infection in class k is driven by
+#   lambda_k(t) = beta(t) sum_j C_kj I_j / n_j
+# where C_kj is the relative contact rate of an individual of class k with class j. Homogeneous mixing is
+# C_kj = n_j, and with a single class every equation reduces to the scripts' model. For an ensemble
+# the force of infection of every realization and class is one (M, K) x (K, K) matrix product.
+
+MODELS = ('transmission', 'birth')
+
+def age_structure(widths, mu, contacts=None, normalize=True):
+    """Ageing rates, stationary class sizes and contact matrix of K age classes.
+
+    Parameters:
+    - widths (list): Width of every class in years; the last one is open and its width is ignored.
+    - mu (float): Birth and death rate.
+    - contacts (numpy.ndarray): (K, K) contact matrix C, homogeneous mixing if None.
+    - normalize (bool): Scale C to spectral radius 1, so b0 keeps its meaning of the homogeneous model.
+
+    Returns:
+    - dict: 'ageing' (K,) rates, 'sizes' (K,) stationary fractions n_k and 'contacts' (K, K).
+    """
+    widths = np.asarray(widths, dtype=float)
+    K = widths.size
+    ageing = np.append(1 / widths[:-1], 0.0)
+    sizes = np.empty(K)
+    inflow = mu
+    for k in range(K):
+        sizes[k] = inflow / (ageing[k] + mu)
+        inflow = ageing[k] * sizes[k]
+    contacts = np.tile(sizes, (K, 1)) if contacts is None else np.asarray(contacts, dtype=float)
+    if normalize:
+        contacts = contacts / np.max(np.abs(np.linalg.eigvals(contacts)))
+    return {'ageing': ageing, 'sizes': sizes, 'contacts': contacts}
+
+def initial_state(structure, S_in, I_in, R_in):
+    """Spread initial fractions S_in, I_in, R_in (scalars or (K,) arrays) over the classes.
+
+    Returns:
+    - numpy.ndarray: (K, 3) initial state.
+    """
+    return np.stack([S_in * structure['sizes'], I_in * structure['sizes'], R_in * structure['sizes']], axis=-1)
+
+def force_of_infection(t, I, structure, b0, b1, phi):
+    """lambda_k(t) for every class.
+
+    Parameters:
+    - I (numpy.ndarray): (K,) or (M, K) infectives.
+    - b0: Scalar, or (M, 1) array of perturbed values.
+
+    Returns:
+    - numpy.ndarray: Array with the shape of I.
+    """
+    return b0 * seasonality(t, b1, phi) * ((I / structure['sizes']) @ structure['contacts'].T)
+
+def _ageing(X, ageing):
+    """Net ageing flow into every class of (..., K, 3) states."""
+    out = ageing[:, None] * X
+    flow = -out
+    flow[..., 1:, :] += out[..., :-1, :]
+    return flow
+
+def age_structured_rhs(t, X, structure, mu, b0, b1, phi, gamma, ni):
+    """Right-hand side of the deterministic age-structured model.
+
+    Parameters:
+    - t (float): Time.
+    - X (numpy.ndarray): (K, 3) or (M, K, 3) array of S, I, R per class.
+    - structure (dict): Result of age_structure.
+    - mu, b0, b1, phi, gamma, ni: Model parameters; gamma and ni may be (K,) arrays.
+
+    Returns:
+    - numpy.ndarray: Derivatives with the shape of X.
+    """
+    S, I, R = X[..., 0], X[..., 1], X[..., 2]
+    infections = force_of_infection(t, I, structure, b0, b1, phi) * S
+    dX = _ageing(X, structure['ageing'])
+    dX[..., 0] += -mu * S - infections + gamma * R
+    dX[..., 0, 0] += mu
+    dX[..., 1] += infections - ni * I - mu * I
+    dX[..., 2] += ni * I - mu * R - gamma * R
+    return dX
+
+def solve_age_structured(t, structure, X0, mu, b0, b1, phi, gamma, ni, method='RK45', rtol=1e-6, atol=1e-9,
+                         **options):
+    """Solve the deterministic age-structured model.
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - structure (dict): Result of age_structure.
+    - X0 (numpy.ndarray): (K, 3) initial state, see initial_state.
+    - mu, b0, b1, phi, gamma, ni: Model parameters.
+    - method (str): Method of solve_ivp.
+    - rtol, atol (float): Tolerances of the solver.
+    - options: Passed to solve_ivp.
+
+    Returns:
+    - numpy.ndarray: (len(t), K, 3) array of S, I, R per class.
+    """
+    t = np.asarray(t, dtype=float)
+    K = X0.shape[0]
+
+    def fun(t, y):
+        return age_structured_rhs(t, y.reshape(K, 3), structure, mu, b0, b1, phi, gamma, ni).ravel()
+
+    solution = solve_ivp(fun, (t[0], t[-1]), np.ravel(X0), method=method, t_eval=t, rtol=rtol, atol=atol, **options)
+    if not solution.success:
+        raise RuntimeError(solution.message)
+    return solution.y.T.reshape(t.size, K, 3)
+
+def noise_dimensions(model, K):
+    """Brownian increments per realization and step: b0 (and mu) once, then one per class and compartment.
+
+    With K = 1 they come in the order of rsv_sim.sde.NOISE_DIMENSIONS.
+    """
+    return 1 + 2 * K if model == 'transmission' else 2 + 3 * K
+
+def age_transmission_step(t, dt, X, dW, structure, mu, b0, b1, phi, gamma, ni, alpha):
+    """Advance every realization by one Euler-Maruyama step with transmission rate perturbation.
+
+    Parameters:
+    - t (float): Time at the beginning of the step.
+    - dt (float): Time step.
+    - X (numpy.ndarray): (M, K, 3) array of S, I, R values.
+    - dW (numpy.ndarray): (M, 1 + 2K) array of increments: b0, then S and I of every class.
+    - structure (dict): Result of age_structure.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+
+    Returns:
+    - numpy.ndarray: (M, K, 3) array at t + dt.
+    """
+    K = X.shape[1]
+    S, I, R = X[..., 0], X[..., 1], X[..., 2]
+    b0_tilde = b0 + alpha * dW[:, :1]
+    infections = force_of_infection(t, I, structure, b0_tilde, b1, phi) * S
+    noise = (alpha / b0_tilde) * infections
+
+    X_new = X + _ageing(X, structure['ageing']) * dt
+    X_new[..., 0] += (-mu * S - infections + gamma * R) * dt - noise * dW[:, 1:K + 1]
+    X_new[:, 0, 0] += mu * dt
+    X_new[..., 1] += (infections - ni * I - mu * I) * dt - noise * dW[:, K + 1:]
+    X_new[..., 2] += (ni * I - mu * R - gamma * R) * dt
+    return X_new
+
+def age_birth_step(t, dt, X, dW, structure, mu, b0, b1, phi, gamma, ni, alpha):
+    """Advance every realization by one Euler-Maruyama step with birth rate perturbation.
+
+    Parameters:
+    - t (float): Time at the beginning of the step.
+    - dt (float): Time step.
+    - X (numpy.ndarray): (M, K, 3) array of S, I, R values.
+    - dW (numpy.ndarray): (M, 2 + 3K) array of increments: b0, mu, then S, I and R of every class.
+    - structure (dict): Result of age_structure.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+
+    Returns:
+    - numpy.ndarray: (M, K, 3) array at t + dt.
+    """
+    K = X.shape[1]
+    S, I, R = X[..., 0], X[..., 1], X[..., 2]
+    b0_tilde = b0 + alpha * dW[:, :1]
+    mu_tilde = mu + alpha * dW[:, 1]
+    infections = force_of_infection(t, I, structure, b0_tilde, b1, phi) * S
+    dW_S, dW_I, dW_R = dW[:, 2:K + 2], dW[:, K + 2:2 * K + 2], dW[:, 2 * K + 2:]
+
+    X_new = X + _ageing(X, structure['ageing']) * dt
+    X_new[..., 0] += (-mu * S - infections + gamma * R) * dt + alpha * (structure['sizes'] - S) * dW_S
+    X_new[:, 0, 0] += mu_tilde * dt
+    X_new[..., 1] += (infections - ni * I - mu * I) * dt - alpha * I * dW_I
+    X_new[..., 2] += (ni * I - mu * R - gamma * R) * dt - alpha * R * dW_R
+    return X_new
+
+STEPS = {
+    'transmission': age_transmission_step,
+    'birth': age_birth_step,
+}
+
+def age_structured_ensemble(M, t_in, t_end, N, structure, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                            model='transmission', seed=None, first_realization=0, record_every=1,
+                            chunk_size=DEFAULT_CHUNK_SIZE):
+    """Simulate M realizations of the age-structured model using the Euler-Maruyama method.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - t_in (int): Initial time.
+    - t_end (int): End time.
+    - N (int): Number of steps.
+    - structure (dict): Result of age_structure.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters; gamma and ni may be (K,) arrays.
+    - S_in, I_in, R_in: Initial fractions within every class, scalars or (K,) arrays.
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble, realization r uses the r-th spawned stream.
+    - first_realization (int): Index of the first realization, to simulate a slice of a larger ensemble.
+    - record_every (int): Keep the state every record_every steps; N must be a multiple of it.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+
+    Returns:
+    - numpy.ndarray: Recorded times.
+    - numpy.ndarray: (M, N // record_every + 1, K, 3) array of S, I, R per class.
+    """
+    if model not in STEPS:
+        raise ValueError(f"Unknown model '{model}', expected one of {MODELS}")
+    if N % record_every:
+        raise ValueError(f"N = {N} is not a multiple of record_every = {record_every}")
+    step = STEPS[model]
+    K = structure['sizes'].size
+
+    dt, TS = time_grid(t_in, t_end, N)
+    streams = realization_streams(root_entropy(seed), range(first_realization, first_realization + M))
+
+    results = np.empty((M, N // record_every + 1, K, 3))
+    X = np.tile(initial_state(structure, S_in, I_in, R_in), (M, 1, 1))
+    results[:, 0] = X
+
+    i = 0
+    for increments in increment_chunks(streams, N, noise_dimensions(model, K), dt, chunk_size):
+        for dW in increments:
+            X = step(TS[i], dt, X, dW, structure, mu, b0, b1, phi, gamma, ni, alpha)
+            i += 1
+            if i % record_every == 0:
+                results[:, i // record_every] = X
+    return TS[::record_every], results
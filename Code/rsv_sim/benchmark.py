@@ -0,0 +1,226 @@
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+#############################################################################################################
+# Benchmarks
+# Every solver path is timed around a base case, varying one of N (steps or output points), ensemble
+# size M and horizon t_end at a time. Results are stored as JSON and compared against a baseline.
+
+PATHS = ('odeint', 'solve_ivp', 'em-transmission', 'em-birth')
+
+PROFILES = {
+    'quick': {'base': {'N': 5000, 'M': 50, 't_end': 5},
+              'N': [1000, 100000], 'M': [10, 500], 't_end': [1, 20]},
+    'full': {'base': {'N': 5000, 'M': 100, 't_end': 5},
+             'N': [1000, 10000, 100000, 1000000], 'M': [10, 100, 1000], 't_end': [1, 5, 20]},
+}
+
+PARAMETERS = {'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36}
+INITIAL_CONDITIONS = [0.9988, 0.0012, 0.0]
+ALPHA = {'transmission': 0.728, 'birth': 0.009}
+
+# A case is a regression when it is this much slower, or its peak RSS this much higher, than in the baseline
+DEFAULT_THRESHOLD = 0.2
+
+def run_path(path, N, M, t_end):
+    """Run one solver path once.
+
+    Parameters:
+    - path (str): One of PATHS.
+    - N (int): Steps (SDE) or output points (ODE).
+    - M (int): Realizations, ignored by the ODE paths.
+    - t_end (float): Horizon in years.
+
+    Returns:
+    - int: Number of right-hand side (drift) evaluations.
+    """
+    p = PARAMETERS
+    args = (p['b0'], p['b1'], p['phi'], p['mu'], p['gamma'], p['ni'])
+    if path == 'odeint':
+        from scipy.integrate import odeint
+        from rsv_sim.kernels import sir_rhs
+        t = np.linspace(0, t_end, N)
+        _, info = odeint(lambda y, t: sir_rhs(t, y, *args), INITIAL_CONDITIONS, t, full_output=True)
+        return int(info['nfe'][-1])
+    if path == 'solve_ivp':
+        from scipy.integrate import solve_ivp
+        from rsv_sim.kernels import sir_rhs
+        t = np.linspace(0, t_end, N)
+        solution = solve_ivp(lambda t, y: sir_rhs(t, y, *args), (0, t_end), INITIAL_CONDITIONS,
+                             method='RK45', t_eval=t)
+        return int(solution.nfev)
+    if path in ('em-transmission', 'em-birth'):
+        from rsv_sim.sde import Euler_Maruyama_ensemble
+        model = path.split('-', 1)[1]
+        Euler_Maruyama_ensemble(M, 0, t_end, N, p['mu'], p['b0'], p['b1'], p['phi'], p['gamma'], p['ni'],
+                                ALPHA[model], *INITIAL_CONDITIONS, model=model, seed=0)
+        return N * M
+    raise ValueError(f"Unknown path '{path}', expected one of {PATHS}")
+
+def cases(profile='quick', paths=PATHS):
+    """List the benchmark cases of a profile.
+
+    Returns:
+    - list: (case id, path, N, M, t_end) tuples.
+    """
+    settings = PROFILES[profile]
+    base = settings['base']
+    listed = []
+    for path in paths:
+        deterministic = path in ('odeint', 'solve_ivp')
+        points = [dict(base)]
+        for dimension in ('N', 'M', 't_end'):
+            if dimension == 'M' and deterministic:
+                continue
+            points += [{**base, dimension: value} for value in settings[dimension] if value != base[dimension]]
+        for point in points:
+            M = 1 if deterministic else point['M']
+            case_id = f"{path}[N={point['N']},M={M},t_end={point['t_end']}]"
+            listed.append((case_id, path, point['N'], M, point['t_end']))
+    return listed
+
+def _max_rss():
+    """Peak resident memory of this process in bytes."""
+    # Linux keeps ru_maxrss across fork and exec, so a child would report its parent's peak;
+    # VmHWM belongs to the address space, which exec replaces
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def _case_rss(path, N, M, t_end):
+    """Peak RSS of a fresh process before and after running a case (runs in a child process)."""
+    run_path(path, min(N, 100), min(M, 2), t_end)
+    before = _max_rss()
+    run_path(path, N, M, t_end)
+    return before, _max_rss()
+
+def measure(path, N, M, t_end, repeats=3):
+    """Time a case (best of repeats) and measure its peak allocations and resident memory.
+
+    ru_maxrss is the high-water mark of a whole process, so the resident memory of each case is
+    measured in a fresh process of its own: max_rss_bytes is the peak of a process that only
+    imported the solvers, warmed them up and ran the case once, and rss_increase_bytes is the rise
+    of that peak due to the case itself.
+
+    Returns:
+    - dict: seconds, repeats, peak_alloc_bytes, max_rss_bytes, rss_increase_bytes, rhs_evaluations.
+    """
+    run_path(path, min(N, 100), min(M, 2), t_end)   # warm up imports and compiled kernels
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        evaluations = run_path(path, N, M, t_end)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run_path(path, N, M, t_end)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Spawned rather than forked, so the child does not share the pages and peak of this process
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        before, max_rss = pool.submit(_case_rss, path, N, M, t_end).result()
+    return {'seconds': min(times), 'repeats': repeats, 'peak_alloc_bytes': peak,
+            'max_rss_bytes': max_rss, 'rss_increase_bytes': max_rss - before, 'rhs_evaluations': evaluations}
+
+def run_benchmarks(profile='quick', paths=PATHS, repeats=None, verbose=True):
+    """Run every case of a profile.
+
+    Parameters:
+    - profile (str): 'quick' (under a minute) or 'full'.
+    - paths (tuple): Solver paths to benchmark.
+    - repeats (int): Timed runs per case, 3 for quick and 1 for full if None.
+    - verbose (bool): Print each case as it finishes.
+
+    Returns:
+    - dict: Environment and results by case id.
+    """
+    import scipy
+    from rsv_sim.kernels import BACKEND
+
+    if repeats is None:
+        repeats = 3 if profile == 'quick' else 1
+    report = {
+        'profile': profile,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'backend': BACKEND,
+        'machine': platform.machine(),
+        'results': {},
+    }
+    for case_id, path, N, M, t_end in cases(profile, paths):
+        result = measure(path, N, M, t_end, repeats)
+        report['results'][case_id] = {'path': path, 'N': N, 'M': M, 't_end': t_end, **result}
+        if verbose:
+            print(f"{case_id:<45} {result['seconds']:10.4f} s {result['peak_alloc_bytes'] / 2**20:9.1f} MiB "
+                  f"{result['max_rss_bytes'] / 2**20:9.1f} MiB RSS {result['rhs_evaluations']:>12} rhs", flush=True)
+    return report
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Find the cases slower, or with a higher peak RSS, than in the baseline.
+
+    Peak RSS is only compared against baselines that measured it per case (rss_increase_bytes).
+
+    Parameters:
+    - report (dict): Output of run_benchmarks.
+    - baseline (dict): Earlier output of run_benchmarks.
+    - threshold (float): Relative increase flagged as a regression.
+
+    Returns:
+    - list: Dictionaries with case id, metric ('seconds' or 'max_rss_bytes'), baseline and current
+      values and ratio, worst first.
+    """
+    regressions = []
+    for case_id, result in report['results'].items():
+        previous = baseline['results'].get(case_id)
+        if previous is None:
+            continue
+        metrics = ('seconds', 'max_rss_bytes') if 'rss_increase_bytes' in previous else ('seconds',)
+        for metric in metrics:
+            if previous[metric] <= 0:
+                continue
+            ratio = result[metric] / previous[metric]
+            if ratio > 1 + threshold:
+                regressions.append({'case': case_id, 'metric': metric, 'baseline': previous[metric],
+                                    'current': result[metric], 'ratio': ratio})
+    return sorted(regressions, key=lambda r: r['ratio'], reverse=True)
+
+def main_bench(args):
+    """rsv-sim bench: run a profile, save it and check it against a baseline.
+
+    Returns:
+    - int: Exit status, 1 if a regression was found.
+    """
+    report = run_benchmarks('quick' if args.quick else 'full', paths=tuple(args.paths), repeats=args.repeats)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(report, baseline, args.threshold)
+    for regression in regressions:
+        if regression['metric'] == 'seconds':
+            change = f"{regression['baseline']:.4f} s -> {regression['current']:.4f} s"
+        else:
+            change = f"peak RSS {regression['baseline'] / 2**20:.1f} MiB -> {regression['current'] / 2**20:.1f} MiB"
+        print(f"REGRESSION {regression['case']}: {change} (x{regression['ratio']:.2f})")
+    if not regressions:
+        print(f"No regression above {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
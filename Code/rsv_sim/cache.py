@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+#############################################################################################################
+# Result cache
+# Seeded and deterministic runs are pure functions of their inputs, so their results are stored
+# on disk under a hash of model, parameters, time grid, solver and seeds. Least recently used
+# entries are evicted when the cache grows past its size bound.
+
+# Bump when a change to the solvers alters their results, to invalidate old entries.
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIRECTORY = Path(os.environ.get('RSV_SIM_CACHE', Path.home() / '.cache' / 'rsv_sim'))
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+def _canonical(value):
+    """Turn a key part into JSON-serializable data with a single representation per value."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return {'dtype': array.dtype.str, 'shape': list(array.shape),
+                'sha256': hashlib.sha256(array.tobytes()).hexdigest()}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # 36 and 36.0 give the same results, so they share a key; seeds too large for a float stay int
+        return float(value) if float(value) == value else value
+    return value
+
+def cache_key(**parts):
+    """Hash the inputs of a run.
+
+    Parameters:
+    - parts: Model, parameters, time grid (numbers or the np.linspace array), solver, seeds...
+
+    Returns:
+    - str: Hexadecimal SHA-256 key.
+    """
+    text = json.dumps(_canonical({'version': CACHE_VERSION, **parts}), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    """On-disk cache of result arrays with size-bounded LRU eviction.
+
+    Entries are .npy files named by their key; the modification time records the last use.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        """Parameters:
+        - directory (str): Cache directory, $RSV_SIM_CACHE or ~/.cache/rsv_sim by default.
+        - max_bytes (int): Size above which the least recently used entries are evicted.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return self.directory / key[:2] / f'{key}.npy'
+
+    def get(self, key):
+        """Look up an entry.
+
+        Returns:
+        - numpy.ndarray: Cached array, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """Store an entry, then evict old entries if the cache is over its size bound."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial file
+        handle, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                np.save(file, array)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached array for key, computing and storing it on a miss.
+
+        Parameters:
+        - key (str): Key from cache_key.
+        - compute (function): Called without arguments on a miss, returns the array.
+
+        Returns:
+        - numpy.ndarray: Result.
+        """
+        array = self.get(key)
+        if array is None:
+            array = compute()
+            self.put(key, array)
+        return array
+
+    def _entries(self):
+        entries = []
+        for path in self.directory.glob('*/*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Delete every entry."""
+        for _, _, path in self._entries():
+            path.unlink(missing_ok=True)
+
+    def stats(self):
+        """Hit/miss counters of this instance and the current size of the cache.
+
+        Returns:
+        - dict: hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
+
+def cached_ensemble(M, parameters, model='transmission', seed=0, cache=None, scheme='euler_maruyama', **options):
+    """SDE ensemble through the result cache.
+
+    The key covers scheme, model, parameters, time grid, seed and realization range; workers, block and
+    chunk sizes do not change the trajectories and are left out. Unseeded runs are not cached.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - parameters (dict): Parameters of Euler_Maruyama_ensemble (t_in, t_end, N, mu, ..., R_in).
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble.
+    - cache (ResultCache): Cache to use, the default one if None.
+    - scheme (str): Integration scheme, see rsv_sim.integrators.SCHEMES.
+    - options: Passed to run_ensemble (workers, block_size, chunk_size, verbose).
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) array of simulated S, I, R populations.
+    """
+    from rsv_sim.parallel import run_ensemble
+    from rsv_sim.sde import time_grid
+
+    if seed is None:
+        TS, results, _ = run_ensemble(M, parameters, model=model, seed=None, scheme=scheme, **options)
+        return TS, results
+    cache = ResultCache() if cache is None else cache
+    key = cache_key(kind=scheme, model=model, parameters=parameters, seed=seed, realizations=[0, M])
+    results = cache.get_or_compute(key, lambda: run_ensemble(M, parameters, model=model, seed=seed, scheme=scheme,
+                                                             **options)[1])
+    _, TS = time_grid(parameters['t_in'], parameters['t_end'], parameters['N'])
+    return TS, results
@@ -0,0 +1,202 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+
+import numpy as np
+from scipy.optimize import differential_evolution
+
+from rsv_sim.data import monthly_series
+
+#############################################################################################################
+# Calibration against the monthly case series
+# Model incidence per month is the integral of beta(t) S I over the month, computed for a whole
+# population of candidate parameter sets at once. Cases are incidence times a reporting scale,
+# which is profiled out in closed form, so the optimizer only searches the epidemic parameters.
+
+# Parameters of the article, used for everything that is not fitted
+DEFAULT_PARAMETERS = {'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'mu': 0.009, 'gamma': 1.8, 'ni': 36}
+DEFAULT_INITIAL_CONDITIONS = {'S0': 0.9988, 'I0': 0.0012, 'R0': 0.0}
+
+DEFAULT_BOUNDS = {
+    'b0': (10.0, 80.0),
+    'b1': (0.0, 1.0),
+    'phi': (0.0, 2 * np.pi),
+    'gamma': (0.1, 10.0),
+    'ni': (10.0, 100.0),
+}
+
+LIKELIHOODS = ('poisson', 'least_squares')
+
+@lru_cache(maxsize=8)
+def seasonal_tables(months, burn_in_years, steps_per_month):
+    """Precompute cos(2 pi t) and sin(2 pi t) at every RK4 stage of the monthly grid.
+
+    beta(t) = b0 (1 + b1 cos(2 pi t + phi)) is then b0 (1 + b1 (cos(2 pi t) cos(phi) - sin(2 pi t) sin(phi))),
+    so the tables are shared by every candidate and, being cached, by every evaluation of a fit.
+
+    Returns:
+    - float: Time step.
+    - numpy.ndarray: (steps, 3) cosines at t, t + h/2 and t + h.
+    - numpy.ndarray: (steps, 3) sines at the same times.
+    """
+    steps = (12 * burn_in_years + months) * steps_per_month
+    h = 1 / (12 * steps_per_month)
+    t = np.arange(steps)[:, None] * h + np.array([0, h / 2, h])
+    cos_table, sin_table = np.cos(2 * np.pi * t), np.sin(2 * np.pi * t)
+    cos_table.flags.writeable = False
+    sin_table.flags.writeable = False
+    return h, cos_table, sin_table
+
+def monthly_incidence(params, initial_conditions, months, burn_in_years=2, steps_per_month=40, tables=None):
+    """New infections per month for P parameter sets, after a burn-in transient.
+
+    Parameters:
+    - params (dict): (P,) arrays of b0, b1, phi, mu, gamma, ni.
+    - initial_conditions (dict): S0, I0, R0 at t = 0.
+    - months (int): Number of months after the burn-in, starting in January.
+    - burn_in_years (int): Years integrated before the first month.
+    - steps_per_month (int): RK4 steps per month.
+    - tables: Output of seasonal_tables for the same grid, computed if None.
+
+    Returns:
+    - numpy.ndarray: (P, months) incidence as a fraction of the population.
+    """
+    if tables is None:
+        tables = seasonal_tables(months, burn_in_years, steps_per_month)
+    h, cos_table, sin_table = tables
+    b0, b1, phi, mu, gamma, ni = (np.asarray(params[name], dtype=float)
+                                  for name in ('b0', 'b1', 'phi', 'mu', 'gamma', 'ni'))
+    b0_cos, b0_sin = b0 * b1 * np.cos(phi), b0 * b1 * np.sin(phi)
+
+    def rhs(stage_cos, stage_sin, S, I, R):
+        beta = b0 + b0_cos * stage_cos - b0_sin * stage_sin
+        infections = beta * S * I
+        return (mu - mu * S - infections + gamma * R,
+                infections - ni * I - mu * I,
+                ni * I - mu * R - gamma * R,
+                infections)
+
+    P = np.broadcast(b0, b1, phi, mu, gamma, ni).shape
+    S = np.full(P, float(initial_conditions['S0']))
+    I = np.full(P, float(initial_conditions['I0']))
+    R = np.full(P, float(initial_conditions['R0']))
+    incidence = np.zeros(P + (months,))
+    first = 12 * burn_in_years * steps_per_month
+    for step in range(cos_table.shape[0]):
+        c, s = cos_table[step], sin_table[step]
+        k1 = rhs(c[0], s[0], S, I, R)
+        k2 = rhs(c[1], s[1], S + h / 2 * k1[0], I + h / 2 * k1[1], R + h / 2 * k1[2])
+        k3 = rhs(c[1], s[1], S + h / 2 * k2[0], I + h / 2 * k2[1], R + h / 2 * k2[2])
+        k4 = rhs(c[2], s[2], S + h * k3[0], I + h * k3[1], R + h * k3[2])
+        S = S + h / 6 * (k1[0] + 2 * k2[0] + 2 * k3[0] + k4[0])
+        I = I + h / 6 * (k1[1] + 2 * k2[1] + 2 * k3[1] + k4[1])
+        R = R + h / 6 * (k1[2] + 2 * k2[2] + 2 * k3[2] + k4[2])
+        if step >= first:
+            incidence[..., (step - first) // steps_per_month] += h / 6 * (k1[3] + 2 * k2[3] + 2 * k3[3] + k4[3])
+    return incidence
+
+def profile_scale(incidence, observed, likelihood='poisson'):
+    """Best reporting scale (cases per unit of incidence) and objective for each parameter set.
+
+    Parameters:
+    - incidence (numpy.ndarray): (P, months) model incidence.
+    - observed (numpy.ndarray): (months,) observed cases.
+    - likelihood (str): 'poisson' (negative log-likelihood) or 'least_squares' (sum of squares).
+
+    Returns:
+    - numpy.ndarray: (P,) scales.
+    - numpy.ndarray: (P,) objective values, inf for unusable trajectories.
+    """
+    with np.errstate(all='ignore'):
+        if likelihood == 'poisson':
+            scale = observed.sum() / incidence.sum(axis=-1)
+            expected = scale[..., None] * incidence
+            value = (expected - observed * np.log(expected)).sum(axis=-1)
+        elif likelihood == 'least_squares':
+            scale = (incidence * observed).sum(axis=-1) / (incidence ** 2).sum(axis=-1)
+            value = ((observed - scale[..., None] * incidence) ** 2).sum(axis=-1)
+        else:
+            raise ValueError(f"Unknown likelihood '{likelihood}', expected one of {LIKELIHOODS}")
+    bad = ~np.isfinite(value) | (incidence <= 0).any(axis=-1)
+    return scale, np.where(bad, np.inf, value)
+
+def _objective(x, names, fixed, initial_conditions, observed, likelihood, burn_in_years, steps_per_month):
+    """Objective of differential_evolution, for one candidate x (n,) or a population (n, P)."""
+    params = dict(fixed)
+    params.update(zip(names, np.asarray(x)))
+    tables = seasonal_tables(observed.size, burn_in_years, steps_per_month)
+    incidence = monthly_incidence(params, initial_conditions, observed.size, burn_in_years, steps_per_month, tables)
+    return profile_scale(incidence, observed, likelihood)[1]
+
+class _BatchedObjective:
+    """Vectorized objective splitting each population into one batch per worker process."""
+
+    def __init__(self, pool, workers, args):
+        self.pool = pool
+        self.workers = workers
+        self.args = args
+
+    def __call__(self, x):
+        x = np.asarray(x)
+        if x.ndim == 1:
+            return _objective(x, *self.args)
+        batches = [batch for batch in np.array_split(x, self.workers, axis=1) if batch.shape[1]]
+        values = self.pool.map(_objective, batches, *(repeat(arg, len(batches)) for arg in self.args))
+        return np.concatenate(list(values))
+
+def calibrate(names=('b0', 'b1', 'phi', 'gamma', 'ni'), bounds=None, fixed=None, initial_conditions=None,
+              observed=None, likelihood='poisson', burn_in_years=2, steps_per_month=40, workers=1,
+              seed=0, **options):
+    """Fit model parameters to the monthly case series with differential evolution.
+
+    Each generation is evaluated as batched integrations of the whole population (vectorized=True):
+    one batch with workers=1, otherwise one batch per process. The fit does not depend on workers.
+
+    Parameters:
+    - names (tuple): Parameters to fit.
+    - bounds (dict): Search interval of each fitted parameter, DEFAULT_BOUNDS if None.
+    - fixed (dict): Values of the other parameters, DEFAULT_PARAMETERS if None.
+    - initial_conditions (dict): S0, I0, R0, DEFAULT_INITIAL_CONDITIONS if None.
+    - observed (numpy.ndarray): Monthly cases starting in January, the 2001-2004 series if None.
+    - likelihood (str): 'poisson' or 'least_squares'.
+    - burn_in_years (int): Years integrated before the first observed month.
+    - steps_per_month (int): RK4 steps per month.
+    - workers (int): Processes evaluating each generation, -1 for all the cores.
+    - seed (int): Seed of the optimizer.
+    - options: Passed to scipy.optimize.differential_evolution (maxiter, popsize, tol, polish...).
+
+    Returns:
+    - dict: 'parameters' (fitted and fixed), 'scale', 'objective', 'fitted' and 'observed' monthly
+      cases, and the scipy 'result'.
+    """
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    fixed = {k: v for k, v in {**DEFAULT_PARAMETERS, **(fixed or {})}.items() if k not in names}
+    initial_conditions = initial_conditions or DEFAULT_INITIAL_CONDITIONS
+    observed = monthly_series() if observed is None else np.asarray(observed, dtype=float)
+    if likelihood not in LIKELIHOODS:
+        raise ValueError(f"Unknown likelihood '{likelihood}', expected one of {LIKELIHOODS}")
+
+    args = (tuple(names), fixed, initial_conditions, observed, likelihood, burn_in_years, steps_per_month)
+    options.update(vectorized=True, updating='deferred')
+    if workers == -1:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        result = differential_evolution(_objective, [bounds[name] for name in names], args=args, seed=seed, **options)
+    else:
+        # One RK4 loop per batch rather than per candidate, so parallel runs keep the vectorized cost
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            result = differential_evolution(_BatchedObjective(pool, workers, args), [bounds[name] for name in names],
+                                            seed=seed, **options)
+
+    parameters = {**fixed, **dict(zip(names, result.x))}
+    incidence = monthly_incidence(parameters, initial_conditions, observed.size, burn_in_years, steps_per_month)
+    scale, value = profile_scale(incidence, observed, likelihood)
+    return {
+        'parameters': {k: float(v) for k, v in parameters.items()},
+        'scale': float(scale),
+        'objective': float(value),
+        'fitted': scale * incidence,
+        'observed': observed,
+        'result': result,
+    }
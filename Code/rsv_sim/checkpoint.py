@@ -0,0 +1,155 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, realization_streams, root_entropy
+from rsv_sim.sde import STEPS, advance_window, time_grid
+from rsv_sim.storage import _json_default, create_store, open_store
+
+#############################################################################################################
+# Time-window execution with checkpoint/restart
+# A long ensemble is advanced `window` steps at a time. Each window is simulated into a buffer of
+# (M, window, 3), written into the memory-mapped store (see rsv_sim.storage) and flushed, so the memory
+# held for trajectories is bounded by the window; only the time grid grows with the horizon. Every
+# checkpoint_every windows the state of every realization and the bit-generator state of its stream
+# are checkpointed. The data of a window is flushed before the checkpoint that follows it, and the
+# checkpoint is replaced atomically. A killed job restarts from its last checkpoint and rewrites the
+# windows after it with the same values, so a resumed run is identical to an uninterrupted one, and to
+# Euler_Maruyama_ensemble with the same seed.
+
+FORMAT = 'rsv_sim-checkpoint-1'
+CHECKPOINT_DIRECTORY = 'checkpoint'
+
+# Steps per window by default, 2.4 MB of state per 100 realizations
+DEFAULT_WINDOW = 1000
+
+def save_checkpoint(directory, step, X, streams, settings):
+    """Write the state of a windowed run after `step` steps.
+
+    Parameters:
+    - directory (str): Store directory of the run.
+    - step (int): Number of steps taken.
+    - X (numpy.ndarray): (M, 3) state after step steps.
+    - streams (list): Generators of the realizations.
+    - settings (dict): Run settings, checked when resuming.
+    """
+    directory = Path(directory) / CHECKPOINT_DIRECTORY
+    directory.mkdir(parents=True, exist_ok=True)
+    # The state file is named after the step, so the previous checkpoint stays valid until replaced
+    np.save(directory / f'state_{step}.npy', X)
+    checkpoint = {'format': FORMAT, 'step': step, 'state': f'state_{step}.npy', 'settings': settings,
+                  'streams': [rng.bit_generator.state for rng in streams]}
+    tmp = directory / 'checkpoint.json.tmp'
+    tmp.write_text(json.dumps(checkpoint, default=_json_default))
+    os.replace(tmp, directory / 'checkpoint.json')
+    for path in directory.glob('state_*.npy'):
+        if path.name != checkpoint['state']:
+            path.unlink()
+
+def load_checkpoint(directory):
+    """Read the last checkpoint of a windowed run.
+
+    Returns:
+    - dict: 'step', 'state' ((M, 3) array), 'streams' (restored generators) and 'settings', or
+      None if the run has no checkpoint.
+    """
+    directory = Path(directory) / CHECKPOINT_DIRECTORY
+    if not (directory / 'checkpoint.json').exists():
+        return None
+    checkpoint = json.loads((directory / 'checkpoint.json').read_text())
+    if checkpoint.get('format') != FORMAT:
+        raise ValueError(f"{directory} is not a windowed run checkpoint ({checkpoint.get('format')})")
+    streams = []
+    for state in checkpoint['streams']:
+        rng = np.random.Generator(np.random.PCG64())
+        rng.bit_generator.state = state
+        streams.append(rng)
+    return {'step': checkpoint['step'], 'state': np.load(directory / checkpoint['state']), 'streams': streams,
+            'settings': checkpoint['settings']}
+
+def run_windowed(M, parameters, directory, model='transmission', seed=None, window=DEFAULT_WINDOW,
+                 checkpoint_every=1, record_every=1, chunk_size=DEFAULT_CHUNK_SIZE, backend=None, metadata=None,
+                 verbose=False):
+    """Simulate an Euler-Maruyama ensemble window by window into a store, resuming from a checkpoint.
+
+    If directory holds a checkpoint of the same run, the simulation continues from it; a run that
+    completed returns at once. The trajectories are those of Euler_Maruyama_ensemble(M, **parameters,
+    model=model, seed=seed), kept every record_every steps.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - parameters (dict): Parameters of Euler_Maruyama_ensemble (t_in, t_end, N, mu, ..., R_in).
+    - directory (str): Store directory.
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble; a resumed run uses the seed of its checkpoint.
+    - window (int): Steps simulated between two writes; a multiple of record_every.
+    - checkpoint_every (int): Windows between two checkpoints.
+    - record_every (int): Keep the state every record_every steps; N must be a multiple of it.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - backend (str): 'numba' or 'numpy' kernels, the fastest available if None.
+    - metadata (dict): Extra entries of the metadata.json sidecar.
+    - verbose (bool): Print the progress of every window.
+
+    Returns:
+    - dict: Read-only store (see rsv_sim.storage.open_store).
+    - dict: 'resumed_from' step, 'windows' simulated by this call and elapsed 'seconds'.
+    """
+    if model not in STEPS:
+        raise ValueError(f"Unknown model '{model}', expected one of {sorted(STEPS)}")
+    N = parameters['N']
+    if N % record_every or window % record_every:
+        raise ValueError(f"N = {N} and window = {window} must be multiples of record_every = {record_every}")
+    p = parameters
+    args = (p['mu'], p['b0'], p['b1'], p['phi'], p['gamma'], p['ni'], p['alpha'])
+    dt, TS = time_grid(p['t_in'], p['t_end'], N)
+    settings = {'realizations': M, 'parameters': parameters, 'model': model, 'record_every': record_every}
+
+    checkpoint = load_checkpoint(directory)
+    if checkpoint is None:
+        seed = root_entropy(seed)
+        store = create_store(directory, M, TS[::record_every],
+                             {'model': model, 'scheme': 'euler_maruyama', 'parameters': parameters, 'seed': seed,
+                              'seed_streams': 'SeedSequence(seed).spawn(realizations)', 'window': window,
+                              **(metadata or {})})
+        streams = realization_streams(seed, range(M))
+        step = 0
+        X = np.empty((M, 3))
+        X[:] = p['S_in'], p['I_in'], p['R_in']
+        store['S'][:, 0], store['I'][:, 0], store['R'][:, 0] = X.T
+        save_checkpoint(directory, 0, X, streams, {**settings, 'seed': seed})
+    else:
+        seed = checkpoint['settings'].pop('seed')
+        if json.loads(json.dumps(settings, default=_json_default)) != checkpoint['settings']:
+            raise ValueError(f"{directory} holds the checkpoint of a different run")
+        store = open_store(directory, mode='r+')
+        step, X, streams = checkpoint['step'], checkpoint['state'], checkpoint['streams']
+    resumed_from = step
+
+    start = time.perf_counter()
+    buffer = np.empty((M, min(window, N), 3))
+    windows = 0
+    while step < N:
+        K = min(window, N - step)
+        out = buffer[:, :K]
+        advance_window(out, X, step, streams, p['t_in'], dt, *args, model=model, chunk_size=chunk_size,
+                       backend=backend)
+        # Recorded points falling in the window: steps step + record_every, ..., step + K
+        first = step // record_every + 1
+        recorded = out[:, record_every - 1::record_every]
+        for c, column in enumerate(('S', 'I', 'R')):
+            store[column][:, first:first + recorded.shape[1]] = recorded[:, :, c]
+        X = out[:, -1].copy()
+        step += K
+        windows += 1
+        if windows % checkpoint_every == 0 or step == N:
+            for column in ('S', 'I', 'R'):
+                store[column].flush()
+            save_checkpoint(directory, step, X, streams, {**settings, 'seed': seed})
+        if verbose:
+            print(f"step {step}/{N}, t = {TS[step]:.3f}", flush=True)
+    del store
+    return open_store(directory), {'resumed_from': resumed_from, 'windows': windows,
+                                   'seconds': time.perf_counter() - start}
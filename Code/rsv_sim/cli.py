@@ -0,0 +1,110 @@
+import argparse
+import sys
+import time
+from contextlib import nullcontext
+
+from rsv_sim.instrumentation import FORMATS, PROFILERS
+from rsv_sim.scenarios import MODELS
+
+#############################################################################################################
+# Command line
+# rsv-sim run --model {ode,sde-transmission,sde-birth} --config scenario.toml [more.toml ...] --out results/
+#             [--metrics metrics.jsonl [--metrics-format prometheus]] [--profile [pyinstrument]]
+# rsv-sim bench [--quick] [--out bench.json] [--baseline baseline.json]
+
+TITLES = {
+    'ode': 'Runge-Kutta 45',
+    'sde-transmission': 'Euler-Maruyama with transmission rate perturbation',
+    'sde-birth': 'Euler-Maruyama with birth rate perturbation',
+}
+
+def run(args):
+    """Run every scenario of the given config files in order.
+
+    Returns:
+    - int: Exit status, 1 if any scenario failed.
+    """
+    from pathlib import Path
+
+    from rsv_sim import instrumentation
+    from rsv_sim.scenarios import load_scenarios, run_scenario, save_scenario
+
+    queue = []
+    for path in args.config:
+        queue.extend(load_scenarios(path, model=args.model))
+
+    failed = 0
+    snapshots = []
+    for index, scenario in enumerate(queue, start=1):
+        print(f"[{index}/{len(queue)}] {scenario['name']} ({scenario['model']})", flush=True)
+        start = time.perf_counter()
+        recorder = instrumentation.Recorder(scenario=scenario['name'], model=scenario['model'])
+        try:
+            directory = Path(args.out) / scenario['name']
+            with recorder if args.metrics else nullcontext():
+                if args.profile:
+                    result = instrumentation.profiled(args.profile, directory, run_scenario, scenario, directory,
+                                                      statistics=args.statistics)
+                else:
+                    result = run_scenario(scenario, directory, statistics=args.statistics)
+            save_scenario(result, scenario, directory)
+            if args.plot:
+                from rsv_sim.plotting import save_ensemble_plots
+                # Read back from the store block by block; streamed statistics are drawn as a fan chart
+                save_ensemble_plots(directory, TITLES[scenario['model']])
+        except Exception as e:
+            failed += 1
+            recorder.labels['status'] = 'failed'
+            print(f"    failed: {e}", file=sys.stderr)
+        else:
+            recorder.labels['status'] = 'ok'
+            print(f"    done in {time.perf_counter() - start:.2f} s -> {directory}", flush=True)
+        if args.metrics:
+            snapshots.append(recorder.snapshot())
+            # JSON lines are appended as scenarios finish; a Prometheus file is rewritten with all of them
+            instrumentation.write_metrics(args.metrics, snapshots[-1:] if args.metrics_format == 'jsonl' else snapshots,
+                                          args.metrics_format)
+    return 1 if failed else 0
+
+def bench(args):
+    """Run the benchmarks (see rsv_sim.benchmark)."""
+    from rsv_sim.benchmark import main_bench
+    return main_bench(args)
+
+def build_parser():
+    """Build the argument parser of rsv-sim."""
+    parser = argparse.ArgumentParser(prog='rsv-sim', description='Headless simulations of the RSV SIRS models.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Simulate the scenarios of one or more config files.')
+    run_parser.add_argument('--model', choices=MODELS, help='Model, overrides the one of the config files.')
+    run_parser.add_argument('--config', nargs='+', required=True, help='Scenario files (TOML or JSON).')
+    run_parser.add_argument('--out', default='results', help='Output directory.')
+    run_parser.add_argument('--statistics', action='store_true',
+                            help='Stream ensemble statistics instead of storing every SDE trajectory.')
+    run_parser.add_argument('--plot', action='store_true', help='Also save S, I, R figures (fan charts for large ensembles).')
+    run_parser.add_argument('--metrics', help='File receiving the counters and timers of every scenario.')
+    run_parser.add_argument('--metrics-format', choices=FORMATS, default='jsonl',
+                            help='JSON lines (appended) or Prometheus text format (rewritten).')
+    run_parser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILERS,
+                            help='Profile every scenario, report written to its output directory.')
+    run_parser.set_defaults(handler=run)
+
+    bench_parser = commands.add_parser('bench', help='Benchmark the solver paths.')
+    bench_parser.add_argument('--quick', action='store_true', help='Small profile that finishes in under a minute.')
+    bench_parser.add_argument('--paths', nargs='+', default=['odeint', 'solve_ivp', 'em-transmission', 'em-birth'],
+                              help='Solver paths to benchmark.')
+    bench_parser.add_argument('--repeats', type=int, help='Timed runs per case.')
+    bench_parser.add_argument('--out', help='JSON file for the results.')
+    bench_parser.add_argument('--baseline', help='Earlier results to check for regressions.')
+    bench_parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown or peak RSS growth flagged as regression.')
+    bench_parser.set_defaults(handler=bench)
+    return parser
+
+def main(argv=None):
+    """Entry point of rsv-sim."""
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
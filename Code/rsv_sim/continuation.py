@@ -0,0 +1,248 @@
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from rsv_sim.periodic import flow, periodic_orbit, seasonal_peak
+
+#############################################################################################################
+# Continuation of periodic orbits and bifurcation diagrams
+# A branch follows the periodic orbit of the model while one parameter moves along a list of values;
+# each point starts Newton from a secant prediction through the two previous points, and the parameter
+# step is halved where Newton fails. Bifurcations are detected from the two non-trivial Floquet
+# multipliers l1, l2 between consecutive points (the third one, exp(-mu T), belongs to the total
+# population and never crosses the unit circle):
+#   fold             (1 - l1)(1 - l2) changes sign
+#   period doubling  (1 + l1)(1 + l2) changes sign
+#   torus            l1 l2 - 1 changes sign with l1, l2 complex
+# Past a period doubling, a child branch of twice the period is started from the perturbed orbit.
+
+BIFURCATIONS = ('fold', 'period_doubling', 'torus')
+
+# Columns of the diagram, one row per (point, year of the period); max_multiplier is the largest modulus
+# of the two non-trivial multipliers, the distance of the orbit to losing its stability
+COLUMNS = ('value', 'branch', 'period', 'year', 'S', 'I', 'R', 'peak_time', 'peak_I', 'stable', 'max_multiplier')
+
+def nontrivial_multipliers(orbit, mu):
+    """The two Floquet multipliers of an orbit that do not belong to the total population.
+
+    Returns:
+    - numpy.ndarray: (2,) multipliers.
+    """
+    multipliers = orbit['multipliers']
+    trivial = np.argmin(np.abs(multipliers - np.exp(-mu * orbit['period'])))
+    return np.delete(multipliers, trivial)
+
+def bifurcation_test_functions(multipliers):
+    """Values of the fold, period-doubling and torus test functions.
+
+    Returns:
+    - dict: Test function by bifurcation name.
+    """
+    l1, l2 = multipliers
+    return {
+        'fold': ((1 - l1) * (1 - l2)).real,
+        'period_doubling': ((1 + l1) * (1 + l2)).real,
+        'torus': (l1 * l2).real - 1 if abs(l1.imag) > 1e-12 else np.nan,
+    }
+
+def _predict(points, value):
+    """Secant prediction of the state at value from the last two points of a branch."""
+    x1 = points[-1]['state']
+    if len(points) < 2:
+        return x1
+    (v0, x0), v1 = (points[-2]['value'], points[-2]['state']), points[-1]['value']
+    x = x1 + (x1 - x0) * (value - v1) / (v1 - v0)
+    return x if np.all(x > 0) else x1
+
+def _collapsed(orbit, tol=1e-6):
+    """Whether an orbit of several years repeats every year, i.e. is really a shorter cycle."""
+    if orbit['period'] == 1:
+        return False
+    samples = (orbit['Y'].shape[0] - 1) // orbit['period']
+    return np.max(np.abs(orbit['Y'][samples] - orbit['Y'][0])) < tol
+
+def continue_branch(params, parameter, values, periods=1, guess=None, max_halvings=6, **options):
+    """Follow a periodic orbit while one parameter moves along a list of values.
+
+    Parameters:
+    - params (dict): b0, b1, phi, mu, gamma, ni.
+    - parameter (str): Name of the continuation parameter.
+    - values (list): Its values, monotonic, in the order they are visited.
+    - periods (int): Period of the orbit in years.
+    - guess: Starting state or orbit at values[0], see periodic_orbit.
+    - max_halvings (int): Times the step towards a value may be halved before the branch stops.
+    - options: Passed to periodic_orbit.
+
+    Returns:
+    - list: Points as dicts with 'value' and the periodic_orbit result (halving adds extra points).
+    - list: Bifurcations as dicts with 'type' and the interpolated 'value'.
+    - str: 'completed', or why the branch stopped (a multi-year orbit also stops where it
+      merges back into the shorter cycle).
+    """
+    points, bifurcations = [], []
+    pending = list(values)[::-1]
+    status = 'completed'
+    while pending:
+        value = pending.pop()
+        start = _predict(points, value) if points else guess
+        try:
+            orbit = periodic_orbit({**params, parameter: value}, guess=start, periods=periods, **options)
+        except (RuntimeError, np.linalg.LinAlgError) as error:
+            if not points:
+                return points, bifurcations, f'no orbit at {parameter} = {value}: {error}'
+            last = points[-1]['value']
+            if abs(value - last) < abs(values[-1] - values[0]) / len(values) / 2 ** max_halvings:
+                status = f'stopped at {parameter} = {last}: {error}'
+                break
+            pending.extend([value, (last + value) / 2])
+            continue
+        if _collapsed(orbit):
+            status = f'merged into the {periods // 2}-year cycle at {parameter} = {value}'
+            break
+        point = {'value': value, **orbit}
+        if points:
+            bifurcations.extend(_detect(points[-1], point, params['mu']))
+        points.append(point)
+    return points, bifurcations, status
+
+def _detect(a, b, mu):
+    """Bifurcations between two consecutive points of a branch, located by linear interpolation."""
+    found = []
+    tests_a = bifurcation_test_functions(nontrivial_multipliers(a, mu))
+    tests_b = bifurcation_test_functions(nontrivial_multipliers(b, mu))
+    for name in BIFURCATIONS:
+        fa, fb = tests_a[name], tests_b[name]
+        if np.isfinite(fa) and np.isfinite(fb) and fa * fb < 0:
+            found.append({'type': name, 'value': float(a['value'] + (b['value'] - a['value']) * fa / (fa - fb))})
+    return found
+
+def _doubled_guess(params, point, parameter, t0=0.0, amplitude=1e-2, max_periods=200):
+    """Starting state of the doubled-period branch past a period doubling.
+
+    The orbit is perturbed along the eigenvector of the multiplier below -1 and integrated until
+    the perturbation has grown to order one, so the guess is attracted by the new cycle rather than
+    Newton falling back onto the unstable old one. t0 is the time of the Poincare section of the
+    branch, the state of point being taken there.
+    """
+    params = {**params, parameter: point['value']}
+    x = point['state']
+    eigenvalues, vectors = np.linalg.eig(flow(params, x, t0, point['period'])[1])
+    unstable = np.argmin(eigenvalues.real)
+    v = vectors[:, unstable].real
+    # Relative perturbation of I of the given amplitude
+    x = x + amplitude * x[1] * v / max(abs(v[1]), 1e-12)
+    growth = np.log(1 / amplitude) / np.log(max(abs(eigenvalues[unstable]), 1 + 1e-3))
+    duration = 2 * int(min(max_periods, 2 * growth + 10)) * point['period']
+    return flow(params, np.abs(x) / np.abs(x).sum(), t0, duration)[0]
+
+def _run_branch(task):
+    """Worker: continue one branch and, past period doublings, describe the child branches.
+
+    Returns:
+    - dict: Branch description with its points, bifurcations, status and child tasks.
+    """
+    params, parameter, values, periods, guess, options, switch = (
+        task['params'], task['parameter'], task['values'], task['periods'], task['guess'], task['options'],
+        task['switch'])
+    points, bifurcations, status = continue_branch(params, parameter, values, periods, guess, **options)
+    children = []
+    if switch:
+        for bifurcation in bifurcations:
+            if bifurcation['type'] != 'period_doubling':
+                continue
+            # Start from the first point past the bifurcation, where the old orbit is unstable
+            direction = np.sign(values[-1] - values[0])
+            after = [p for p in points if direction * (p['value'] - bifurcation['value']) > 0]
+            if not after or after[0]['stable']:
+                continue
+            start = after[0]
+            remaining = [start['value']] + [v for v in values if direction * (v - start['value']) > 0]
+            children.append({**task, 'values': remaining, 'periods': 2 * periods,
+                             'guess': _doubled_guess(params, start, parameter, options.get('t0', 0.0))})
+    return {'overrides': task['overrides'], 'periods': periods, 'points': points,
+            'bifurcations': bifurcations, 'status': status, 'children': children}
+
+def _rows(branch_id, branch, params, parameter):
+    """Diagram rows of a branch, one per point and year of the period."""
+    rows = []
+    for point in branch['points']:
+        mu = point['value'] if parameter == 'mu' else params['mu']
+        margin = np.abs(nontrivial_multipliers(point, mu)).max()
+        peak_times, peak_values = seasonal_peak(point)
+        samples = (point['Y'].shape[0] - 1) // point['period']
+        for year in range(point['period']):
+            S, I, R = point['Y'][year * samples]
+            rows.append((point['value'], branch_id, point['period'], year, S, I, R, peak_times[year],
+                         peak_values[year], point['stable'], margin))
+    return rows
+
+def bifurcation_diagram(params, parameter, values, branches=({},), periods=1, switch_branches=True,
+                        workers=None, **options):
+    """Bifurcation diagram of the periodic orbits along one parameter.
+
+    Every entry of branches is an independent branch (e.g. one per value of b0 while b1 varies);
+    they are continued in parallel, and so are the doubled-period branches started past every
+    period doubling.
+
+    Parameters:
+    - params (dict): b0, b1, phi, mu, gamma, ni.
+    - parameter (str): Continuation parameter, e.g. 'b1' or 'b0'.
+    - values (list): Its values along every branch.
+    - branches (tuple): Parameter overrides of each branch.
+    - periods (int): Period of the starting orbits in years.
+    - switch_branches (bool): Follow the doubled-period orbit past period doublings.
+    - workers (int): Number of processes, all the available cores if None.
+    - options: Passed to continue_branch and periodic_orbit.
+
+    Returns:
+    - dict: 'parameter', 'columns' (arrays by COLUMNS name), 'bifurcations' (with their branch)
+      and 'branches' (overrides, period, parent and status of each branch).
+    """
+    values = [float(v) for v in values]
+    tasks = [{'params': {**params, **overrides}, 'overrides': overrides, 'parameter': parameter,
+              'values': values, 'periods': periods, 'guess': None, 'options': options,
+              'switch': switch_branches, 'parent': None} for overrides in branches]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+
+    finished = []
+    if workers == 1:
+        while tasks:
+            task = tasks.pop(0)
+            result = _run_branch(task)
+            finished.append((task, result))
+            tasks.extend({**child, 'parent': len(finished) - 1} for child in result['children'])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {pool.submit(_run_branch, task): task for task in tasks}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    result = future.result()
+                    finished.append((task, result))
+                    for child in result['children']:
+                        child = {**child, 'parent': len(finished) - 1}
+                        running[pool.submit(_run_branch, child)] = child
+
+    rows, bifurcations, descriptions = [], [], []
+    for branch_id, (task, result) in enumerate(finished):
+        rows.extend(_rows(branch_id, result, task['params'], parameter))
+        bifurcations.extend({**b, 'branch': branch_id} for b in result['bifurcations'])
+        descriptions.append({'overrides': task['overrides'], 'periods': task['periods'],
+                             'parent': task['parent'], 'status': result['status']})
+    columns = {name: np.array([row[i] for row in rows]) for i, name in enumerate(COLUMNS)}
+    return {'parameter': parameter, 'columns': columns, 'bifurcations': bifurcations, 'branches': descriptions}
+
+def save_diagram(diagram, path):
+    """Write a bifurcation diagram to a JSON file."""
+    data = {**diagram, 'columns': {name: column.tolist() for name, column in diagram['columns'].items()}}
+    Path(path).write_text(json.dumps(data, indent=1, default=float))
+
+def load_diagram(path):
+    """Read a bifurcation diagram written by save_diagram."""
+    data = json.loads(Path(path).read_text())
+    data['columns'] = {name: np.array(column) for name, column in data['columns'].items()}
+    return data
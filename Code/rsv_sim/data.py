@@ -0,0 +1,27 @@
+import numpy as np
+
+#############################################################################################################
+# Observed data
+# Monthly RSV cases in the region of Valencia, 2001-2004 (Arenas et al., 2009), as plotted by real_data()
+# in the scripts.
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+MONTHLY_CASES = {
+    2001: [414, 272, 137, 22, 17, 2, 0, 1, 17, 1, 9, 127],
+    2002: [454, 301, 160, 55, 25, 11, 7, 1, 17, 32, 86, 417],
+    2003: [382, 138, 120, 50, 2, 10, 4, 4, 31, 64, 284, 607],
+    2004: [348, 145, 129, 9, 6, 4, 0, 0, 15, 28, 88, 373],
+}
+
+def monthly_series(years=None):
+    """Monthly case counts in chronological order.
+
+    Parameters:
+    - years (list): Years to include, all of MONTHLY_CASES if None.
+
+    Returns:
+    - numpy.ndarray: Cases per month, January of the first year first.
+    """
+    years = sorted(MONTHLY_CASES) if years is None else years
+    return np.array([cases for year in years for cases in MONTHLY_CASES[year]], dtype=float)
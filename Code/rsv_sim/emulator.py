@@ -0,0 +1,339 @@
+import json
+from itertools import combinations_with_replacement, product
+from pathlib import Path
+
+import numpy as np
+from numpy.polynomial import legendre
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from scipy.spatial import Delaunay, cKDTree
+from scipy.stats import qmc
+
+from rsv_sim.sensitivity import DEFAULT_FIXED, simulate_chunk
+
+#############################################################################################################
+# Emulator of the seasonal curve
+# The curve is I(t) over the last simulated year, when the model has settled on its annual cycle, at
+# a fixed number of points. Runs whose last two years differ by more than ANNUAL_TOLERANCE (biennial
+# cycles, slow transients) have no annual curve and are left out of the fit. The log-curves
+# log(I + FLOOR) are registered on their peak: each one is shifted circularly so its peak falls on
+# the mean peak time, which leaves the shape to POD and the timing to a single number. The aligned
+# log-curves minus their mean are projected on the leading singular vectors, which keep all but a
+# tolerance of the variance, and the POD coefficients and the peak shift are regressed on the
+# parameters (scaled to [0, 1]) with
+#   'pce'  a Legendre polynomial chaos of total degree p, fitted by least squares,
+#   'gp'   a Gaussian process with a squared-exponential kernel whose length scales and noise
+#          maximize the marginal likelihood.
+# A prediction is a few small matrix products for the whole batch. Queries outside the convex hull
+# of the training inputs, or whose nearest training run had no annual cycle, can be sent to the true
+# solver.
+
+NAMES = ('b0', 'b1', 'phi', 'gamma', 'ni')
+KINDS = ('pce', 'gp')
+
+# Region of endemic annual cycles; stronger seasonality (b1 above about 0.35) brings biennial cycles
+DEFAULT_BOUNDS = {
+    'b0': (45.0, 75.0),
+    'b1': (0.1, 0.3),
+    'phi': (0.5, 1.6),
+    'gamma': (0.9, 3.6),
+    'ni': (24.0, 40.0),
+}
+
+# Added to I before the log, far below one infective in the population of Valencia
+FLOOR = 1e-7
+
+# Fraction of the variance of the log-curves left out of the POD basis
+POD_TOLERANCE = 1e-6
+
+# Relative L2 change between the last two years above which a run is not on an annual cycle
+ANNUAL_TOLERANCE = 0.05
+
+FORMAT = 'rsv_sim-emulator-1'
+
+def annual_curves(X, names=NAMES, fixed=None, backend='ode', points=73, years=1, t_end=5, steps_per_year=365,
+                  **options):
+    """I(t) over the last simulated years for every parameter set, from the batched solvers.
+
+    Parameters:
+    - X (numpy.ndarray): (n, len(names)) parameter values.
+    - names (tuple): Parameters varied, the others are taken from fixed.
+    - fixed (dict): Values of the other parameters, DEFAULT_FIXED if None.
+    - backend (str): 'ode' or 'sde' (mean over the replicates).
+    - points (int): Points of a year (73, every 5 days); steps_per_year must be a multiple of it.
+    - years (int): Number of final years returned.
+    - t_end (int): Years simulated.
+    - steps_per_year (int): Steps per year of the solver.
+    - options: Passed to simulate_chunk (replicates, seed, first...).
+
+    Returns:
+    - numpy.ndarray: (n, points) infectives at t_end - 1 + k / points, (n, years, points) if years > 1.
+    """
+    t, Y = simulate_chunk(np.atleast_2d(X), tuple(names), {**DEFAULT_FIXED, **(fixed or {})}, backend,
+                          t_end=t_end, steps_per_year=steps_per_year, **options)
+    if backend == 'sde':
+        Y = Y.mean(axis=1)
+    stride = steps_per_year // points
+    curves = Y[:, -years * steps_per_year - 1:-1:stride, 1].reshape(Y.shape[0], years, points)
+    return curves[:, 0] if years == 1 else curves
+
+def _legendre_exponents(d, degree):
+    """Multi-indices of total degree <= degree, as a (terms, d) array."""
+    exponents = [np.zeros(d, dtype=int)]
+    for total in range(1, degree + 1):
+        for combination in combinations_with_replacement(range(d), total):
+            exponents.append(np.bincount(combination, minlength=d))
+    return np.array(exponents)
+
+def _legendre_basis(U, exponents):
+    """Tensor Legendre polynomials at points U of [0, 1]^d, orthonormal on the unit cube.
+
+    Returns:
+    - numpy.ndarray: (n, terms) basis values.
+    """
+    degree = exponents.max()
+    # values[k, :, j] = P_k(2 u_j - 1) sqrt(2k + 1)
+    values = np.stack([legendre.legval(2 * U - 1, np.eye(degree + 1)[k]) * np.sqrt(2 * k + 1)
+                       for k in range(degree + 1)])
+    return np.prod(values[exponents.T, :, np.arange(U.shape[1])[:, None]], axis=0).T
+
+def _squared_distances(U, V, lengths):
+    """Pairwise squared distances scaled by the length scales."""
+    U, V = U / lengths, V / lengths
+    return np.maximum((U ** 2).sum(1)[:, None] + (V ** 2).sum(1)[None] - 2 * U @ V.T, 0.0)
+
+def _gp_negative_log_likelihood(log_theta, U, Z):
+    """Negative log marginal likelihood of standardized outputs Z, summed over their columns."""
+    lengths, noise = np.exp(log_theta[:-1]), np.exp(log_theta[-1])
+    K = np.exp(-0.5 * _squared_distances(U, U, lengths)) + (noise + 1e-10) * np.eye(U.shape[0])
+    try:
+        factor = cho_factor(K, lower=True)
+    except np.linalg.LinAlgError:
+        return 1e300
+    alpha = cho_solve(factor, Z)
+    return 0.5 * np.sum(Z * alpha) + Z.shape[1] * np.sum(np.log(np.diag(factor[0])))
+
+def _shift(L, shifts):
+    """Circular shift of every row of L by a fractional number of points, out[i] = L[i + shift].
+
+    Parameters:
+    - L (numpy.ndarray): (n, P) periodic curves.
+    - shifts (numpy.ndarray): (n,) shifts in points, interpolated linearly.
+
+    Returns:
+    - numpy.ndarray: (n, P) shifted curves.
+    """
+    P = L.shape[1]
+    position = (np.arange(P) + shifts[:, None]) % P
+    lower = np.floor(position).astype(int)
+    weight = position - lower
+    rows = np.arange(L.shape[0])[:, None]
+    return (1 - weight) * L[rows, lower] + weight * L[rows, (lower + 1) % P]
+
+def _peak_positions(L):
+    """Fractional position of the maximum of every periodic curve, refined by a parabola."""
+    P = L.shape[1]
+    k = L.argmax(axis=1)
+    rows = np.arange(L.shape[0])
+    left, centre, right = L[rows, (k - 1) % P], L[rows, k], L[rows, (k + 1) % P]
+    curvature = left - 2 * centre + right
+    return k + np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, -1.0), 0.0)
+
+class Emulator:
+    """POD + regression emulator of the annual I(t) curve."""
+
+    def __init__(self, names=NAMES, bounds=None, kind='pce', degree=4, fixed=None, backend='ode', points=73,
+                 **solver_options):
+        """Parameters:
+        - names (tuple): Parameters of the emulator.
+        - bounds (dict): Training range of every parameter, DEFAULT_BOUNDS if None.
+        - kind (str): 'pce' or 'gp'.
+        - degree (int): Total degree of the polynomial chaos.
+        - fixed (dict): Values of the other parameters, DEFAULT_FIXED if None.
+        - backend (str): 'ode' or 'sde' training runs, also used for the fallback.
+        - points (int): Points of the annual curve.
+        - solver_options: Passed to annual_curves (t_end, steps_per_year, replicates, seed...).
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown emulator '{kind}', expected one of {KINDS}")
+        self.names = tuple(names)
+        self.bounds = {name: tuple((bounds or DEFAULT_BOUNDS)[name]) for name in self.names}
+        self.kind = kind
+        self.degree = degree
+        self.fixed = {**DEFAULT_FIXED, **(fixed or {})}
+        self.backend = backend
+        self.points = points
+        self.solver_options = solver_options
+        self.validation = None
+        self._hull = self._tree = None
+
+    def _unit(self, X):
+        """Scale parameters to [0, 1]^d."""
+        lower, upper = np.array([self.bounds[name] for name in self.names]).T
+        return (np.atleast_2d(X) - lower) / (upper - lower)
+
+    def curves(self, X, years=1):
+        """True annual curves from the solver the emulator was trained on."""
+        return annual_curves(X, self.names, self.fixed, self.backend, self.points, years, **self.solver_options)
+
+    def fit(self, samples=512, validation=0.2, seed=0, X=None, curves=None):
+        """Train on a Sobol design over the bounds and measure the error on held-out runs.
+
+        Parameters:
+        - samples (int): Number of training runs (a power of 2 for a balanced design), plus the 2^d corners.
+        - validation (float): Size of the validation set as a fraction of samples.
+        - seed (int): Seed of the designs.
+        - X, curves: Training inputs and their (n, points) or (n, 2, points) curves, see annual_curves,
+          to use instead of running the solver.
+
+        Returns:
+        - Emulator: self, with 'validation' errors.
+        """
+        if X is None:
+            d = len(self.names)
+            # The corners of the box make the hull of the design the whole box
+            corners = np.array(list(product((0.0, 1.0), repeat=d)))
+            unit = np.vstack([qmc.Sobol(d, scramble=True, seed=seed).random(samples), corners])
+            lower, upper = np.array([self.bounds[name] for name in self.names]).T
+            X = lower + unit * (upper - lower)
+        if curves is None:
+            curves = self.curves(X, years=2)
+        self.X = np.asarray(X, dtype=float)
+        curves = np.asarray(curves, dtype=float)
+        if curves.ndim == 3:
+            change = np.linalg.norm(curves[:, -1] - curves[:, -2], axis=1) / np.linalg.norm(curves[:, -1], axis=1)
+            self.annual = change < ANNUAL_TOLERANCE
+            curves = curves[:, -1]
+        else:
+            self.annual = np.ones(self.X.shape[0], dtype=bool)
+        if self.annual.sum() < 2:
+            raise ValueError("Fewer than two training runs settle on an annual cycle, narrow the bounds")
+        U = self._unit(self.X[self.annual])
+        logs = np.log(curves[self.annual] + FLOOR)
+
+        # Register the curves on their peak, then take the POD basis of the aligned log-curves
+        peaks = _peak_positions(logs)
+        self.reference = float(np.angle(np.mean(np.exp(2j * np.pi * peaks / self.points))) * self.points / (2 * np.pi))
+        shifts = (peaks - self.reference + self.points / 2) % self.points - self.points / 2
+        aligned = _shift(logs, shifts)
+        self.mean = aligned.mean(axis=0)
+        _, singular, modes = np.linalg.svd(aligned - self.mean, full_matrices=False)
+        energy = np.cumsum(singular ** 2) / np.sum(singular ** 2)
+        rank = int(np.searchsorted(energy, 1 - POD_TOLERANCE) + 1)
+        self.modes = modes[:rank]
+        outputs = np.column_stack([(aligned - self.mean) @ self.modes.T, shifts])
+
+        if self.kind == 'pce':
+            self.exponents = _legendre_exponents(len(self.names), self.degree)
+            self.weights = np.linalg.lstsq(_legendre_basis(U, self.exponents), outputs, rcond=None)[0]
+        else:
+            self.scale = outputs.std(axis=0)
+            Z = outputs / self.scale
+            start = np.append(np.log(np.full(len(self.names), 0.3)), np.log(1e-4))
+            result = minimize(_gp_negative_log_likelihood, start, args=(U, Z), method='L-BFGS-B',
+                              bounds=[(-4, 3)] * len(self.names) + [(-20, 0)])
+            self.lengths, self.noise = np.exp(result.x[:-1]), float(np.exp(result.x[-1]))
+            K = np.exp(-0.5 * _squared_distances(U, U, self.lengths)) + (self.noise + 1e-10) * np.eye(U.shape[0])
+            self.weights = cho_solve(cho_factor(K, lower=True), Z)
+        self._hull = self._tree = None
+
+        if validation:
+            lower, upper = np.array([self.bounds[name] for name in self.names]).T
+            # Validation points inside the bounds but not on the training design
+            rng = np.random.default_rng(seed + 1)
+            X_test = lower + rng.random((max(1, int(validation * samples)), len(self.names))) * (upper - lower)
+            self.validate(X_test)
+        return self
+
+    def validate(self, X, curves=None):
+        """Compare the emulator with the solver on the queries it would answer itself.
+
+        Returns:
+        - dict: Number of 'samples', fraction sent to the 'fallback', median, 90th percentile and max
+          relative L2 error of the emulated curves, and median and max relative error of their peak,
+          also stored in self.validation.
+        """
+        X = np.atleast_2d(X)
+        emulated = self.inside(X)
+        self.validation = {'samples': int(X.shape[0]), 'fallback': float(1 - emulated.mean())}
+        if emulated.any():
+            X = X[emulated]
+            curves = self.curves(X) if curves is None else np.asarray(curves)[emulated]
+            predicted = self.predict(X, fallback=False)
+            l2 = np.linalg.norm(predicted - curves, axis=1) / np.linalg.norm(curves, axis=1)
+            peak = np.abs(predicted.max(axis=1) - curves.max(axis=1)) / curves.max(axis=1)
+            self.validation.update(median_l2=float(np.median(l2)), p90_l2=float(np.quantile(l2, 0.9)),
+                                   max_l2=float(l2.max()), median_peak=float(np.median(peak)),
+                                   max_peak=float(peak.max()))
+        return self.validation
+
+    def inside(self, X):
+        """Whether each query is answered by the emulator: it lies in the convex hull of the training
+        inputs and its nearest training run settled on an annual cycle.
+
+        Returns:
+        - numpy.ndarray: (n,) booleans.
+        """
+        U_train, U = self._unit(self.X), self._unit(X)
+        if self._hull is None:
+            self._hull = Delaunay(U_train)
+            self._tree = cKDTree(U_train)
+        return (self._hull.find_simplex(U) >= 0) & self.annual[self._tree.query(U)[1]]
+
+    def predict(self, X, fallback=True):
+        """Annual curves for a batch of parameter sets.
+
+        Parameters:
+        - X (numpy.ndarray): (n, len(names)) parameter values, or one (len(names),) set.
+        - fallback (bool): Run the solver for the queries the emulator does not answer, see inside.
+
+        Returns:
+        - numpy.ndarray: (n, points) infectives over the year.
+        """
+        U = self._unit(X)
+        if self.kind == 'pce':
+            outputs = _legendre_basis(U, self.exponents) @ self.weights
+        else:
+            U_train = self._unit(self.X[self.annual])
+            outputs = (np.exp(-0.5 * _squared_distances(U, U_train, self.lengths)) @ self.weights) * self.scale
+        logs = _shift(self.mean + outputs[:, :-1] @ self.modes, -outputs[:, -1])
+        curves = np.maximum(np.exp(logs) - FLOOR, 0.0)
+        if fallback:
+            outside = ~self.inside(X)
+            if outside.any():
+                curves[outside] = self.curves(np.atleast_2d(X)[outside])
+        return curves
+
+    def save(self, path):
+        """Write the fitted emulator to a .npz file."""
+        arrays = {'X': self.X, 'annual': self.annual, 'mean': self.mean, 'modes': self.modes, 'weights': self.weights}
+        if self.kind == 'pce':
+            arrays['exponents'] = self.exponents
+        else:
+            arrays.update(lengths=self.lengths, scale=self.scale)
+        settings = {'format': FORMAT, 'names': self.names, 'bounds': self.bounds, 'kind': self.kind,
+                    'degree': self.degree, 'fixed': self.fixed, 'backend': self.backend, 'points': self.points,
+                    'solver_options': self.solver_options, 'validation': self.validation,
+                    'reference': self.reference, 'noise': getattr(self, 'noise', None)}
+        np.savez(path, settings=json.dumps(settings), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read an emulator written by save.
+
+        Returns:
+        - Emulator: Fitted emulator.
+        """
+        with np.load(Path(path)) as data:
+            settings = json.loads(str(data['settings']))
+            if settings.get('format') != FORMAT:
+                raise ValueError(f"{path} is not a saved emulator ({settings.get('format')})")
+            emulator = cls(settings['names'], settings['bounds'], settings['kind'], settings['degree'],
+                           settings['fixed'], settings['backend'], settings['points'], **settings['solver_options'])
+            emulator.validation = settings['validation']
+            emulator.reference = settings['reference']
+            emulator.noise = settings['noise']
+            for name in data.files:
+                if name != 'settings':
+                    setattr(emulator, name, data[name])
+        return emulator
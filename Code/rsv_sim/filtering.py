@@ -0,0 +1,276 @@
+import copy
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from scipy.special import gammaln, logsumexp
+
+from rsv_sim.calibration import DEFAULT_INITIAL_CONDITIONS
+from rsv_sim.integrators import seasonality
+from rsv_sim.sde import transmission_step
+from rsv_sim.storage import _json_default
+
+#############################################################################################################
+# Sequential assimilation of the monthly case series
+# A particle filter on the transmission-perturbation SDE: M particles (S, I, R) are advanced one month
+# with Euler-Maruyama while their incidence, the integral of beta S I over the month, is accumulated.
+# Each particle is weighted by the likelihood of the month's observed cases given scale x incidence
+# (Poisson, or negative binomial with a dispersion), and the ensemble is resampled systematically when
+# its effective size drops. Particles, weights, time and the state of the random generator are
+# checkpointed, so assimilating next month's count only simulates that month.
+
+FORMAT = 'rsv_sim-filter-1'
+
+# Months last 1/12 of a year, as in the calibration
+MONTH = 1 / 12
+
+# Resample when the effective sample size falls below this fraction of the particles
+RESAMPLE_THRESHOLD = 0.5
+
+def systematic_resample(weights, rng):
+    """Indices of the particles kept by systematic resampling.
+
+    Parameters:
+    - weights (numpy.ndarray): (M,) normalized weights.
+    - rng (numpy.random.Generator): Source of the single uniform offset.
+
+    Returns:
+    - numpy.ndarray: (M,) indices, particle i repeated about M weights[i] times.
+    """
+    M = weights.size
+    positions = (rng.random() + np.arange(M)) / M
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1.0
+    return np.searchsorted(cumulative, positions, side='right')
+
+def log_likelihood(cases, expected, dispersion=None):
+    """Log-probability of the observed cases given the expected ones of every particle.
+
+    Parameters:
+    - cases (float): Observed cases of the month.
+    - expected (numpy.ndarray): (M,) expected cases.
+    - dispersion (float): Size k of a negative binomial (variance expected + expected^2 / k), Poisson if None.
+
+    Returns:
+    - numpy.ndarray: (M,) log-likelihoods, -inf for unusable particles.
+    """
+    expected = np.where(np.isfinite(expected), np.maximum(expected, 1e-12), np.nan)
+    if dispersion is None:
+        value = cases * np.log(expected) - expected - gammaln(cases + 1)
+    else:
+        k = dispersion
+        value = (gammaln(cases + k) - gammaln(k) - gammaln(cases + 1)
+                 + k * np.log(k / (k + expected)) + cases * np.log(expected / (k + expected)))
+    return np.where(np.isnan(value), -np.inf, value)
+
+class ParticleFilter:
+    """Particle filter of the monthly cases on the transmission-perturbation model.
+
+    The first update is the January following burn_in_years of simulation from the scripts' initial
+    state, as in rsv_sim.calibration.
+    """
+
+    def __init__(self, M, parameters, scale, seed=0, steps_per_month=80, dispersion=None,
+                 resample_threshold=RESAMPLE_THRESHOLD, burn_in_years=2, initial_conditions=None):
+        """Parameters:
+        - M (int): Number of particles.
+        - parameters (dict): mu, b0, b1, phi, gamma, ni and alpha.
+        - scale (float): Reported cases per unit of incidence, e.g. the 'scale' of calibrate.
+        - seed (int): Seed of the filter's random generator.
+        - steps_per_month (int): Euler-Maruyama steps per month.
+        - dispersion (float): Negative binomial size of the observation model, Poisson if None.
+        - resample_threshold (float): Fraction of M below which the effective sample size triggers resampling.
+        - burn_in_years (int): Years simulated before the first observed month.
+        - initial_conditions (dict): S0, I0, R0 at t = 0, those of the scripts if None.
+        """
+        self.parameters = {name: float(parameters[name]) for name in ('mu', 'b0', 'b1', 'phi', 'gamma', 'ni', 'alpha')}
+        self.scale = float(scale)
+        self.steps_per_month = steps_per_month
+        self.dispersion = dispersion
+        self.resample_threshold = resample_threshold
+        self.rng = np.random.default_rng(seed)
+        self.history = []
+        initial_conditions = initial_conditions or DEFAULT_INITIAL_CONDITIONS
+        self.t = 0.0
+        self.particles = np.tile([initial_conditions['S0'], initial_conditions['I0'], initial_conditions['R0']],
+                                 (M, 1)).astype(float)
+        self.log_weights = np.full(M, -np.log(M))
+        for _ in range(12 * burn_in_years):
+            self.particles, _ = self._propagate(self.particles, self.t, self.rng)
+            self.t += MONTH
+
+    @property
+    def months(self):
+        """Number of observed months assimilated so far."""
+        return len(self.history)
+
+    def _propagate(self, X, t, rng):
+        """Advance particles by one month.
+
+        Returns:
+        - numpy.ndarray: (M, 3) particles at t + MONTH.
+        - numpy.ndarray: (M,) incidence over the month.
+        """
+        p = self.parameters
+        dt = MONTH / self.steps_per_month
+        increments = rng.standard_normal((self.steps_per_month, X.shape[0], 3)) * np.sqrt(dt)
+        incidence = np.zeros(X.shape[0])
+        for k, dW in enumerate(increments):
+            t_k = t + k * dt
+            b0_tilde = p['b0'] + p['alpha'] * dW[:, 0]
+            incidence += b0_tilde * seasonality(t_k, p['b1'], p['phi']) * X[:, 0] * X[:, 1] * dt
+            X = transmission_step(t_k, dt, X, dW, **p)
+        return X, incidence
+
+    def update(self, cases):
+        """Assimilate the cases of the next month.
+
+        Parameters:
+        - cases (float): Observed cases.
+
+        Returns:
+        - dict: 'month' index, 't' at its end, 'cases', predicted cases 'predicted_mean' and
+          'predicted_quantiles' (5, 50, 95%) before weighting, 'log_likelihood' of the month
+          given the past, effective sample size 'ess' and whether the particles were 'resampled'.
+        """
+        self.particles, incidence = self._propagate(self.particles, self.t, self.rng)
+        self.t += MONTH
+        expected = self.scale * incidence
+        weights = np.exp(self.log_weights - logsumexp(self.log_weights))
+        log_weights = self.log_weights + log_likelihood(cases, expected, self.dispersion)
+        total = logsumexp(log_weights)
+        if not np.isfinite(total):
+            raise RuntimeError(f"Every particle is incompatible with {cases} cases in month {self.months}")
+        self.log_weights = log_weights - total
+        normalized = np.exp(self.log_weights)
+        ess = 1 / np.sum(normalized ** 2)
+        resampled = ess < self.resample_threshold * normalized.size
+        if resampled:
+            self.particles = self.particles[systematic_resample(normalized, self.rng)]
+            self.log_weights = np.full(normalized.size, -np.log(normalized.size))
+        usable = np.isfinite(expected)
+        record = {
+            'month': self.months,
+            't': self.t,
+            'cases': float(cases),
+            'predicted_mean': float(np.sum(weights[usable] * expected[usable]) / np.sum(weights[usable])),
+            'predicted_quantiles': np.quantile(expected[usable], [0.05, 0.5, 0.95]).tolist(),
+            'log_likelihood': float(total),
+            'ess': float(ess),
+            'resampled': bool(resampled),
+        }
+        self.history.append(record)
+        return record
+
+    def filtered_state(self):
+        """Weighted mean of the particles.
+
+        Returns:
+        - numpy.ndarray: (3,) mean S, I, R at the current time.
+        """
+        return np.exp(self.log_weights) @ self.particles
+
+    def forecast(self, months, quantiles=(0.05, 0.5, 0.95)):
+        """Project the monthly cases ahead without changing the filter.
+
+        Parameters:
+        - months (int): Number of months.
+        - quantiles (tuple): Quantiles of the expected cases to return.
+
+        Returns:
+        - numpy.ndarray: (len(quantiles), months) quantiles of the expected cases, particles
+          drawn according to their weights.
+        """
+        # A copy of the generator, so the forecast does not move the filter's random stream
+        rng = copy.deepcopy(self.rng)
+        X = self.particles[systematic_resample(np.exp(self.log_weights), rng)]
+        t = self.t
+        cases = np.empty((X.shape[0], months))
+        for month in range(months):
+            X, incidence = self._propagate(X, t, rng)
+            cases[:, month] = self.scale * incidence
+            t += MONTH
+        return np.nanquantile(cases, quantiles, axis=0)
+
+    def save(self, directory):
+        """Write a checkpoint of the filter to a directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # The arrays are named after the number of assimilated months, so the files of the previous
+        # checkpoint stay valid until filter.json is replaced
+        months = len(self.history)
+        arrays = {'particles': f'particles_{months}.npy', 'log_weights': f'log_weights_{months}.npy'}
+        for name, filename in arrays.items():
+            tmp = directory / (filename + '.tmp')
+            with open(tmp, 'wb') as file:
+                np.save(file, getattr(self, name))
+            os.replace(tmp, directory / filename)
+        state = {
+            'format': FORMAT,
+            'parameters': self.parameters,
+            'scale': self.scale,
+            'steps_per_month': self.steps_per_month,
+            'dispersion': self.dispersion,
+            'resample_threshold': self.resample_threshold,
+            't': self.t,
+            'rng': self.rng.bit_generator.state,
+            'history': self.history,
+            'arrays': arrays,
+        }
+        # The state file is replaced last and atomically, so a checkpoint is never half updated
+        tmp = directory / 'filter.json.tmp'
+        tmp.write_text(json.dumps(state, indent=1, default=_json_default))
+        os.replace(tmp, directory / 'filter.json')
+        for name in ('particles', 'log_weights'):
+            for path in directory.glob(f'{name}*.npy'):
+                if path.name != arrays[name]:
+                    path.unlink()
+
+    @classmethod
+    def load(cls, directory):
+        """Read a checkpoint written by save.
+
+        Returns:
+        - ParticleFilter: Filter ready for the next update.
+        """
+        directory = Path(directory)
+        state = json.loads((directory / 'filter.json').read_text())
+        if state.get('format') != FORMAT:
+            raise ValueError(f"{directory} is not a particle filter checkpoint ({state.get('format')})")
+        pf = cls.__new__(cls)
+        pf.parameters = state['parameters']
+        pf.scale = state['scale']
+        pf.steps_per_month = state['steps_per_month']
+        pf.dispersion = state['dispersion']
+        pf.resample_threshold = state['resample_threshold']
+        pf.t = state['t']
+        pf.history = state['history']
+        pf.rng = np.random.default_rng()
+        pf.rng.bit_generator.state = state['rng']
+        pf.particles = np.load(directory / state['arrays']['particles'])
+        pf.log_weights = np.load(directory / state['arrays']['log_weights'])
+        return pf
+
+def assimilate(directory, observed, **options):
+    """Bring a checkpointed filter up to date with a monthly series.
+
+    Months already in the checkpoint are skipped, so extending the series by one month costs one
+    month of simulation. Without a checkpoint, a filter is created from options.
+
+    Parameters:
+    - directory (str): Checkpoint directory.
+    - observed (numpy.ndarray): Monthly cases from the first assimilated month, e.g. monthly_series().
+    - options: Arguments of ParticleFilter (M, parameters, scale...) for a new filter.
+
+    Returns:
+    - ParticleFilter: Updated filter, also saved to directory.
+    - list: Records of the months assimilated by this call.
+    """
+    if (Path(directory) / 'filter.json').exists():
+        pf = ParticleFilter.load(directory)
+    else:
+        pf = ParticleFilter(**options)
+    records = [pf.update(cases) for cases in np.asarray(observed, dtype=float)[pf.months:]]
+    pf.save(directory)
+    return pf, records
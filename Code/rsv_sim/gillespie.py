@@ -0,0 +1,193 @@
+import numpy as np
+from scipy.stats import poisson
+
+from rsv_sim.integrators import seasonality
+from rsv_sim.noise import UniformBuffer, realization_streams, root_entropy
+from rsv_sim.sde import time_grid
+
+#############################################################################################################
+# Finite-population stochastic model
+# The compartments hold whole individuals of a closed population P; the transitions of the SIRS model
+# happen one at a time with the rates (propensities) below, and every death is replaced by a birth
+# into S, as mu keeps S + I + R constant in the continuous model:
+#   infection    S -> I   beta(t) S I / P
+#   recovery     I -> R   ni I
+#   waning       R -> S   gamma R
+#   death of I   I -> S   mu I
+#   death of R   R -> S   mu R
+# I can reach 0, and the epidemic then fades out until it is reintroduced, which the fraction models
+# cannot represent.
+#
+# 'exact' is Gillespie's direct method. beta(t) varies in time, so events are drawn by thinning: the
+# candidates come at the rate of the bound b0 (1 + |b1|) of beta and are accepted with the ratio of the
+# true to the bound propensity. 'tau_leaping' fires Poisson numbers of every transition over a leap
+# chosen so that no propensity changes by more than a fraction epsilon (Cao, Gillespie and Petzold);
+# where that leap is shorter than a few expected events, e.g. close to extinction, the realization
+# takes a few exact events instead. All the realizations of an ensemble advance together, each with its own
+# time and its own random stream.
+
+REACTIONS = ('infection', 'recovery', 'waning', 'death_I', 'death_R')
+
+# Change of (S, I, R) by each reaction
+STOICHIOMETRY = np.array([[-1, 1, 0],
+                          [0, -1, 1],
+                          [1, 0, -1],
+                          [1, -1, 0],
+                          [1, 0, -1]])
+
+# Highest order of the reactions consuming each compartment, for the leap selection
+HIGHEST_ORDER = np.array([2.0, 2.0, 1.0])
+
+METHODS = ('auto', 'exact', 'tau_leaping')
+
+# 'auto' simulates populations up to this size with the exact method
+EXACT_POPULATION = 10_000
+
+# Largest relative change of the propensities over a leap
+EPSILON = 0.03
+
+# Longest leap in years, so beta(t) is close to constant over it
+MAX_LEAP = 1 / 365
+
+# A leap shorter than this many expected events is replaced by as many exact events
+EXACT_EVENTS = 10
+
+def propensities(t, X, population, mu, b0, b1, phi, gamma, ni, beta=None):
+    """Rates of the REACTIONS.
+
+    Parameters:
+    - t (numpy.ndarray): (M,) times.
+    - X (numpy.ndarray): (M, 3) counts S, I, R.
+    - population (int): Population size P.
+    - mu, b0, b1, phi, gamma, ni (float): Model parameters.
+    - beta (float): Transmission rate to use instead of beta(t), e.g. its bound.
+
+    Returns:
+    - numpy.ndarray: (M, 5) propensities.
+    """
+    S, I, R = X[:, 0], X[:, 1], X[:, 2]
+    beta = b0 * seasonality(t, b1, phi) if beta is None else beta
+    return np.stack([beta * S * I / population, ni * I, gamma * R, mu * I, mu * R], axis=1)
+
+def initial_counts(population, S_in, I_in, R_in):
+    """Round the initial fractions of the scripts to counts summing to population.
+
+    Returns:
+    - numpy.ndarray: (3,) counts S, I, R.
+    """
+    I, R = round(I_in * population), round(R_in * population)
+    return np.array([population - I - R, I, R])
+
+def _exact_events(t, X, rows, T, u, rates):
+    """Advance the given realizations by one thinned candidate event, or to T if it comes later.
+
+    Returns:
+    - int: Accepted events.
+    - int: Rejected candidates.
+    """
+    bound = propensities(t[rows], X[rows], **rates, beta=rates['b0'] * (1 + abs(rates['b1']))).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        t_candidate = t[rows] - np.log1p(-u[:, 0]) / bound
+    fire = t_candidate <= T
+    # No candidate before T: by the memoryless property the realization can restart from T
+    t[rows[~fire]] = T
+    rows, t_candidate, bound, u = rows[fire], t_candidate[fire], bound[fire], u[fire]
+    # Reaction whose cumulative propensity first exceeds u bound; len(REACTIONS) rejects the candidate
+    cumulative = np.cumsum(propensities(t_candidate, X[rows], **rates), axis=1)
+    reaction = (cumulative <= (u[:, 1] * bound)[:, None]).sum(axis=1)
+    accepted = reaction < len(REACTIONS)
+    X[rows[accepted]] += STOICHIOMETRY[reaction[accepted]]
+    t[rows] = t_candidate
+    return int(accepted.sum()), int((~accepted).sum())
+
+def _leap_sizes(X, a, epsilon):
+    """Leap of every realization keeping the relative change of the propensities below epsilon."""
+    mean = a @ STOICHIOMETRY
+    variance = a @ STOICHIOMETRY ** 2
+    change = np.maximum(epsilon * X / HIGHEST_ORDER, 1.0)
+    with np.errstate(divide='ignore'):
+        tau = np.minimum(change / np.abs(mean), change ** 2 / variance)
+    return tau.min(axis=1)
+
+def gillespie_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, population, S_in, I_in, R_in,
+                       method='auto', seed=None, first_realization=0, epsilon=EPSILON, max_leap=MAX_LEAP,
+                       exact_population=EXACT_POPULATION):
+    """Simulate M realizations of the finite-population model.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - t_in (int): Initial time.
+    - t_end (int): End time.
+    - N (int): Number of output intervals, as the steps of Euler_Maruyama_ensemble.
+    - mu, b0, b1, phi, gamma, ni (float): Model parameters.
+    - population (int): Population size P.
+    - S_in, I_in, R_in (float): Initial fractions, rounded to counts.
+    - method (str): 'exact', 'tau_leaping', or 'auto' for exact up to exact_population.
+    - seed (int): Seed of the ensemble, realization r uses the r-th spawned stream.
+    - first_realization (int): Index of the first realization, to simulate a slice of a larger ensemble.
+    - epsilon (float): Largest relative change of the propensities over a leap.
+    - max_leap (float): Longest leap in years.
+    - exact_population (int): Largest population simulated exactly by 'auto'.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) integer array of S, I, R counts.
+    - dict: 'method' used, 'events' (exact events), 'rejected' (thinned candidates), 'leaps',
+      'rejected_leaps' (leaps halved because a count went negative) and 'extinction_times', the first
+      time step of each realization with I = 0 (NaN if the infection persisted).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+    if method == 'auto':
+        method = 'exact' if population <= exact_population else 'tau_leaping'
+    rates = {'population': population, 'mu': mu, 'b0': b0, 'b1': b1, 'phi': phi, 'gamma': gamma, 'ni': ni}
+
+    _, TS = time_grid(t_in, t_end, N)
+    uniforms = UniformBuffer(realization_streams(root_entropy(seed), range(first_realization, first_realization + M)))
+    X = np.tile(initial_counts(population, S_in, I_in, R_in), (M, 1))
+    t = np.full(M, TS[0])
+    # Leap bound of realizations whose last leap made a count negative
+    cap = np.full(M, np.inf)
+    info = {'method': method, 'events': 0, 'rejected': 0, 'leaps': 0, 'rejected_leaps': 0}
+
+    results = np.empty((M, TS.size, 3), dtype=np.int64)
+    results[:, 0] = X
+    for j in range(1, TS.size):
+        T = TS[j]
+        active = np.arange(M)
+        while active.size:
+            if method == 'exact':
+                exact = active
+            else:
+                a = propensities(t[active], X[active], **rates)
+                tau = _leap_sizes(X[active], a, epsilon)
+                with np.errstate(invalid='ignore'):
+                    short = tau * a.sum(axis=1) < EXACT_EVENTS
+                exact = active[short]
+                leap, a = active[~short], a[~short]
+                tau = np.minimum(np.minimum(tau[~short], cap[leap]), max_leap)
+                last = tau >= T - t[leap]
+                tau = np.where(last, T - t[leap], tau)
+                fired = poisson.ppf(uniforms.draw(leap, len(REACTIONS)), a * tau[:, None]).clip(0).astype(np.int64)
+                X_new = X[leap] + fired @ STOICHIOMETRY
+                valid = np.all(X_new >= 0, axis=1)
+                X[leap[valid]] = X_new[valid]
+                t[leap[valid]] = np.where(last[valid], T, t[leap[valid]] + tau[valid])
+                cap[leap[valid]] = np.inf
+                cap[leap[~valid]] = tau[~valid] / 2
+                info['leaps'] += int(valid.sum())
+                info['rejected_leaps'] += int((~valid).sum())
+            # Realizations without a useful leap take a few exact events
+            for _ in range(EXACT_EVENTS):
+                if not exact.size:
+                    break
+                events, rejected = _exact_events(t, X, exact, T, uniforms.draw(exact, 2), rates)
+                info['events'] += events
+                info['rejected'] += rejected
+                exact = exact[t[exact] < T]
+            active = active[t[active] < T]
+        results[:, j] = X
+
+    extinct = results[:, :, 1] == 0
+    info['extinction_times'] = np.where(extinct.any(axis=1), TS[extinct.argmax(axis=1)], np.nan)
+    return TS, results, info
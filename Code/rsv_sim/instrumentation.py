@@ -0,0 +1,262 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from pathlib import Path
+
+#############################################################################################################
+# Instrumentation
+# Opt-in counters and timers around the hot paths: Brownian increments, SDE steps, right-hand side
+# evaluations and solver work. A Recorder collects them while it is active (with Recorder(...) as r:).
+# Without one, every hook is a global lookup and a None test, and the hooks sit per chunk of steps or
+# per solver call rather than inside the vectorized arithmetic, so disabled instrumentation costs
+# nothing measurable. Right-hand sides are only wrapped for counting when a recorder is active.
+# Metrics of worker processes are recorded there and merged into the parent's recorder.
+#
+# Counters: rng_normals, sde_steps, sde_realization_steps, sde_rejected_steps, realizations,
+#           rhs_evaluations, ode_steps, ode_rejected_steps (explicit Runge-Kutta), jacobian_evaluations,
+#           lu_decompositions
+# Timers:   rng, sde_step, ensemble, ode_solve
+
+FORMATS = ('jsonl', 'prometheus')
+
+# Prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = 'rsv_sim'
+
+_active = None
+
+class Recorder:
+    """Counters and timers of one run, active between __enter__ and __exit__."""
+
+    def __init__(self, **labels):
+        """Parameters:
+        - labels: Run labels (scenario, model...) written with the metrics.
+        """
+        self.labels = labels
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda: [0.0, 0])
+        self._previous = None
+        self._start = None
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self.add_time('wall', time.perf_counter() - self._start)
+        _active = self._previous
+        return False
+
+    def count(self, name, value=1):
+        """Add value to a counter."""
+        self.counters[name] += value
+
+    def add_time(self, name, seconds, calls=1):
+        """Add seconds (and calls) to a timer."""
+        timer = self.timers[name]
+        timer[0] += seconds
+        timer[1] += calls
+
+    def merge(self, snapshot):
+        """Add the counters and timers of a snapshot, e.g. from a worker process."""
+        for name, value in snapshot['counters'].items():
+            self.count(name, value)
+        for name, timer in snapshot['timers'].items():
+            if name != 'wall':
+                self.add_time(name, timer['seconds'], timer['calls'])
+
+    def snapshot(self):
+        """Current metrics.
+
+        Returns:
+        - dict: 'labels', 'counters' and 'timers' ({'seconds', 'calls'} by name), plus
+          'seconds_per_realization' when ensembles were timed.
+        """
+        snapshot = {
+            'labels': dict(self.labels),
+            'counters': dict(self.counters),
+            'timers': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.timers.items()},
+        }
+        if self.counters.get('realizations') and 'ensemble' in self.timers:
+            snapshot['seconds_per_realization'] = self.timers['ensemble'][0] / self.counters['realizations']
+        return snapshot
+
+class _Timer:
+    """Context manager adding its elapsed time to a timer of a recorder."""
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+_DISABLED = nullcontext()
+
+def enabled():
+    """Whether a recorder is active."""
+    return _active is not None
+
+def count(name, value=1):
+    """Add value to a counter of the active recorder, if any."""
+    if _active is not None:
+        _active.count(name, value)
+
+def timer(name):
+    """Context manager timing its block into the active recorder, a no-op without one."""
+    return _DISABLED if _active is None else _Timer(_active, name)
+
+def value(name):
+    """Current value of a counter of the active recorder, 0 without one."""
+    return 0 if _active is None else _active.counters.get(name, 0)
+
+def counted(fun, name='rhs_evaluations', columns=False):
+    """Wrap a right-hand side so that its calls are counted, only while a recorder is active.
+
+    Parameters:
+    - fun (function): fun(t, y, ...).
+    - name (str): Counter to increment.
+    - columns (bool): Count one evaluation per column of a 2-D y (vectorized solvers).
+
+    Returns:
+    - function: fun itself without an active recorder, a counting wrapper otherwise.
+    """
+    if _active is None:
+        return fun
+    recorder = _active
+
+    def wrapper(t, y, *args):
+        recorder.count(name, y.shape[1] if columns and getattr(y, 'ndim', 1) == 2 else 1)
+        return fun(t, y, *args)
+    return wrapper
+
+def record_solver(stats):
+    """Add the work reported by an ODE solver ('steps', 'nfev', 'njev', 'nlu') to the active recorder."""
+    if _active is None:
+        return
+    for key, name in (('steps', 'ode_steps'), ('njev', 'jacobian_evaluations'), ('nlu', 'lu_decompositions')):
+        if stats.get(key):
+            _active.count(name, stats[key])
+
+def collect(instrumented, function, *args, **kwargs):
+    """Call function, recording its metrics when the caller is instrumented (for worker processes).
+
+    Returns:
+    - object: Result of function.
+    - dict: Snapshot of its metrics, None if not instrumented.
+    """
+    if not instrumented:
+        return function(*args, **kwargs), None
+    with Recorder() as recorder:
+        result = function(*args, **kwargs)
+    return result, recorder.snapshot()
+
+def merge(snapshot):
+    """Merge a worker's snapshot (see collect) into the active recorder."""
+    if _active is not None and snapshot is not None:
+        _active.merge(snapshot)
+
+def to_json_line(snapshot):
+    """One JSON line of a snapshot, with a timestamp."""
+    return json.dumps({'timestamp': time.time(), **snapshot}, sort_keys=True)
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def to_prometheus(snapshots, prefix=PROMETHEUS_PREFIX):
+    """Snapshots in the Prometheus text exposition format, one sample per snapshot and metric.
+
+    Counters become <prefix>_<name>_total, timers <prefix>_<name>_seconds_total and
+    <prefix>_<name>_calls_total, each labelled with the labels of its snapshot.
+
+    Returns:
+    - str: Exposition text.
+    """
+    families = defaultdict(list)
+    for snapshot in snapshots:
+        labels = _prometheus_labels(snapshot['labels'])
+        for name, value in snapshot['counters'].items():
+            families[f'{prefix}_{name}_total'].append(f'{labels} {value}')
+        for name, timer in snapshot['timers'].items():
+            families[f'{prefix}_{name}_seconds_total'].append(f'{labels} {timer["seconds"]:.9g}')
+            families[f'{prefix}_{name}_calls_total'].append(f'{labels} {timer["calls"]}')
+    lines = []
+    for family in sorted(families):
+        lines.append(f'# TYPE {family} counter')
+        lines.extend(family + sample for sample in families[family])
+    return '\n'.join(lines) + '\n'
+
+def write_metrics(path, snapshots, format='jsonl'):
+    """Write snapshots to a file: appended as JSON lines, or replaced as a Prometheus text file.
+
+    Parameters:
+    - path (str): Output file.
+    - snapshots (list): Snapshots of Recorder.snapshot.
+    - format (str): One of FORMATS.
+    """
+    path = Path(path)
+    if format == 'jsonl':
+        with path.open('a') as f:
+            for snapshot in snapshots:
+                f.write(to_json_line(snapshot) + '\n')
+    elif format == 'prometheus':
+        # Written beside and renamed, so a scraper never reads half a file
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(to_prometheus(snapshots))
+        tmp.replace(path)
+    else:
+        raise ValueError(f"Unknown metrics format '{format}', expected one of {FORMATS}")
+
+#############################################################################################################
+# Profiling
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+def profiled(profiler, directory, function, *args, **kwargs):
+    """Run function under a profiler and write its report to directory.
+
+    cProfile writes profile.prof (for pstats or snakeviz) and profile.txt, the 40 most expensive
+    functions by cumulative time; pyinstrument, if installed, writes profile.html and profile.txt.
+
+    Returns:
+    - object: Result of function.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if profiler == 'cprofile':
+        import cProfile
+        import io
+        import pstats
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(directory / 'profile.prof')
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(40)
+            (directory / 'profile.txt').write_text(report.getvalue())
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("pyinstrument is not installed, use the cprofile profiler or pip install pyinstrument")
+        profile = Profiler()
+        profile.start()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.stop()
+            (directory / 'profile.txt').write_text(profile.output_text())
+            (directory / 'profile.html').write_text(profile.output_html())
+    raise ValueError(f"Unknown profiler '{profiler}', expected one of {PROFILERS}")
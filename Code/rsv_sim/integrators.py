@@ -0,0 +1,570 @@
+import numpy as np
+
+from rsv_sim import instrumentation
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, NormalBuffer, increment_chunks, realization_streams, root_entropy
+from rsv_sim.sde import NOISE_DIMENSIONS, STEPS, Euler_Maruyama_ensemble, time_grid
+
+#############################################################################################################
+# Higher-order and adaptive SDE integrators
+# The perturbations of b0 (and mu) that the Euler-Maruyama scripts add inside the drift contribute
+# alpha dW dt per step, which vanishes as dt -> 0. The schemes below integrate the limiting SDEs:
+#
+# transmission:  dS = a_S dt - alpha s(t) S I dW_1,   dI = a_I dt - alpha s(t) S I dW_2,   dR = a_R dt
+# birth:         dS = a_S dt + alpha (1 - S) dW_S,    dI = a_I dt - alpha I dW_I,        dR = a_R dt - alpha R dW_R
+#
+# with s(t) = 1 + b1 cos(2 pi t + phi) and a the drift of the deterministic model.
+#
+# The birth model has diagonal noise (each compartment is driven by its own Wiener process with a
+# coefficient depending only on itself), so Milstein is strong order 1 and the Ito-Taylor scheme
+# 'taylor15' strong order 1.5. The transmission noise is non-commutative: Milstein needs the Levy
+# area of (W_1, W_2), approximated with the Kloeden-Platen-Wright series, and no order 1.5 scheme
+# is offered. With a fixed number of terms p the area is off by O(dt / sqrt(p)) at every step, so the
+# transmission Milstein scheme is strong order 1 only with p growing as 1/dt; with the default p = 0
+# it is order 0.5 as dt -> 0. Its area terms are scaled by alpha^2 S^2 I, so at the model's
+# prevalences the order 0.5 error stays below the order 1 one until dt is far smaller.
+
+SCHEMES = ('euler_maruyama', 'semi_implicit', 'milstein', 'taylor15', 'adaptive')
+
+# Number of Wiener processes of the limiting SDE
+WIENER_DIMENSIONS = {'transmission': 2, 'birth': 3}
+
+def seasonality(t, b1, phi):
+    """s(t) = 1 + b1 cos(2 pi t + phi)."""
+    return 1 + b1 * np.cos(2 * np.pi * t + phi)
+
+def drift(t, X, mu, b0, b1, phi, gamma, ni):
+    """Drift of the SIR model for an (M, 3) state.
+
+    Returns:
+    - numpy.ndarray: (M, 3) drift.
+    """
+    S, I, R = X[:, 0], X[:, 1], X[:, 2]
+    beta = b0 * seasonality(t, b1, phi)
+    a = np.empty_like(X)
+    a[:, 0] = mu - mu * S - beta * S * I + gamma * R
+    a[:, 1] = beta * S * I - ni * I - mu * I
+    a[:, 2] = ni * I - mu * R - gamma * R
+    return a
+
+def drift_jacobian(t, X, mu, b0, b1, phi, gamma, ni):
+    """Jacobian of the drift with respect to (S, I, R).
+
+    Returns:
+    - numpy.ndarray: (M, 3, 3) array, J[m, k, l] = d a_k / d x_l.
+    """
+    S, I = X[:, 0], X[:, 1]
+    beta = b0 * seasonality(t, b1, phi)
+    J = np.zeros((X.shape[0], 3, 3))
+    J[:, 0, 0] = -mu - beta * I
+    J[:, 0, 1] = -beta * S
+    J[:, 0, 2] = gamma
+    J[:, 1, 0] = beta * I
+    J[:, 1, 1] = beta * S - ni - mu
+    J[:, 2, 1] = ni
+    J[:, 2, 2] = -mu - gamma
+    return J
+
+def drift_time_derivative(t, X, mu, b0, b1, phi, gamma, ni):
+    """Partial derivative of the drift with respect to t (through beta(t)).
+
+    Returns:
+    - numpy.ndarray: (M, 3) array.
+    """
+    dbeta = -2 * np.pi * b0 * b1 * np.sin(2 * np.pi * t + phi)
+    SI = X[:, 0] * X[:, 1]
+    out = np.zeros_like(X)
+    out[:, 0] = -dbeta * SI
+    out[:, 1] = dbeta * SI
+    return out
+
+def birth_diffusion(X, alpha):
+    """Diagonal diffusion of the birth model, (M, 3) coefficients of dW_S, dW_I, dW_R."""
+    return alpha * np.stack([1 - X[:, 0], -X[:, 1], -X[:, 2]], axis=1)
+
+#############################################################################################################
+# Steps
+# dW holds the Wiener increments over the step, (M, 2) for transmission and (M, 3) for birth.
+
+def levy_area(dt, normals, terms):
+    """Kloeden-Platen-Wright approximation of the Levy area of two Wiener processes.
+
+    Parameters:
+    - dt (float): Time step.
+    - normals (numpy.ndarray): (M, 4 + 4 * terms) standard normals; the first two are the
+      normalized increments xi_1 = dW_1 / sqrt(dt) and xi_2.
+    - terms (int): Number of terms p of the series.
+
+    Returns:
+    - numpy.ndarray: (M,) areas A_12, such that I_(1,2) = dW_1 dW_2 / 2 + A_12.
+    """
+    xi1, xi2, mu1, mu2 = normals[:, 0], normals[:, 1], normals[:, 2], normals[:, 3]
+    r = np.arange(1, terms + 1)
+    rho = 1 / 12 - (1 / r ** 2).sum() / (2 * np.pi ** 2)
+    A = dt * np.sqrt(rho) * (mu1 * xi2 - mu2 * xi1)
+    if terms:
+        zeta1, zeta2, eta1, eta2 = (normals[:, 4 + i * terms:4 + (i + 1) * terms] for i in range(4))
+        A += dt / (2 * np.pi) * ((zeta1 * (np.sqrt(2) * xi2[:, None] + eta2)
+                                  - zeta2 * (np.sqrt(2) * xi1[:, None] + eta1)) / r).sum(axis=1)
+    return A
+
+def transmission_milstein_step(t, dt, X, dW, A, mu, b0, b1, phi, gamma, ni, alpha):
+    """Milstein step of the transmission model.
+
+    Parameters:
+    - t (float): Time at the beginning of the step, or (M,) times.
+    - dt (float): Time step, or (M,) steps.
+    - X (numpy.ndarray): (M, 3) state.
+    - dW (numpy.ndarray): (M, 2) increments of W_1 (S) and W_2 (I).
+    - A (numpy.ndarray): (M,) Levy areas, or 0 to keep only the symmetric part of I_(1,2).
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+
+    Returns:
+    - numpy.ndarray: (M, 3) state at t + dt.
+    """
+    S, I = X[:, 0], X[:, 1]
+    s = seasonality(t, b1, phi)
+    g = -alpha * s * S * I
+    # L^1 g = alpha^2 s^2 S I^2 and L^2 g = alpha^2 s^2 S^2 I, for both the S and the I coefficient
+    c1 = (alpha * s) ** 2 * S * I * I
+    c2 = (alpha * s) ** 2 * S * S * I
+    I12 = dW[:, 0] * dW[:, 1] / 2 + A
+    I21 = dW[:, 0] * dW[:, 1] / 2 - A
+
+    X_new = X + drift(t, X, mu, b0, b1, phi, gamma, ni) * np.reshape(dt, (-1, 1))
+    X_new[:, 0] += g * dW[:, 0] + c1 * (dW[:, 0] ** 2 - dt) / 2 + c2 * I21
+    X_new[:, 1] += g * dW[:, 1] + c1 * I12 + c2 * (dW[:, 1] ** 2 - dt) / 2
+    return X_new
+
+def birth_milstein_step(t, dt, X, dW, A, mu, b0, b1, phi, gamma, ni, alpha):
+    """Milstein step of the birth model (diagonal noise, A is ignored).
+
+    Parameters are those of transmission_milstein_step, with (M, 3) increments dW.
+
+    Returns:
+    - numpy.ndarray: (M, 3) state at t + dt.
+    """
+    b = birth_diffusion(X, alpha)
+    dt = np.reshape(dt, (-1, 1))
+    # Each coefficient is linear in its own compartment with slope -alpha
+    return X + drift(t, X, mu, b0, b1, phi, gamma, ni) * dt + b * dW - alpha * b * (dW ** 2 - dt) / 2
+
+def birth_taylor15_step(t, dt, X, dW, dZ, mu, b0, b1, phi, gamma, ni, alpha):
+    """Strong order 1.5 Ito-Taylor step of the birth model.
+
+    Parameters:
+    - dW (numpy.ndarray): (M, 3) Wiener increments.
+    - dZ (numpy.ndarray): (M, 3) integrals of W(s) - W(t) over the step.
+
+    Returns:
+    - numpy.ndarray: (M, 3) state at t + dt.
+    """
+    params = (mu, b0, b1, phi, gamma, ni)
+    a = drift(t, X, *params)
+    J = drift_jacobian(t, X, *params)
+    b = birth_diffusion(X, alpha)
+
+    L0a = drift_time_derivative(t, X, *params) + np.einsum('mkl,ml->mk', J, a)   # second derivatives vanish on the diagonal
+    La = np.einsum('mkl,ml->mk', J, b * dZ)                                       # sum_j L^j a_k dZ_j
+    Lb = -alpha * b                                                                # L^k b_k
+    L0b = -alpha * a                                                               # L^0 b_k
+    LLb = alpha ** 2 * b                                                           # L^k L^k b_k
+
+    return (X + a * dt + b * dW + Lb * (dW ** 2 - dt) / 2 + La + L0b * (dW * dt - dZ)
+            + L0a * dt ** 2 / 2 + LLb * (dW ** 2 / 3 - dt) * dW / 2)
+
+MILSTEIN_STEPS = {
+    'transmission': transmission_milstein_step,
+    'birth': birth_milstein_step,
+}
+
+#############################################################################################################
+# Ensembles
+
+def _normals_per_step(model, scheme, levy_terms):
+    if scheme == 'milstein':
+        return 4 + 4 * levy_terms if model == 'transmission' else 3
+    if scheme == 'taylor15':
+        if model != 'birth':
+            raise ValueError("taylor15 needs diagonal noise, only the birth model has it")
+        return 6
+    raise ValueError(f"Unknown fixed-step scheme '{scheme}'")
+
+def fixed_step_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                        model='transmission', scheme='milstein', seed=None, first_realization=0,
+                        chunk_size=DEFAULT_CHUNK_SIZE, levy_terms=0):
+    """Simulate M realizations with the Milstein or the order 1.5 Ito-Taylor scheme.
+
+    Parameters and returns are those of Euler_Maruyama_ensemble, plus:
+    - scheme (str): 'milstein' or 'taylor15' (birth model only).
+    - levy_terms (int): Terms of the Levy area series for the transmission Milstein scheme. The
+      default 0 makes it strong order 0.5; order 1 needs terms proportional to 1 / dt.
+    """
+    params = (mu, b0, b1, phi, gamma, ni, alpha)
+    n_normals = _normals_per_step(model, scheme, levy_terms)
+    n_wiener = WIENER_DIMENSIONS[model]
+
+    dt, TS = time_grid(t_in, t_end, N)
+    sqrt_dt = np.sqrt(dt)
+    streams = realization_streams(root_entropy(seed), range(first_realization, first_realization + M))
+
+    results = np.empty((M, TS.size, 3))
+    results[:, 0] = S_in, I_in, R_in
+    i = 1
+    # dt = 1 gives standard normals, scaled below
+    for normals in increment_chunks(streams, N, n_normals, 1.0, chunk_size):
+        for xi in normals:
+            t = t_in + (i - 1) * dt
+            X = results[:, i - 1]
+            if scheme == 'milstein':
+                A = levy_area(dt, xi, levy_terms) if model == 'transmission' else 0
+                results[:, i] = MILSTEIN_STEPS[model](t, dt, X, sqrt_dt * xi[:, :n_wiener], A, *params)
+            else:
+                U1, U2 = xi[:, :3], xi[:, 3:]
+                dZ = dt * sqrt_dt * (U1 + U2 / np.sqrt(3)) / 2
+                results[:, i] = birth_taylor15_step(t, dt, X, sqrt_dt * U1, dZ, *params)
+            i += 1
+    return TS, results
+
+def adaptive_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                      model='transmission', seed=None, first_realization=0, rtol=1e-3, atol=1e-6,
+                      h_initial=None, h_min=1e-7, h_max=None):
+    """Simulate M realizations with adaptive Milstein steps and Brownian-bridge rejection.
+
+    Every realization controls its own step size by step doubling: a step is accepted when one
+    step of h and two steps of h/2 agree within atol + rtol |X|. A rejected step keeps its
+    Brownian path: the increments are split with the Brownian bridge and the unused parts are
+    consumed by the following steps, so rejections do not bias the noise. A realization only
+    depends on its own stream, so results do not depend on the ensemble it is simulated in.
+    The state is reported on the time grid of N steps of Euler_Maruyama_ensemble.
+    The transmission model is integrated without the Levy area term.
+
+    Parameters are those of Euler_Maruyama_ensemble, plus:
+    - rtol, atol (float): Tolerances of the local error.
+    - h_initial (float): First step, the output step if None.
+    - h_min (float): Steps below this size are accepted whatever their error.
+    - h_max (float): Largest step, the output step if None.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) array of simulated S, I, R populations.
+    - dict: Numbers of accepted and rejected steps, summed over the realizations, and of
+      'iterations' of the ensemble loop.
+    """
+    params = (mu, b0, b1, phi, gamma, ni, alpha)
+    step = MILSTEIN_STEPS[model]
+    n_wiener = WIENER_DIMENSIONS[model]
+    dt_out, TS = time_grid(t_in, t_end, N)
+    h_max = dt_out if h_max is None else h_max
+
+    normals = NormalBuffer(realization_streams(root_entropy(seed), range(first_realization, first_realization + M)))
+    # Future Brownian path of each realization as a stack of (length, increments) segments, next segment last
+    pending = [[] for _ in range(M)]
+    has_pending = np.zeros(M, dtype=bool)
+
+    def increment(m, length):
+        """Wiener increments of realization m over the next `length` of time, consistent with its pending path."""
+        total = np.zeros(n_wiener)
+        remaining = length
+        while remaining > 1e-12 * length:
+            if pending[m]:
+                segment, dW = pending[m].pop()
+            else:
+                segment, dW = remaining, np.sqrt(remaining) * normals.draw(np.array([m]), n_wiener)[0]
+            if segment > remaining * (1 + 1e-12):
+                # Brownian bridge: split the segment at `remaining`
+                fraction = remaining / segment
+                first = fraction * dW + np.sqrt(remaining * (1 - fraction)) * normals.draw(np.array([m]), n_wiener)[0]
+                pending[m].append((segment - remaining, dW - first))
+                segment, dW = remaining, first
+            total += dW
+            remaining -= segment
+        has_pending[m] = bool(pending[m])
+        return total
+
+    results = np.empty((M, TS.size, 3))
+    results[:, 0] = S_in, I_in, R_in
+    X = results[:, 0].copy()
+    t = np.full(M, float(t_in))
+    h = np.full(M, min(h_max, dt_out if h_initial is None else h_initial))
+    # Index of the next output time of each realization
+    j = np.ones(M, dtype=int)
+    accepted = rejected = iterations = 0
+    active = np.arange(M) if TS.size > 1 else np.arange(0)
+    while active.size:
+        iterations += 1
+        h[active] = np.minimum(h[active], TS[j[active]] - t[active])
+        ha, ta, Xa = h[active], t[active], X[active]
+        # Realizations without a pending path draw both halves at once
+        fresh = ~has_pending[active]
+        if fresh.all():
+            xi = normals.draw(active, 2 * n_wiener)
+            root = np.sqrt(ha / 2)[:, None]
+            dW1, dW2 = root * xi[:, :n_wiener], root * xi[:, n_wiener:]
+        else:
+            dW1 = np.empty((active.size, n_wiener))
+            dW2 = np.empty((active.size, n_wiener))
+            if fresh.any():
+                xi = normals.draw(active[fresh], 2 * n_wiener)
+                root = np.sqrt(ha[fresh] / 2)[:, None]
+                dW1[fresh] = root * xi[:, :n_wiener]
+                dW2[fresh] = root * xi[:, n_wiener:]
+            for k in np.flatnonzero(~fresh):
+                dW1[k] = increment(active[k], ha[k] / 2)
+                dW2[k] = increment(active[k], ha[k] / 2)
+
+        full = step(ta, ha, Xa, dW1 + dW2, 0, *params)
+        half = step(ta + ha / 2, ha / 2, step(ta, ha / 2, Xa, dW1, 0, *params), dW2, 0, *params)
+        scale = atol + rtol * np.maximum(np.abs(Xa), np.abs(half))
+        error = np.max(np.abs(full - half) / scale, axis=1)
+        error[~np.isfinite(error)] = np.inf
+        accept = (error <= 1) | (ha <= h_min)
+        n_accepted = int(np.count_nonzero(accept))
+        accepted += n_accepted
+        rejected += active.size - n_accepted
+
+        for k in np.flatnonzero(~accept) if n_accepted < active.size else ():
+            pending[active[k]].append((ha[k] / 2, dW2[k]))
+            pending[active[k]].append((ha[k] / 2, dW1[k]))
+            has_pending[active[k]] = True
+        done = active[accept]
+        X[done] = half[accept]
+        t[done] += ha[accept]
+
+        # 0.9 error^-1/2, at most doubling (also for a zero error) and at least a fifth
+        factor = np.minimum(2.0, np.maximum(0.2, 0.9 / np.sqrt(np.maximum(error, 1e-300))))
+        h[active] = np.minimum(h_max, np.maximum(h_min, ha * factor))
+
+        # Realizations reaching their next output time record it
+        arrived = done[TS[j[done]] - t[done] <= 1e-12 * dt_out]
+        t[arrived] = TS[j[arrived]]
+        results[arrived, j[arrived]] = X[arrived]
+        j[arrived] += 1
+        active = np.flatnonzero(j < TS.size)
+    return TS, results, {'accepted': accepted, 'rejected': rejected, 'iterations': iterations}
+
+def semi_implicit_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                           model='transmission', seed=None, first_realization=0, chunk_size=DEFAULT_CHUNK_SIZE,
+                           out=None):
+    """Simulate M realizations with the linearly implicit (semi-implicit) Euler-Maruyama method.
+
+    Each step takes the Euler-Maruyama increment of the scripts, with the same Brownian increments
+    as Euler_Maruyama_ensemble, and solves it against the drift Jacobian:
+    X_{n+1} = X_n + (I - dt J(t_n, X_n))^{-1} (X_{n+1}^EM - X_n).
+    The fast recovery rate ni no longer bounds the step, so long horizons can use steps of weeks.
+
+    Parameters and returns are those of Euler_Maruyama_ensemble (without backend).
+    """
+    step = STEPS[model]
+    params = (mu, b0, b1, phi, gamma, ni)
+    dt, TS = time_grid(t_in, t_end, N)
+    streams = realization_streams(root_entropy(seed), range(first_realization, first_realization + M))
+
+    results = np.empty((M, TS.size, 3)) if out is None else out
+    results[:, 0] = S_in, I_in, R_in
+    identity = np.eye(3)
+    i = 1
+    for increments in increment_chunks(streams, N, NOISE_DIMENSIONS[model], dt, chunk_size):
+        for dW in increments:
+            t = t_in + (i - 1) * dt
+            X = results[:, i - 1]
+            explicit = step(t, dt, X, dW, *params, alpha) - X
+            matrix = identity - dt * drift_jacobian(t, X, *params)
+            results[:, i] = X + np.linalg.solve(matrix, explicit[:, :, None])[:, :, 0]
+            i += 1
+    return TS, results
+
+def simulate_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                      model='transmission', scheme='euler_maruyama', seed=None, **options):
+    """Simulate M realizations of an SDE model with the chosen scheme.
+
+    Parameters are those of Euler_Maruyama_ensemble, plus:
+    - scheme (str): One of SCHEMES.
+    - options: Scheme-specific options (first_realization, chunk_size, out, levy_terms, rtol, atol...);
+      chunk_size is ignored by the adaptive scheme.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) array of simulated S, I, R populations.
+    """
+    args = (M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in)
+    if scheme == 'euler_maruyama':
+        # Instrumented by Euler_Maruyama_ensemble itself
+        return Euler_Maruyama_ensemble(*args, model=model, seed=seed, **options)
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown scheme '{scheme}', expected one of {SCHEMES}")
+    out = None if scheme == 'semi_implicit' else options.pop('out', None)
+    steps, realization_steps = N, N * M
+    with instrumentation.timer('ensemble'):
+        if scheme == 'semi_implicit':
+            TS, results = semi_implicit_ensemble(*args, model=model, seed=seed, **options)
+        elif scheme == 'adaptive':
+            options.pop('chunk_size', None)
+            TS, results, work = adaptive_ensemble(*args, model=model, seed=seed, **options)
+            steps, realization_steps = work['iterations'], work['accepted']
+            instrumentation.count('sde_rejected_steps', work['rejected'])
+        else:
+            TS, results = fixed_step_ensemble(*args, model=model, scheme=scheme, seed=seed, **options)
+    instrumentation.count('sde_steps', steps)
+    instrumentation.count('sde_realization_steps', realization_steps)
+    instrumentation.count('realizations', M)
+    if out is not None:
+        out[...] = results
+        results = out
+    return TS, results
+
+#############################################################################################################
+# Convergence study
+
+def _aggregate_path(dW_fine, dt_fine, n_steps):
+    """Increments, time integrals and Levy areas of a fine Brownian path over n_steps coarse steps.
+
+    Parameters:
+    - dW_fine (numpy.ndarray): (M, F, m) increments on F fine steps.
+    - dt_fine (float): Fine step.
+    - n_steps (int): Number of coarse steps, dividing F.
+
+    Returns:
+    - numpy.ndarray: (M, n_steps, m) increments dW.
+    - numpy.ndarray: (M, n_steps, m) integrals dZ of W(s) - W(t_n) over each step.
+    - numpy.ndarray: (M, n_steps) Levy areas of the first two components (zeros if m < 2).
+    """
+    M, F, m = dW_fine.shape
+    dW = dW_fine.reshape(M, n_steps, F // n_steps, m)
+    W_before = np.cumsum(dW, axis=2) - dW             # path relative to the start of each coarse step
+    dZ = ((W_before + dW / 2) * dt_fine).sum(axis=2)  # exact for the piecewise linear path
+    if m >= 2:
+        A = ((W_before[..., 0] * dW[..., 1] - W_before[..., 1] * dW[..., 0]) / 2).sum(axis=2)
+    else:
+        A = np.zeros((M, n_steps))
+    return dW.sum(axis=2), dZ, A
+
+def _kpw_normals(dW_fine, dt_fine, n_steps, terms, rng):
+    """Normals of levy_area on n_steps coarse steps of a fine Brownian path.
+
+    xi is the normalized coarse increment and zeta, eta are the scaled Fourier coefficients of the
+    Brownian bridge over each step, projected from the piecewise linear fine path, so that the
+    series converges to the area of the path. The tail normals mu are drawn from rng, as in
+    fixed_step_ensemble.
+
+    Parameters:
+    - dW_fine (numpy.ndarray): (M, F, 2) increments on F fine steps.
+    - dt_fine (float): Fine step.
+    - n_steps (int): Number of coarse steps, dividing F.
+    - terms (int): Number of terms p, at most a quarter of the fine steps per coarse step.
+    - rng (numpy.random.Generator): Source of mu.
+
+    Returns:
+    - numpy.ndarray: (M, n_steps, 4 + 4 * terms) normals.
+    """
+    M, F, m = dW_fine.shape
+    k = F // n_steps
+    if 4 * terms > k:
+        raise ValueError(f"{terms} Levy area terms need {4 * terms} fine steps per coarse step, the path "
+                         f"has {k} on {n_steps} steps")
+    dt = dt_fine * k
+    W = np.cumsum(dW_fine.reshape(M, n_steps, k, m), axis=2)
+    W = np.concatenate([np.zeros((M, n_steps, 1, m)), W], axis=2)
+    s = np.linspace(0, 1, k + 1)
+    bridge = W - s[:, None] * W[:, :, -1:, :]
+    weights = np.full(k + 1, 1 / k)                  # trapezoidal rule over the step
+    weights[[0, -1]] /= 2
+    r = np.arange(1, terms + 1)
+    angle = 2 * np.pi * np.outer(r, s)
+    scale = -2 * np.pi * r * np.sqrt(2 / dt)
+    zeta = scale * np.einsum('mnkj,rk,k->mnjr', bridge, np.cos(angle), weights)
+    eta = scale * np.einsum('mnkj,rk,k->mnjr', bridge, np.sin(angle), weights)
+    xi = W[:, :, -1, :2] / np.sqrt(dt)
+    return np.concatenate([xi, rng.standard_normal((M, n_steps, 2)), zeta[:, :, 0], zeta[:, :, 1],
+                           eta[:, :, 0], eta[:, :, 1]], axis=2)
+
+def _run_on_path(model, scheme, parameters, dW, dZ, A, dt, levy_normals=None, levy_terms=0):
+    """Integrate one scheme with given increments, returning the final (M, 3) state.
+
+    The transmission Milstein scheme uses the Levy areas A, or those of levy_area with levy_terms
+    terms if levy_normals (see _kpw_normals) are given.
+    """
+    p = parameters
+    params = (p['mu'], p['b0'], p['b1'], p['phi'], p['gamma'], p['ni'], p['alpha'])
+    M = dW.shape[0]
+    X = np.tile(np.array([p['S_in'], p['I_in'], p['R_in']], dtype=float), (M, 1))
+    for i in range(dW.shape[1]):
+        t = p['t_in'] + i * dt
+        if scheme == 'euler_maruyama':
+            X = _euler_step(model, t, dt, X, dW[:, i], params)
+        elif scheme == 'milstein':
+            if model != 'transmission':
+                area = 0
+            elif levy_normals is None:
+                area = A[:, i]
+            else:
+                area = levy_area(dt, levy_normals[:, i], levy_terms)
+            X = MILSTEIN_STEPS[model](t, dt, X, dW[:, i], area, *params)
+        elif scheme == 'taylor15':
+            X = birth_taylor15_step(t, dt, X, dW[:, i], dZ[:, i], *params)
+        else:
+            raise ValueError(f"Unknown scheme '{scheme}'")
+    return X
+
+def _euler_step(model, t, dt, X, dW, params):
+    """Euler-Maruyama step of the limiting SDE."""
+    mu, b0, b1, phi, gamma, ni, alpha = params
+    X_new = X + drift(t, X, mu, b0, b1, phi, gamma, ni) * dt
+    if model == 'transmission':
+        g = -alpha * seasonality(t, b1, phi) * X[:, 0] * X[:, 1]
+        X_new[:, 0] += g * dW[:, 0]
+        X_new[:, 1] += g * dW[:, 1]
+    else:
+        X_new += birth_diffusion(X, alpha) * dW
+    return X_new
+
+def convergence_study(parameters, model='birth', schemes=None, levels=(16, 32, 64, 128, 256, 512),
+                      reference_steps=4096, M=100, seed=0, levy_terms=0):
+    """Strong errors at the final time of each scheme against a fine-grid reference on the same paths.
+
+    A Brownian path is drawn on 4 * reference_steps steps; each scheme is run on coarser grids with
+    increments, time integrals and Levy areas aggregated from it, and compared with the most
+    accurate scheme of the model ('taylor15' for birth, 'milstein' with the exact areas of the path
+    for transmission) on reference_steps steps. The transmission Milstein scheme under study
+    approximates the areas with levy_area, as fixed_step_ensemble does.
+
+    Parameters:
+    - parameters (dict): t_in, t_end, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in (N is ignored).
+    - model (str): 'transmission' or 'birth'.
+    - schemes (tuple): Schemes to compare, every fixed-step scheme of the model if None.
+    - levels (tuple): Numbers of coarse steps, dividing reference_steps.
+    - reference_steps (int): Steps of the reference solution.
+    - M (int): Number of Brownian paths.
+    - seed (int): Seed of the paths.
+    - levy_terms (int): Terms of the Levy area series of the transmission Milstein scheme, or
+      'scaled' for levels[i] // levels[0] terms, proportional to 1 / dt.
+
+    Returns:
+    - dict: 'dt' of each level and, by scheme, 'errors' (mean over paths of the largest
+      compartment error at t_end) and the fitted strong 'order'.
+    """
+    reference_scheme = 'taylor15' if model == 'birth' else 'milstein'
+    if schemes is None:
+        schemes = ('euler_maruyama', 'milstein', 'taylor15') if model == 'birth' else ('euler_maruyama', 'milstein')
+    horizon = parameters['t_end'] - parameters['t_in']
+    finest = 4 * reference_steps
+    dt_fine = horizon / finest
+    rng = np.random.default_rng(seed)
+    dW_fine = np.sqrt(dt_fine) * rng.standard_normal((M, finest, WIENER_DIMENSIONS[model]))
+
+    reference = _run_on_path(model, reference_scheme, parameters,
+                             *_aggregate_path(dW_fine, dt_fine, reference_steps), horizon / reference_steps)
+    dts = np.array([horizon / n for n in levels])
+    study = {'dt': dts, 'reference': reference_scheme}
+    for scheme in schemes:
+        errors = []
+        for n in levels:
+            options = {}
+            if model == 'transmission' and scheme == 'milstein':
+                terms = n // levels[0] if levy_terms == 'scaled' else levy_terms
+                options = {'levy_normals': _kpw_normals(dW_fine, dt_fine, n, terms, rng), 'levy_terms': terms}
+            X = _run_on_path(model, scheme, parameters, *_aggregate_path(dW_fine, dt_fine, n), horizon / n, **options)
+            errors.append(np.abs(X - reference).max(axis=1).mean())
+        errors = np.array(errors)
+        order = np.polyfit(np.log(dts), np.log(errors), 1)[0]
+        study[scheme] = {'errors': errors, 'order': order}
+    return study
@@ -0,0 +1,169 @@
+import functools
+import importlib.util
+from collections.abc import Mapping
+
+import numpy as np
+
+#############################################################################################################
+# Compiled kernels
+# With Numba installed the hot loops below are compiled; otherwise the same functions fall back
+# to vectorized NumPy. BACKEND tells which one is in use. Numba is only imported, and the kernels
+# compiled, the first time a compiled kernel is used, so importing the package stays cheap.
+
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+BACKENDS = ('numba', 'numpy') if HAVE_NUMBA else ('numpy',)
+BACKEND = BACKENDS[0]
+
+def resolve_backend(backend=None):
+    """Pick the kernel backend.
+
+    Parameters:
+    - backend (str): 'numba', 'numpy' or None for the fastest available.
+
+    Returns:
+    - str: Backend name.
+    """
+    if backend is None:
+        return BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend '{backend}' is not available, expected one of {BACKENDS}")
+    return backend
+
+#############################################################################################################
+# Deterministic SIR model
+
+def _sir_rhs(t, y, b0, b1, phi, mu, gamma, ni):
+    beta = b0 * (1 + b1 * np.cos(2 * np.pi * t + phi))
+    S, I, R = y[0], y[1], y[2]
+    dy = np.empty(3)
+    dy[0] = mu - mu * S - beta * S * I + gamma * R
+    dy[1] = beta * S * I - ni * I - mu * I
+    dy[2] = ni * I - mu * R - gamma * R
+    return dy
+
+def _rk4_sweep(t, Y0, substeps, b0, b1, phi, mu, gamma, ni, out):
+    P = Y0.shape[1]
+    y = np.empty(3)
+    for p in range(P):
+        for c in range(3):
+            y[c] = Y0[c, p]
+            out[p, 0, c] = y[c]
+        for j in range(1, t.size):
+            h = (t[j] - t[j - 1]) / substeps
+            for s in range(substeps):
+                tau = t[j - 1] + s * h
+                k1 = _sir_rhs_compiled(tau, y, b0[p], b1[p], phi[p], mu[p], gamma[p], ni[p])
+                k2 = _sir_rhs_compiled(tau + h / 2, y + h / 2 * k1, b0[p], b1[p], phi[p], mu[p], gamma[p], ni[p])
+                k3 = _sir_rhs_compiled(tau + h / 2, y + h / 2 * k2, b0[p], b1[p], phi[p], mu[p], gamma[p], ni[p])
+                k4 = _sir_rhs_compiled(tau + h, y + h * k3, b0[p], b1[p], phi[p], mu[p], gamma[p], ni[p])
+                y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            for c in range(3):
+                out[p, j, c] = y[c]
+    return out
+
+# Replaced by the compiled function in _compiled, before _rk4_sweep, which calls it, is compiled
+_sir_rhs_compiled = _sir_rhs
+
+def sir_rhs(t, y, b0, b1, phi, mu, gamma, ni):
+    """ODE system of the SIR model with positional parameters, compiled when Numba is available.
+
+    Parameters:
+    - t (float): Time.
+    - y (numpy.ndarray): S, I, R values.
+    - b0, b1, phi, mu, gamma, ni (float): Model parameters.
+
+    Returns:
+    - numpy.ndarray: Derivatives [dS/dt, dI/dt, dR/dt].
+    """
+    rhs = _compiled()['sir_rhs'] if HAVE_NUMBA else _sir_rhs
+    return rhs(t, np.asarray(y, dtype=float), b0, b1, phi, mu, gamma, ni)
+
+def rk4_sweep_compiled(t, Y0, substeps, b0, b1, phi, mu, gamma, ni):
+    """Compiled fixed-step RK4 over P parameter sets (see rsv_sim.ode.rk4_sweep).
+
+    Returns:
+    - numpy.ndarray: (P, len(t), 3) solution.
+    """
+    out = np.empty((Y0.shape[1], t.size, 3))
+    return _compiled()['rk4_sweep'](t, Y0, substeps, b0, b1, phi, mu, gamma, ni, out)
+
+#############################################################################################################
+# Euler-Maruyama chunks
+# A chunk kernel advances the (M, 3) state X0 through the K steps of increments (K, M, n_noise),
+# step0 being the index of the first step, and writes the K new states into out (M, K, 3).
+
+def _transmission_chunk(out, X0, step0, t_in, dt, increments, mu, b0, b1, phi, gamma, ni, alpha):
+    K = increments.shape[0]
+    seasonality = np.empty(K)
+    for k in range(K):
+        seasonality[k] = 1 + b1 * np.cos(2 * np.pi * (t_in + (step0 + k) * dt) + phi)
+    for m in range(X0.shape[0]):
+        S = X0[m, 0]
+        I = X0[m, 1]
+        R = X0[m, 2]
+        for k in range(K):
+            b0_tilde = b0 + alpha * increments[k, m, 0]
+            beta = b0_tilde * seasonality[k]
+            S_new = S + ((mu - mu * S - beta * S * I + gamma * R) * dt - (alpha / b0_tilde) * beta * S * I * increments[k, m, 1])
+            I_new = I + ((beta * S * I - ni * I - mu * I) * dt - (alpha / b0_tilde) * beta * S * I * increments[k, m, 2])
+            R_new = R + (ni * I - mu * R - gamma * R) * dt
+            S, I, R = S_new, I_new, R_new
+            out[m, k, 0] = S
+            out[m, k, 1] = I
+            out[m, k, 2] = R
+
+def _birth_chunk(out, X0, step0, t_in, dt, increments, mu, b0, b1, phi, gamma, ni, alpha):
+    K = increments.shape[0]
+    seasonality = np.empty(K)
+    for k in range(K):
+        seasonality[k] = 1 + b1 * np.cos(2 * np.pi * (t_in + (step0 + k) * dt) + phi)
+    for m in range(X0.shape[0]):
+        S = X0[m, 0]
+        I = X0[m, 1]
+        R = X0[m, 2]
+        for k in range(K):
+            beta = (b0 + alpha * increments[k, m, 0]) * seasonality[k]
+            mu_tilde = mu + alpha * increments[k, m, 1]
+            S_new = S + ((mu_tilde - mu*S - beta*S*I + gamma*R) * dt + alpha*(1-S) * increments[k, m, 2])
+            I_new = I + ((beta*S*I - ni*I - mu*I) * dt - alpha*I * increments[k, m, 3])
+            R_new = R + ((ni*I - mu*R - gamma*R) * dt - alpha*R * increments[k, m, 4])
+            S, I, R = S_new, I_new, R_new
+            out[m, k, 0] = S
+            out[m, k, 1] = I
+            out[m, k, 2] = R
+
+#############################################################################################################
+# Compilation on first use
+
+@functools.lru_cache(maxsize=None)
+def _compiled():
+    """Import Numba and compile every kernel, once.
+
+    Returns:
+    - dict: Compiled 'sir_rhs', 'rk4_sweep', 'transmission' and 'birth' kernels.
+    """
+    global _sir_rhs_compiled
+    import numba
+
+    jit = numba.njit(cache=True)
+    _sir_rhs_compiled = jit(_sir_rhs)
+    return {'sir_rhs': _sir_rhs_compiled, 'rk4_sweep': jit(_rk4_sweep),
+            'transmission': jit(_transmission_chunk), 'birth': jit(_birth_chunk)}
+
+class _CompiledChunks(Mapping):
+    """Chunk kernels by model, compiled when first looked up."""
+
+    _MODELS = ('transmission', 'birth')
+
+    def __getitem__(self, model):
+        if model not in self._MODELS:
+            raise KeyError(model)
+        return _compiled()[model]
+
+    def __iter__(self):
+        return iter(self._MODELS)
+
+    def __len__(self):
+        return len(self._MODELS)
+
+COMPILED_CHUNKS = _CompiledChunks()
@@ -0,0 +1,258 @@
+import numpy as np
+from scipy import sparse
+from scipy.integrate import solve_ivp
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+from rsv_sim.integrators import seasonality
+from rsv_sim.noise import increment_chunks, realization_streams, root_entropy
+from rsv_sim.sde import time_grid
+
+#############################################################################################################
+# Metapopulation model
+# P patches (health districts, municipalities...) each follow the SIR model on their own fractions
+# S_i, I_i, R_i, and are linked through where their residents meet: a resident of patch i spends the
+# fraction C_ij of their contacts in patch j, so infections in i are driven by the force of infection
+#   lambda_i(t) = beta_i(t) sum_j C_ij I_j
+# instead of beta_i(t) I_i. C is a sparse row-stochastic matrix (see coupling_matrix); the states are
+# contiguous (P, 3) arrays, (M, P, 3) for an ensemble, and the coupling is one sparse product per
+# evaluation, so the cost of the right-hand side is O(P + nnz(C)). The parameters may be scalars or
+# (P,) arrays of per-patch values.
+# BDF and Radau factorize I - h J at every Jacobian update. The infection terms of J follow the nonzeros
+# of C, so the LU factors stay sparse for geographic couplings (neighbouring patches, a narrow band after
+# reordering) but fill in for long-range random flows, where the factorization grows as the cube of the
+# bandwidth. They are refused above MAX_IMPLICIT_BANDWIDTH; the explicit solvers have no such limit.
+
+# Solvers accepted by solve_metapopulation; LSODA is left out, it only takes dense or banded Jacobians
+METHODS = ('RK45', 'RK23', 'DOP853', 'BDF', 'Radau')
+
+# Largest bandwidth of the coupling, after reverse Cuthill-McKee ordering, accepted by BDF and Radau.
+# Two years of BDF take 3.8 s at bandwidth 817 (1000 patches with random flows), 14 s at 1212 and
+# 35 s at 1605, while 10000 patches on a ring (bandwidth 14) or a 100 x 100 grid (100) take 3.5 and 5 s
+MAX_IMPLICIT_BANDWIDTH = 1000
+
+# Upper bound on the Brownian increments buffered by metapopulation_ensemble, in numbers
+MAX_BUFFERED_INCREMENTS = 2 ** 22
+
+# Position of the coupling terms d(dS_i, dI_i)/dI_j in a 3 x 3 block of the Jacobian
+COUPLING_PATTERN = np.array([[0, -1, 0],
+                             [0, 1, 0],
+                             [0, 0, 0]])
+
+def coupling_matrix(flows, mixing=1.0):
+    """Row-stochastic coupling matrix from mobility flows.
+
+    Parameters:
+    - flows: (P, P) dense or sparse matrix, flows[i, j] people of patch i travelling to j (the
+      diagonal, if given, counts those staying home).
+    - mixing (float): Fraction of the contacts that follow the flows, the rest stays in the home patch.
+
+    Returns:
+    - scipy.sparse.csr_matrix: (P, P) matrix C with rows summing to 1; patches without flows are isolated.
+    """
+    flows = sparse.csr_matrix(flows, dtype=float)
+    total = np.asarray(flows.sum(axis=1)).ravel()
+    moving = np.where(total > 0, mixing, 0.0)
+    scale = np.divide(moving, total, out=np.zeros_like(total), where=total > 0)
+    return (sparse.diags(scale) @ flows + sparse.diags(1 - moving)).tocsr()
+
+def force_of_infection(coupling, I):
+    """sum_j C_ij I_j for every patch.
+
+    Parameters:
+    - coupling (scipy.sparse.csr_matrix): (P, P) coupling matrix.
+    - I (numpy.ndarray): (P,) infectives, or (M, P) for an ensemble.
+
+    Returns:
+    - numpy.ndarray: Array with the shape of I.
+    """
+    return coupling @ I if I.ndim == 1 else (coupling @ I.T).T
+
+def coupling_bandwidth(coupling):
+    """Bandwidth of a coupling matrix after reverse Cuthill-McKee ordering of its patches.
+
+    Parameters:
+    - coupling: (P, P) coupling matrix.
+
+    Returns:
+    - int: Largest |i - j| over the nonzeros C_ij of the reordered matrix, 0 for isolated patches.
+    """
+    coupling = sparse.csr_matrix(coupling, dtype=float)
+    links = (abs(coupling) + abs(coupling.T)).tocsr()
+    order = reverse_cuthill_mckee(links, symmetric_mode=True)
+    reordered = links[order][:, order].tocoo()
+    return int(np.abs(reordered.row - reordered.col).max(initial=0))
+
+def _patch_parameters(P, **params):
+    """Broadcast scalar or per-patch parameters to (P,) float arrays."""
+    return {name: np.broadcast_to(np.asarray(value, dtype=float), (P,)) for name, value in params.items()}
+
+def metapopulation_rhs(t, Y, coupling, mu, b0, b1, phi, gamma, ni):
+    """Right-hand side of the deterministic metapopulation model.
+
+    Parameters:
+    - t (float): Time.
+    - Y (numpy.ndarray): (P, 3) array of S, I, R per patch.
+    - coupling (scipy.sparse.csr_matrix): (P, P) coupling matrix.
+    - mu, b0, b1, phi, gamma, ni: Model parameters, scalars or (P,) arrays.
+
+    Returns:
+    - numpy.ndarray: (P, 3) derivatives.
+    """
+    S, I, R = Y[:, 0], Y[:, 1], Y[:, 2]
+    infections = b0 * seasonality(t, b1, phi) * S * force_of_infection(coupling, I)
+    dY = np.empty_like(Y)
+    dY[:, 0] = mu - mu * S - infections + gamma * R
+    dY[:, 1] = infections - ni * I - mu * I
+    dY[:, 2] = ni * I - mu * R - gamma * R
+    return dY
+
+def metapopulation_jacobian(t, Y, coupling, mu, b0, b1, phi, gamma, ni):
+    """Sparse Jacobian of metapopulation_rhs with respect to the flattened (P, 3) state.
+
+    Returns:
+    - scipy.sparse.csc_matrix: (3P, 3P) Jacobian with O(P + nnz(C)) non-zeros.
+    """
+    P = Y.shape[0]
+    S, I = Y[:, 0], Y[:, 1]
+    beta = b0 * seasonality(t, b1, phi) * np.ones(P)
+    force = force_of_infection(coupling, I)
+    # Terms within each patch
+    blocks = np.zeros((P, 3, 3))
+    blocks[:, 0, 0] = -mu - beta * force
+    blocks[:, 0, 2] = gamma
+    blocks[:, 1, 0] = beta * force
+    blocks[:, 1, 1] = -ni - mu
+    blocks[:, 2, 1] = ni
+    blocks[:, 2, 2] = -mu - gamma
+    local = sparse.bsr_matrix((blocks, np.arange(P), np.arange(P + 1)), shape=(3 * P, 3 * P))
+    # Infections in patch i from the infectives of patch j
+    infection = sparse.kron(sparse.diags(beta * S) @ coupling, COUPLING_PATTERN, format='bsr')
+    return (local + infection).tocsc()
+
+def solve_metapopulation(t, coupling, Y0, mu, b0, b1, phi, gamma, ni, method='RK45', jacobian=True,
+                         rtol=1e-6, atol=1e-9, **options):
+    """Solve the deterministic metapopulation model.
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - coupling: (P, P) coupling matrix, see coupling_matrix.
+    - Y0 (numpy.ndarray): (P, 3) initial S, I, R per patch.
+    - mu, b0, b1, phi, gamma, ni: Model parameters, scalars or (P,) arrays.
+    - method (str): One of METHODS. BDF and Radau only accept couplings whose coupling_bandwidth is at
+      most MAX_IMPLICIT_BANDWIDTH, the LU factors of their Newton iterations filling in beyond it.
+    - jacobian (bool): Give BDF and Radau the analytic sparse Jacobian; if False they estimate it by
+      finite differences using its sparsity.
+    - rtol, atol (float): Tolerances of the solver.
+    - options: Passed to solve_ivp.
+
+    Returns:
+    - numpy.ndarray: (len(t), P, 3) array of S, I, R.
+    - dict: 'method', right-hand side evaluations 'nfev', Jacobian evaluations 'njev' and LU
+      decompositions 'nlu'.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown solver '{method}', expected one of {METHODS}")
+    t = np.asarray(t, dtype=float)
+    coupling = sparse.csr_matrix(coupling, dtype=float)
+    if method in ('BDF', 'Radau'):
+        bandwidth = coupling_bandwidth(coupling)
+        if bandwidth > MAX_IMPLICIT_BANDWIDTH:
+            raise ValueError(f"The coupling has bandwidth {bandwidth} after reordering, above "
+                             f"MAX_IMPLICIT_BANDWIDTH = {MAX_IMPLICIT_BANDWIDTH}: the LU factors of {method} "
+                             f"would fill in, use an explicit method such as 'RK45'")
+    Y0 = np.ascontiguousarray(Y0, dtype=float)
+    P = Y0.shape[0]
+    params = _patch_parameters(P, mu=mu, b0=b0, b1=b1, phi=phi, gamma=gamma, ni=ni)
+
+    def fun(t, y):
+        return metapopulation_rhs(t, y.reshape(P, 3), coupling, **params).ravel()
+
+    if method in ('BDF', 'Radau'):
+        if jacobian:
+            options['jac'] = lambda t, y: metapopulation_jacobian(t, y.reshape(P, 3), coupling, **params)
+        else:
+            options['jac_sparsity'] = metapopulation_jacobian(0.0, np.ones((P, 3)), coupling, **params) != 0
+    solution = solve_ivp(fun, (t[0], t[-1]), Y0.ravel(), method=method, t_eval=t, rtol=rtol, atol=atol, **options)
+    if not solution.success:
+        raise RuntimeError(solution.message)
+    return (solution.y.T.reshape(t.size, P, 3),
+            {'method': method, 'nfev': int(solution.nfev), 'njev': int(solution.njev), 'nlu': int(solution.nlu)})
+
+def metapopulation_transmission_step(t, dt, X, dW, coupling, mu, b0, b1, phi, gamma, ni, alpha):
+    """Advance every realization by one Euler-Maruyama step with transmission rate perturbation.
+
+    The step of rsv_sim.sde.transmission_step, with every patch perturbing its own b0 and I_i
+    replaced by the force of infection.
+
+    Parameters:
+    - t (float): Time at the beginning of the step.
+    - dt (float): Time step.
+    - X (numpy.ndarray): (M, P, 3) array of S, I, R values.
+    - dW (numpy.ndarray): (M, P, 3) array of Brownian increments.
+    - coupling (scipy.sparse.csr_matrix): (P, P) coupling matrix.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters, scalars or (P,) arrays.
+
+    Returns:
+    - numpy.ndarray: (M, P, 3) array of S, I, R values at t + dt.
+    """
+    S = X[:, :, 0]
+    I = X[:, :, 1]
+    R = X[:, :, 2]
+
+    b0_tilde = b0 + alpha * dW[:, :, 0]
+    beta = b0_tilde * seasonality(t, b1, phi)
+    infections = beta * S * force_of_infection(coupling, I)
+
+    X_new = np.empty_like(X)
+    X_new[:, :, 0] = S + ((mu - mu * S - infections + gamma * R) * dt - (alpha / b0_tilde) * infections * dW[:, :, 1])
+    X_new[:, :, 1] = I + ((infections - ni * I - mu * I) * dt - (alpha / b0_tilde) * infections * dW[:, :, 2])
+    X_new[:, :, 2] = R + (ni * I - mu * R - gamma * R) * dt
+    return X_new
+
+def metapopulation_ensemble(M, t_in, t_end, N, coupling, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                            seed=None, first_realization=0, record_every=1, chunk_size=None):
+    """Simulate M realizations of the metapopulation model with transmission rate perturbation.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - t_in (int): Initial time.
+    - t_end (int): End time.
+    - N (int): Number of steps.
+    - coupling: (P, P) coupling matrix, see coupling_matrix.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters, scalars or (P,) arrays.
+    - S_in, I_in, R_in: Initial fractions, scalars or (P,) arrays (e.g. infectives in one patch only).
+    - seed (int): Seed of the ensemble, realization r uses the r-th spawned stream.
+    - first_realization (int): Index of the first realization, to simulate a slice of a larger ensemble.
+    - record_every (int): Keep the state every record_every steps; N must be a multiple of it.
+    - chunk_size (int): Number of steps whose increments are drawn at once, bounded by
+      MAX_BUFFERED_INCREMENTS if None.
+
+    Returns:
+    - numpy.ndarray: Recorded times.
+    - numpy.ndarray: (M, N // record_every + 1, P, 3) array of S, I, R per patch.
+    """
+    if N % record_every:
+        raise ValueError(f"N = {N} is not a multiple of record_every = {record_every}")
+    coupling = sparse.csr_matrix(coupling, dtype=float)
+    P = coupling.shape[0]
+    params = _patch_parameters(P, mu=mu, b0=b0, b1=b1, phi=phi, gamma=gamma, ni=ni, alpha=alpha)
+    chunk_size = chunk_size or int(np.clip(MAX_BUFFERED_INCREMENTS // (M * P * 3), 1, N))
+
+    dt, TS = time_grid(t_in, t_end, N)
+    streams = realization_streams(root_entropy(seed), range(first_realization, first_realization + M))
+
+    results = np.empty((M, N // record_every + 1, P, 3))
+    X = np.empty((M, P, 3))
+    X[:, :, 0] = S_in
+    X[:, :, 1] = I_in
+    X[:, :, 2] = R_in
+    results[:, 0] = X
+
+    i = 0
+    for increments in increment_chunks(streams, N, 3 * P, dt, chunk_size):
+        for dW in increments:
+            X = metapopulation_transmission_step(TS[i], dt, X, dW.reshape(M, P, 3), coupling, **params)
+            i += 1
+            if i % record_every == 0:
+                results[:, i // record_every] = X
+    return TS[::record_every], results
@@ -0,0 +1,110 @@
+import numpy as np
+
+from rsv_sim import instrumentation
+
+#############################################################################################################
+# Brownian increments
+# Every realization owns an independent Generator, so a realization draws the same increments
+# whether it runs alone, in a chunk of the ensemble or in another process.
+
+# Number of time steps whose increments are drawn at once.
+DEFAULT_CHUNK_SIZE = 64
+
+def root_entropy(seed=None):
+    """Resolve the entropy shared by all the streams of an ensemble.
+
+    Parameters:
+    - seed (int): Seed of the ensemble, fresh OS entropy if None.
+
+    Returns:
+    - int: Entropy to pass to realization_streams.
+    """
+    return np.random.SeedSequence(seed).entropy
+
+def realization_streams(seed, realizations):
+    """Create one random generator per realization.
+
+    The stream of realization r is the r-th child of SeedSequence(seed).spawn, built directly
+    from its spawn key so that any subset of realizations can be created independently.
+
+    Parameters:
+    - seed (int): Seed of the ensemble (see root_entropy).
+    - realizations (iterable): Indices of the realizations.
+
+    Returns:
+    - list: numpy.random.Generator for each realization.
+    """
+    return [np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(r,))))
+            for r in realizations]
+
+def increment_chunks(streams, N, n_noise, dt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the Brownian increments of an ensemble, chunk_size time steps at a time.
+
+    Parameters:
+    - streams (list): Generators returned by realization_streams.
+    - N (int): Number of steps.
+    - n_noise (int): Number of increments per realization and per step.
+    - dt (float): Time step.
+    - chunk_size (int): Number of steps per chunk.
+
+    Returns:
+    - generator: (K, M, n_noise) arrays with K <= chunk_size, covering the N steps in order.
+      The same buffer is reused, so a chunk is only valid until the next one is requested.
+    """
+    sqrt_dt = np.sqrt(dt)
+    # Each realization fills a contiguous block of the buffer
+    buffer = np.empty((len(streams), chunk_size, n_noise))
+    for start in range(0, N, chunk_size):
+        K = min(chunk_size, N - start)
+        with instrumentation.timer('rng'):
+            for m, rng in enumerate(streams):
+                rng.standard_normal(out=buffer[m, :K])
+            buffer[:, :K] *= sqrt_dt
+        instrumentation.count('rng_normals', len(streams) * K * n_noise)
+        yield buffer[:, :K].transpose(1, 0, 2)
+
+class UniformBuffer:
+    """Uniforms drawn on demand from per-realization streams, each realization at its own pace.
+
+    Used by event-driven simulations where realizations consume different numbers of draws; a
+    realization's draws only depend on its own stream, so results do not depend on the ensemble.
+    """
+
+    def __init__(self, streams, block=1024):
+        """Parameters:
+        - streams (list): Generators returned by realization_streams.
+        - block (int): Uniforms drawn per realization at each refill.
+        """
+        self.streams = streams
+        self.buffer = np.empty((len(streams), block))
+        self.position = np.full(len(streams), block)
+
+    def draw(self, rows, k):
+        """Return a (len(rows), k) array of uniforms in [0, 1) for the given realizations."""
+        block = self.buffer.shape[1]
+        for m in rows[self.position[rows] + k > block]:
+            # Keep the unused tail so every stream is consumed in order
+            tail = self.buffer[m, self.position[m]:].copy()
+            self.buffer[m, :tail.size] = tail
+            self._fill(m, self.buffer[m, tail.size:])
+            self.position[m] = 0
+        columns = self.position[rows, None] + np.arange(k)
+        self.position[rows] += k
+        return self.buffer[rows[:, None], columns]
+
+    def _fill(self, m, out):
+        self.streams[m].random(out=out)
+
+class NormalBuffer(UniformBuffer):
+    """Standard normals drawn on demand from per-realization streams, each realization at its own pace.
+
+    Used by adaptive stepping, where every realization controls its own step size.
+    """
+
+    def __init__(self, streams, block=256):
+        super().__init__(streams, block)
+
+    def _fill(self, m, out):
+        with instrumentation.timer('rng'):
+            self.streams[m].standard_normal(out=out)
+        instrumentation.count('rng_normals', out.size)
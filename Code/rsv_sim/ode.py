@@ -0,0 +1,132 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from rsv_sim import instrumentation
+from rsv_sim.kernels import resolve_backend, rk4_sweep_compiled
+
+#############################################################################################################
+# Deterministic SIR model, batched over parameter sets
+# P parameter sets are integrated as one stacked system whose state is a (3, P) array.
+
+PARAMETER_NAMES = ('b0', 'b1', 'phi', 'mu', 'gamma', 'ni')
+INITIAL_CONDITION_NAMES = ('S0', 'I0', 'R0')
+
+def sir_model_batch(t, Y, b0, b1, phi, mu, gamma, ni):
+    """ODE system of the SIR model for P parameter sets at once.
+
+    Parameters:
+    - t (float): Time.
+    - Y (numpy.ndarray): (3, P) or (3, P, k) array of S, I, R values.
+    - b0, b1, phi, mu, gamma, ni (numpy.ndarray): (P,) arrays of model parameters.
+
+    Returns:
+    - numpy.ndarray: Derivatives [dS/dt, dI/dt, dR/dt] with the shape of Y.
+    """
+    S, I, R = Y[0], Y[1], Y[2]
+    if Y.ndim == 3:
+        b0, b1, phi, mu, gamma, ni = (p[:, None] for p in (b0, b1, phi, mu, gamma, ni))
+
+    beta = b0 * (1 + b1 * np.cos(2 * np.pi * t + phi))
+    infections = beta * S * I
+
+    dY = np.empty_like(Y)
+    dY[0] = mu - mu * S - infections + gamma * R
+    dY[1] = infections - ni * I - mu * I
+    dY[2] = ni * I - mu * R - gamma * R
+    return dY
+
+def sweep_arrays(b0, b1, phi, mu, gamma, ni, S0, I0, R0):
+    """Broadcast the sweep inputs to (P,) float arrays.
+
+    Returns:
+    - dict: Parameter arrays by name.
+    - numpy.ndarray: (3, P) array of initial conditions.
+    """
+    arrays = [a.copy() for a in np.broadcast_arrays(*(np.asarray(v, dtype=float).ravel()
+                                                      for v in (b0, b1, phi, mu, gamma, ni, S0, I0, R0)))]
+    params = dict(zip(PARAMETER_NAMES, arrays[:6]))
+    return params, np.stack(arrays[6:])
+
+def rk4_sweep(t, params, Y0, substeps=1, backend=None):
+    """Integrate the batched SIR model with a fixed-step Runge-Kutta 4 scheme.
+
+    Parameters:
+    - t (numpy.ndarray): Output times; each interval is split in `substeps` steps.
+    - params (dict): (P,) parameter arrays by name.
+    - Y0 (numpy.ndarray): (3, P) initial conditions.
+    - substeps (int): Number of RK4 steps between consecutive output times.
+    - backend (str): 'numba' or 'numpy', the fastest available if None.
+
+    Returns:
+    - numpy.ndarray: (P, len(t), 3) solution.
+    """
+    args = tuple(params[name] for name in PARAMETER_NAMES)
+    steps = substeps * (t.size - 1)
+    instrumentation.count('ode_steps', steps)
+    instrumentation.count('rhs_evaluations', 4 * steps * Y0.shape[1])
+    if resolve_backend(backend) == 'numba':
+        return rk4_sweep_compiled(t, Y0, substeps, *args)
+    out = np.empty((Y0.shape[1], t.size, 3))
+    Y = Y0.copy()
+    out[:, 0] = Y.T
+    for j in range(1, t.size):
+        h = (t[j] - t[j - 1]) / substeps
+        for s in range(substeps):
+            tau = t[j - 1] + s * h
+            k1 = sir_model_batch(tau, Y, *args)
+            k2 = sir_model_batch(tau + h / 2, Y + h / 2 * k1, *args)
+            k3 = sir_model_batch(tau + h / 2, Y + h / 2 * k2, *args)
+            k4 = sir_model_batch(tau + h, Y + h * k3, *args)
+            Y = Y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        out[:, j] = Y.T
+    return out
+
+def solve_ivp_sweep(t, params, Y0, method='RK45', rtol=1e-3, atol=1e-6):
+    """Integrate the batched SIR model as one stacked solve_ivp system.
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - params (dict): (P,) parameter arrays by name.
+    - Y0 (numpy.ndarray): (3, P) initial conditions.
+    - method (str): solve_ivp method.
+    - rtol, atol (float): Tolerances of the solver.
+
+    Returns:
+    - numpy.ndarray: (P, len(t), 3) solution.
+    """
+    args = tuple(params[name] for name in PARAMETER_NAMES)
+    P = Y0.shape[1]
+
+    def fun(t, y):
+        # y is (3P,) or, when the solver evaluates several states at once, (3P, k)
+        return sir_model_batch(t, y.reshape((3, P) + y.shape[1:]), *args).reshape(y.shape)
+
+    with instrumentation.timer('ode_solve'):
+        solution = solve_ivp(instrumentation.counted(fun, columns=True), (t[0], t[-1]), Y0.ravel(), method=method,
+                             t_eval=t, vectorized=True, rtol=rtol, atol=atol)
+    if not solution.success:
+        raise RuntimeError(solution.message)
+    instrumentation.record_solver({'njev': solution.njev, 'nlu': solution.nlu})
+    return solution.y.reshape(3, P, t.size).transpose(1, 2, 0)
+
+def solve_sir_sweep(t, b0, b1, phi, mu, gamma, ni, S0, I0, R0, method='rk4', **options):
+    """Solve the deterministic SIR model for many parameter sets at once.
+
+    Every argument from b0 to R0 may be a scalar or an array; they are broadcast together to
+    P parameter sets, e.g. a flattened np.meshgrid for a grid sweep.
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - b0, b1, phi, mu, gamma, ni: Model parameters.
+    - S0, I0, R0: Initial conditions.
+    - method (str): 'rk4' for the fixed-step batched RK4, or a solve_ivp method name.
+    - options: Passed to rk4_sweep (substeps, backend) or solve_ivp_sweep (rtol, atol).
+
+    Returns:
+    - numpy.ndarray: (P, len(t), 3) array of S, I, R for every parameter set.
+    """
+    t = np.asarray(t, dtype=float)
+    params, Y0 = sweep_arrays(b0, b1, phi, mu, gamma, ni, S0, I0, R0)
+    if method == 'rk4':
+        return rk4_sweep(t, params, Y0, **options)
+    return solve_ivp_sweep(t, params, Y0, method=method, **options)
@@ -0,0 +1,176 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rsv_sim import instrumentation
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, root_entropy
+from rsv_sim.integrators import simulate_ensemble
+from rsv_sim.sde import time_grid
+from rsv_sim.storage import create_store, open_store, write_block
+
+#############################################################################################################
+# Process-pool ensembles
+# Realizations are split in blocks; each worker writes its block straight into a shared memory
+# array, so only the block boundaries travel between processes. When the caller is instrumented,
+# every task records its own metrics and sends them back with its result.
+
+# Number of realizations simulated by one task.
+DEFAULT_BLOCK_SIZE = 256
+
+def _resolve_workers(workers, M, block_size):
+    """Number of processes to use: all the cores by default, never more than the blocks."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, -(-M // block_size)))
+
+def _throughput(M, workers, elapsed, verbose):
+    """Collect (and optionally print) the throughput of a run.
+
+    Returns:
+    - dict: Number of workers, elapsed seconds and realizations per second.
+    """
+    stats = {
+        'workers': workers,
+        'seconds': elapsed,
+        'realizations_per_second': M / elapsed if elapsed > 0 else float('inf'),
+    }
+    if verbose:
+        print(f"{M} realizations in {elapsed:.2f} s on {workers} workers "
+              f"({stats['realizations_per_second']:.1f} realizations/s)")
+    return stats
+
+def _simulate_block(shm_name, shape, first, count, parameters, model, scheme, seed, chunk_size):
+    """Worker: simulate realizations first..first+count-1 into the shared result array.
+
+    Returns:
+    - int: Number of realizations simulated.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        results = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        simulate_ensemble(count, **parameters, model=model, scheme=scheme, seed=seed, first_realization=first,
+                          chunk_size=chunk_size, out=results[first:first + count])
+        del results
+    finally:
+        shm.close()
+    return count
+
+def run_ensemble(M, parameters, model='transmission', seed=None, workers=None,
+                 block_size=DEFAULT_BLOCK_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, verbose=False, scheme='euler_maruyama'):
+    """Simulate an SDE ensemble on several processes.
+
+    The trajectories are identical to simulate_ensemble(M, **parameters, model=model, scheme=scheme, seed=seed)
+    for any number of workers and block size: every scheme, the adaptive one included, advances a
+    realization from its own stream and state only.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - parameters (dict): Parameters of Euler_Maruyama_ensemble (t_in, t_end, N, mu, ..., R_in).
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble.
+    - workers (int): Number of processes, all the available cores if None.
+    - block_size (int): Number of realizations per task.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - verbose (bool): Print the throughput.
+    - scheme (str): Integration scheme, see rsv_sim.integrators.SCHEMES.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) array of simulated S, I, R populations.
+    - dict: Number of workers, elapsed seconds and realizations per second.
+    """
+    workers = _resolve_workers(workers, M, block_size)
+    seed = root_entropy(seed)
+
+    start = time.perf_counter()
+    if workers == 1:
+        TS, results = simulate_ensemble(M, **parameters, model=model, scheme=scheme, seed=seed, chunk_size=chunk_size)
+    else:
+        shape = (M, parameters['N'] + 1, 3)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        try:
+            shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(instrumentation.collect, instrumentation.enabled(), _simulate_block, shm.name,
+                                       shape, first, min(block_size, M - first), parameters, model, scheme, seed,
+                                       chunk_size)
+                           for first in range(0, M, block_size)]
+                for future in futures:
+                    instrumentation.merge(future.result()[1])
+            results = shared.copy()
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        _, TS = time_grid(parameters['t_in'], parameters['t_end'], parameters['N'])
+    elapsed = time.perf_counter() - start
+
+    stats = _throughput(M, workers, elapsed, verbose)
+    return TS, results, stats
+
+def _simulate_block_to_store(directory, first, count, parameters, model, scheme, seed, chunk_size):
+    """Worker: simulate realizations first..first+count-1 into the store at directory.
+
+    Returns:
+    - int: Number of realizations simulated.
+    """
+    store = open_store(directory, mode='r+')
+    _, block = simulate_ensemble(count, **parameters, model=model, scheme=scheme, seed=seed, first_realization=first,
+                                 chunk_size=chunk_size)
+    write_block(store, first, block)
+    for column in store['metadata']['columns']:
+        store[column].flush()
+    return count
+
+def run_ensemble_to_store(M, parameters, directory, model='transmission', seed=None, workers=None,
+                          block_size=DEFAULT_BLOCK_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, metadata=None, verbose=False,
+                          scheme='euler_maruyama'):
+    """Simulate an SDE ensemble straight into a trajectory store (see rsv_sim.storage).
+
+    Each block of realizations is written to the memory-mapped files as soon as it is simulated,
+    so memory is bounded by block_size per worker whatever M.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - parameters (dict): Parameters of Euler_Maruyama_ensemble (t_in, t_end, N, mu, ..., R_in).
+    - directory (str): Store directory.
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble.
+    - workers (int): Number of processes, all the available cores if None.
+    - block_size (int): Number of realizations per task.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - metadata (dict): Extra entries of the metadata.json sidecar.
+    - verbose (bool): Print the throughput.
+    - scheme (str): Integration scheme, see rsv_sim.integrators.SCHEMES.
+
+    Returns:
+    - dict: Read-only store (see rsv_sim.storage.open_store).
+    - dict: Number of workers, elapsed seconds and realizations per second.
+    """
+    workers = _resolve_workers(workers, M, block_size)
+    seed = root_entropy(seed)
+
+    _, TS = time_grid(parameters['t_in'], parameters['t_end'], parameters['N'])
+    store = create_store(directory, M, TS, {'model': model, 'scheme': scheme, 'parameters': parameters, 'seed': seed,
+                                            'seed_streams': 'SeedSequence(seed).spawn(realizations)',
+                                            **(metadata or {})})
+    del store
+
+    start = time.perf_counter()
+    tasks = [(str(directory), first, min(block_size, M - first), parameters, model, scheme, seed, chunk_size)
+             for first in range(0, M, block_size)]
+    if workers == 1:
+        for task in tasks:
+            _simulate_block_to_store(*task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(instrumentation.collect, instrumentation.enabled(), _simulate_block_to_store,
+                                       *task) for task in tasks]:
+                instrumentation.merge(future.result()[1])
+    elapsed = time.perf_counter() - start
+
+    stats = _throughput(M, workers, elapsed, verbose)
+    return open_store(directory), stats
@@ -0,0 +1,180 @@
+import numpy as np
+from scipy.integrate import odeint
+
+#############################################################################################################
+# Periodic orbits of the seasonally forced model
+# beta(t) has a period of one year, so the attractor is a cycle of one year (or of k years after a
+# period doubling). Instead of integrating years of transient, the cycle is found as a fixed point of
+# the Poincare map x -> Phi(t0 + k, t0, x) by Newton's method, with the monodromy matrix from the
+# variational equations. On the cycle S + I + R = 1, so Newton works on z = (S, log I) with
+# R = 1 - S - I; the log keeps I positive through the deep troughs of strongly seasonal cycles.
+
+# Newton stops when its step in (S, log I) is below this; the flow is integrated with rtol 1e-10
+DEFAULT_TOLERANCE = 1e-8
+
+# Largest Newton step in log I, so a poor guess cannot overflow I
+MAX_LOG_STEP = 2.0
+
+# Initial state used when no guess is given, as in the scripts
+DEFAULT_GUESS = np.array([0.9988, 0.0012, 0.0])
+
+def _parameter_tuple(params):
+    """Model parameters in the order mu, b0, b1, phi, gamma, ni."""
+    return tuple(params[name] for name in ('mu', 'b0', 'b1', 'phi', 'gamma', 'ni'))
+
+def flow(params, x, t0, duration, samples=0, rtol=1e-10, atol=1e-13):
+    """Integrate the model together with its variational equations.
+
+    Parameters:
+    - params (dict): b0, b1, phi, mu, gamma, ni.
+    - x (numpy.ndarray): (3,) state S, I, R at t0.
+    - t0 (float): Initial time.
+    - duration (float): Integration time.
+    - samples (int): If > 0, also return the orbit at samples + 1 equally spaced times.
+    - rtol, atol (float): Tolerances of the solver.
+
+    Returns:
+    - numpy.ndarray: (3,) state at t0 + duration.
+    - numpy.ndarray: (3, 3) derivative of the final state with respect to x.
+    - tuple: Sample times and (samples + 1, 3) states, or None.
+    """
+    mu, b0, b1, phi, gamma, ni = _parameter_tuple(params)
+    J = np.array([[0.0, 0.0, gamma],
+                  [0.0, 0.0, 0.0],
+                  [0.0, ni, -mu - gamma]])
+    dy = np.empty(12)
+
+    def fun(t, y):
+        # Model and variational equations written out for one state: this is the hot loop
+        S, I, R = y[0], y[1], y[2]
+        beta = b0 * (1 + b1 * np.cos(2 * np.pi * t + phi))
+        infections = beta * S * I
+        dy[0] = mu - mu * S - infections + gamma * R
+        dy[1] = infections - ni * I - mu * I
+        dy[2] = ni * I - mu * R - gamma * R
+        J[0, 0] = -mu - beta * I
+        J[0, 1] = -beta * S
+        J[1, 0] = beta * I
+        J[1, 1] = beta * S - ni - mu
+        dy[3:] = (J @ y[3:].reshape(3, 3)).ravel()
+        return dy
+
+    y0 = np.concatenate([x, np.eye(3).ravel()])
+    t = t0 + np.linspace(0, duration, samples + 1 if samples else 2)
+    y, info = odeint(fun, y0, t, rtol=rtol, atol=atol, mxstep=100000, full_output=True, tfirst=True)
+    if info['message'] != 'Integration successful.':
+        raise RuntimeError(info['message'])
+    orbit = (t, y[:, :3]) if samples else None
+    return y[-1, :3], y[-1, 3:].reshape(3, 3), orbit
+
+def _to_reduced(x):
+    """(S, I, R) -> (S, log I)."""
+    return np.array([x[0], np.log(x[1])])
+
+def _from_reduced(z):
+    """(S, log I) -> (S, I, R) on S + I + R = 1."""
+    I = np.exp(z[1])
+    return np.array([z[0], I, 1 - z[0] - I])
+
+def _reduced_jacobian(M, x_in, x_out):
+    """Derivative of the Poincare map in (S, log I) coordinates from the full monodromy matrix."""
+    columns = np.stack([M[:, 0] - M[:, 2], (M[:, 1] - M[:, 2]) * x_in[1]], axis=1)
+    return np.stack([columns[0], columns[1] / x_out[1]])
+
+def periodic_orbit(params, guess=None, periods=1, t0=0.0, tol=DEFAULT_TOLERANCE, max_iterations=20,
+                   burn_in=2, samples=365):
+    """Find the periodic orbit of the deterministic model by shooting with Newton's method.
+
+    Parameters:
+    - params (dict): b0, b1, phi, mu, gamma, ni.
+    - guess: Starting state, either (S, I, R) at t0 or the result of a previous call (warm start,
+      e.g. for nearby parameters). If None, the scripts' initial state after burn_in periods.
+    - periods (int): Period of the orbit in years, 2 for a biennial cycle.
+    - t0 (float): Time of the Poincare section within the year.
+    - tol (float): Convergence tolerance on the step in (S, log I).
+    - max_iterations (int): Newton iterations before giving up.
+    - burn_in (int): Periods integrated from the cold start before Newton (ignored with a guess).
+    - samples (int): Points of the returned orbit per year.
+
+    Returns:
+    - dict: 'state' (S, I, R at t0), 'period', 'multipliers' (Floquet multipliers, largest modulus
+      first), 'stable', 'iterations', 'residual' (|Phi(x) - x| of the last shot) and the orbit over one
+      period as times 't' and (samples * periods + 1, 3) states 'Y'.
+    """
+    if isinstance(guess, dict):
+        x = np.asarray(guess['state'], dtype=float)
+    elif guess is not None:
+        x = np.asarray(guess, dtype=float)
+    else:
+        x = flow(params, DEFAULT_GUESS, t0, burn_in * periods)[0]
+    z = _to_reduced(x / x.sum())
+
+    previous = np.inf
+    for iteration in range(1, max_iterations + 1):
+        x = _from_reduced(z)
+        x_out, M, (t, Y) = flow(params, x, t0, periods, samples=samples * periods)
+        residual = _to_reduced(x_out) - z
+        step = np.linalg.solve(_reduced_jacobian(M, x, x_out) - np.eye(2), -residual)
+        if not np.all(np.isfinite(step)):
+            raise RuntimeError("Newton step is not finite, the monodromy matrix is singular")
+        # Keep S in (0, 1) and damp large jumps of log I
+        step *= min(1.0, MAX_LOG_STEP / max(abs(step[1]), 1e-300))
+        while not 0 < z[0] + step[0] < 1:
+            step /= 2
+        size = np.max(np.abs(step))
+        # Converged, or stalled at the accuracy of the flow close to tol
+        if size < tol or (size < np.sqrt(tol) and size >= previous / 2):
+            # The last shot is within tol of the orbit, keep it rather than integrating again
+            break
+        previous = size
+        z = z + step
+    else:
+        raise RuntimeError(f"Newton did not converge in {max_iterations} iterations (last step {np.max(np.abs(step)):.2e})")
+
+    multipliers = np.linalg.eigvals(M)
+    multipliers = multipliers[np.argsort(-np.abs(multipliers))]
+    return {
+        'state': x,
+        'period': periods,
+        'multipliers': multipliers,
+        'stable': bool(np.all(np.abs(multipliers) < 1)),
+        'iterations': iteration,
+        'residual': float(np.max(np.abs(x_out - x))),
+        't': t,
+        'Y': Y,
+    }
+
+def seasonal_peak(orbit):
+    """Time and height of the epidemic peak(s) on a periodic orbit.
+
+    Parameters:
+    - orbit (dict): Result of periodic_orbit.
+
+    Returns:
+    - numpy.ndarray: Peak times, one per year of the period, as fractions of the year after t0.
+    - numpy.ndarray: Infectives at each peak.
+    """
+    t, I = orbit['t'], orbit['Y'][:, 1]
+    per_year = (I.size - 1) // orbit['period']
+    years = I[:-1].reshape(orbit['period'], per_year)
+    peaks = years.argmax(axis=1)
+    return (t[peaks + per_year * np.arange(orbit['period'])] - t[0]) % 1, years[np.arange(orbit['period']), peaks]
+
+def periodic_orbits(params, varying, values, guess=None, **options):
+    """Periodic orbits along a list of values of one parameter, each warm-started from the previous one.
+
+    Parameters:
+    - params (dict): b0, b1, phi, mu, gamma, ni.
+    - varying (str): Name of the parameter to vary.
+    - values (list): Its values, in the order they are solved.
+    - guess: Starting state or orbit for the first value.
+    - options: Passed to periodic_orbit.
+
+    Returns:
+    - list: Result of periodic_orbit for every value.
+    """
+    orbits = []
+    for value in values:
+        guess = periodic_orbit({**params, varying: value}, guess=guess, **options)
+        orbits.append(guess)
+    return orbits
@@ -0,0 +1,306 @@
+from pathlib import Path
+
+import numpy as np
+
+#############################################################################################################
+# Figures
+# matplotlib is only imported here, and figures are saved through matplotlib.figure.Figure without
+# pyplot, so batch runs never need a display.
+#
+# Large ensembles are drawn at the resolution of the figure rather than of the data. The time axis is
+# cut into one column per pixel; in each column a trajectory only shows as the vertical span between
+# its minimum and maximum, so min/max decimation draws exactly the same pixels as the full line. Up to
+# MAX_LINES realizations are drawn as decimated lines. Beyond that the ensemble becomes a fan chart:
+# a density raster counting the trajectories crossing every pixel, drawn as one image, under quantile
+# bands read from a per-column histogram of the values. Both are filled block by block, so the number
+# of artists and the memory do not grow with the ensemble.
+
+LABELS_ON_Y = {0: "Susceptible S(t)",
+               1: "Infectives I(t)",
+               2: "Recovered R(t)"}
+FILE_NAMES = {0: "S(t).png", 1: "I(t).png", 2: "R(t).png"}
+
+# Realizations drawn as separate lines; larger ensembles are drawn as a fan chart
+MAX_LINES = 20
+
+# Pixel columns and rows of the density raster, about the size of the axes of a 10 x 6 inch figure at 100 dpi
+DEFAULT_WIDTH = 1000
+DEFAULT_HEIGHT = 600
+
+# Quantile bands of the fan chart, outermost first
+DEFAULT_BANDS = ((0.05, 0.95), (0.25, 0.75))
+
+# Realizations read from a store at once
+BLOCK_SIZE = 256
+
+def pixel_columns(t, width=DEFAULT_WIDTH):
+    """First time index of each of width equal columns spanning t, empty columns dropped.
+
+    Returns:
+    - numpy.ndarray: Increasing start indices, at most width of them.
+    """
+    t = np.asarray(t)
+    return np.unique(np.searchsorted(t, np.linspace(t[0], t[-1], width + 1)[:-1], side='left'))
+
+def _column_extrema(values, starts):
+    """Minimum and maximum of every row in every column, including the last point of the previous
+    column so consecutive spans connect."""
+    lower = np.minimum.reduceat(values, starts, axis=1)
+    upper = np.maximum.reduceat(values, starts, axis=1)
+    previous = values[:, starts[1:] - 1]
+    lower[:, 1:] = np.minimum(lower[:, 1:], previous)
+    upper[:, 1:] = np.maximum(upper[:, 1:], previous)
+    return lower, upper
+
+def decimate(t, values, width=DEFAULT_WIDTH):
+    """Min/max decimation of trajectories to width columns.
+
+    Parameters:
+    - t (numpy.ndarray): Time array.
+    - values (numpy.ndarray): (m, len(t)) trajectories.
+    - width (int): Number of columns, about the pixel width of the axes.
+
+    Returns:
+    - numpy.ndarray: (2 k,) times, the start and end of every column.
+    - numpy.ndarray: (m, 2 k) minimum then maximum of every trajectory in every column.
+    """
+    t = np.asarray(t)
+    values = np.asarray(values)
+    starts = pixel_columns(t, width)
+    if 2 * starts.size >= t.size:
+        return t, values
+    lower, upper = _column_extrema(values, starts)
+    ends = np.append(starts[1:], t.size) - 1
+    times = np.column_stack([t[starts], t[ends]]).ravel()
+    return times, np.stack([lower, upper], axis=-1).reshape(values.shape[0], -1)
+
+class DensityRaster:
+    """Pixel histograms of an ensemble of trajectories, filled block by block.
+
+    'spans' counts the trajectories crossing every pixel, 'values' the values at the middle of every
+    column, from which the quantiles are read to within one pixel.
+    """
+
+    def __init__(self, t, y_range, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        """Parameters:
+        - t (numpy.ndarray): Time array of the trajectories.
+        - y_range (tuple): Lower and upper limits of the values.
+        - width, height (int): Pixel columns and rows.
+        """
+        self.t = np.asarray(t)
+        self.starts = pixel_columns(self.t, width)
+        ends = np.append(self.starts[1:], self.t.size)
+        self.middles = (self.starts + ends - 1) // 2
+        lower, upper = y_range
+        if upper <= lower:
+            lower, upper = lower - 0.5 * abs(lower or 1), upper + 0.5 * abs(upper or 1)
+        self.y_range = (float(lower), float(upper))
+        self.height = height
+        self.count = 0
+        self._difference = np.zeros((height + 1, self.starts.size))
+        self.values = np.zeros((height, self.starts.size))
+
+    @property
+    def spans(self):
+        """(height, columns) number of trajectories crossing every pixel."""
+        return np.cumsum(self._difference[:-1], axis=0)
+
+    @property
+    def times(self):
+        """Time at the middle of every column."""
+        return self.t[self.middles]
+
+    @property
+    def extent(self):
+        """Limits (left, right, bottom, top) of the raster, for imshow."""
+        return (self.t[0], self.t[-1]) + self.y_range
+
+    def _rows(self, values):
+        """Pixel row of each value, clipped to the raster."""
+        lower, upper = self.y_range
+        rows = np.floor((values - lower) * (self.height / (upper - lower)))
+        return np.clip(rows, 0, self.height - 1).astype(np.intp)
+
+    def add(self, values):
+        """Add a block of trajectories.
+
+        Parameters:
+        - values (numpy.ndarray): (m, len(t)) trajectories of one compartment.
+        """
+        values = np.asarray(values, dtype=float)
+        m, columns = values.shape[0], self.starts.size
+        if m == 0:
+            return
+        lower, upper = _column_extrema(values, self.starts)
+        index = np.broadcast_to(np.arange(columns), (m, columns))
+        # Every trajectory adds one to the rows between its extrema: +1 at the lowest, -1 past the highest
+        size = (self.height + 1) * columns
+        difference = (np.bincount((self._rows(lower) * columns + index).ravel(), minlength=size)
+                      - np.bincount(((self._rows(upper) + 1) * columns + index).ravel(), minlength=size))
+        self._difference += difference.reshape(self.height + 1, columns)
+        self.values += np.bincount((self._rows(values[:, self.middles]) * columns + index).ravel(),
+                                   minlength=self.height * columns).reshape(self.height, columns)
+        self.count += m
+
+    def quantile(self, p):
+        """Quantile p of the values at the middle of every column.
+
+        Returns:
+        - numpy.ndarray: (columns,) quantiles, interpolated within the pixel.
+        """
+        cumulative = np.cumsum(self.values, axis=0)
+        target = p * self.count
+        row = np.minimum((cumulative < target).sum(axis=0), self.height - 1)
+        columns = np.arange(row.size)
+        below = np.where(row > 0, cumulative[row - 1, columns], 0.0)
+        inside = (target - below) / np.maximum(self.values[row, columns], 1)
+        lower, upper = self.y_range
+        return lower + (row + np.clip(inside, 0, 1)) * (upper - lower) / self.height
+
+def _blocks(values, block_size):
+    """Blocks of rows of an array or memory map."""
+    for first in range(0, values.shape[0], block_size):
+        yield np.asarray(values[first:first + block_size], dtype=float)
+
+def draw_ensemble(ax, t, values, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, bands=DEFAULT_BANDS,
+                  max_lines=MAX_LINES, block_size=BLOCK_SIZE, color='C0'):
+    """Draw an ensemble of trajectories of one compartment on matplotlib axes.
+
+    Up to max_lines realizations are drawn as min/max-decimated lines, larger ensembles as a fan
+    chart: density raster, quantile bands and median.
+
+    Parameters:
+    - ax (matplotlib.axes.Axes): Axes to draw on.
+    - t (numpy.ndarray): Time array.
+    - values (numpy.ndarray): (M, len(t)) trajectories, e.g. a column of a store (read block by block).
+    - width, height (int): Pixel columns and rows of the decimation and raster.
+    - bands (tuple): (lower, upper) quantile pairs of the fan chart.
+    - max_lines (int): Largest ensemble drawn line by line.
+    - block_size (int): Realizations read at once.
+    - color: Colour of the lines and bands.
+
+    Returns:
+    - DensityRaster: Raster of the fan chart, None if lines were drawn.
+    """
+    if values.shape[0] <= max_lines:
+        times, decimated = decimate(t, np.asarray(values), width)
+        for row in decimated:
+            ax.plot(times, row, linewidth=0.9, rasterized=True)
+        return None
+
+    lower, upper = np.inf, -np.inf
+    for block in _blocks(values, block_size):
+        lower, upper = min(lower, block.min()), max(upper, block.max())
+    raster = DensityRaster(t, (lower, upper), width, height)
+    for block in _blocks(values, block_size):
+        raster.add(block)
+
+    density = np.ma.masked_equal(raster.spans, 0)
+    ax.imshow(np.log1p(density), extent=raster.extent, origin='lower', aspect='auto', cmap='Greys',
+              interpolation='nearest', alpha=0.6)
+    for k, (p_low, p_high) in enumerate(bands):
+        ax.fill_between(raster.times, raster.quantile(p_low), raster.quantile(p_high), color=color,
+                        alpha=0.2 + 0.15 * k, linewidth=0, label=f'{100 * p_low:g}-{100 * p_high:g}%')
+    ax.plot(raster.times, raster.quantile(0.5), color=color, linewidth=1.2, label='Median')
+    ax.set_ylim(raster.y_range)
+    ax.legend(loc='upper right')
+    return raster
+
+def draw_statistics(ax, t, summary, n, width=DEFAULT_WIDTH, color='C0'):
+    """Draw the fan chart of streamed ensemble statistics (see rsv_sim.statistics) on matplotlib axes.
+
+    The bands pair the saved quantiles from the outside in, the centre line is the median if it was
+    kept, the mean otherwise.
+
+    Parameters:
+    - ax (matplotlib.axes.Axes): Axes to draw on.
+    - t (numpy.ndarray): Time array.
+    - summary (dict): Statistics, see EnsembleStatistics.summary or load_statistics.
+    - n (int): Compartment, 0, 1 or 2.
+    - width (int): Points drawn per curve.
+    - color: Colour of the bands.
+    """
+    index = pixel_columns(t, width)
+    times = np.asarray(t)[index]
+    quantiles = sorted(summary['quantiles'])
+    for k in range(len(quantiles) // 2):
+        p_low, p_high = quantiles[k], quantiles[-1 - k]
+        ax.fill_between(times, np.asarray(summary['quantiles'][p_low])[index, n],
+                        np.asarray(summary['quantiles'][p_high])[index, n], color=color, alpha=0.2 + 0.15 * k,
+                        linewidth=0, label=f'{100 * p_low:g}-{100 * p_high:g}%')
+    if 0.5 in summary['quantiles']:
+        ax.plot(times, np.asarray(summary['quantiles'][0.5])[index, n], color=color, linewidth=1.2, label='Median')
+    else:
+        ax.plot(times, np.asarray(summary['mean'])[index, n], color=color, linewidth=1.2, label='Mean')
+    ax.legend(loc='upper right')
+
+def _save_figures(draw, title, directory, dpi=100, extension='png'):
+    """Create, draw and save one figure per compartment without pyplot.
+
+    Parameters:
+    - draw (callable): draw(ax, n) draws compartment n.
+
+    Returns:
+    - list: Paths of the saved figures.
+    """
+    from matplotlib.figure import Figure
+
+    paths = []
+    for n in range(0, 3):
+        fig = Figure(figsize=(10, 6), dpi=dpi)
+        ax = fig.subplots()
+        draw(ax, n)
+        ax.set_title(title)
+        ax.set_xlabel('Time t (years)')
+        ax.set_ylabel(LABELS_ON_Y[n])
+        fig.tight_layout()
+        path = (Path(directory) / FILE_NAMES[n]).with_suffix(f'.{extension}')
+        fig.savefig(path)
+        paths.append(path)
+    return paths
+
+def save_trajectory_plots(t, trajectories, title, directory, **options):
+    """Save one figure per compartment with every trajectory.
+
+    Parameters:
+    - t (numpy.ndarray): Time array.
+    - trajectories (numpy.ndarray): (M, len(t), 3) array of S, I, R.
+    - title (str): Title of the figures.
+    - directory (str): Output directory.
+    - options: Passed to draw_ensemble.
+
+    Returns:
+    - list: Paths of the saved figures.
+    """
+    return _save_figures(lambda ax, n: draw_ensemble(ax, t, trajectories[:, :, n], **options), title, directory)
+
+def save_ensemble_plots(directory, title, out=None, extension='png', dpi=100, **options):
+    """Save one figure per compartment from a store (see rsv_sim.storage), reading it block by block.
+
+    Stores of streamed statistics are drawn with draw_statistics.
+
+    Parameters:
+    - directory (str): Store directory.
+    - title (str): Title of the figures.
+    - out (str): Output directory, the store directory if None.
+    - extension (str): File format, e.g. 'png', 'pdf' or 'svg' (the raster is embedded as an image).
+    - dpi (int): Resolution of the figures.
+    - options: Passed to draw_ensemble.
+
+    Returns:
+    - list: Paths of the saved figures.
+    """
+    from rsv_sim.storage import COLUMNS, load_statistics, open_store
+
+    store = open_store(directory)
+    out = Path(directory if out is None else out)
+    out.mkdir(parents=True, exist_ok=True)
+    if store['metadata']['columns']:
+        def draw(ax, n):
+            draw_ensemble(ax, store['time'], store[COLUMNS[n]], **options)
+    else:
+        summary = load_statistics(directory)
+
+        def draw(ax, n):
+            draw_statistics(ax, store['time'], summary, n, width=options.get('width', DEFAULT_WIDTH))
+    return _save_figures(draw, title, out, dpi, extension)
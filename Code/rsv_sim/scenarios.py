@@ -0,0 +1,148 @@
+import json
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+#############################################################################################################
+# Scenarios
+# A scenario file declares the model, time grid, parameters and ensemble settings of one run, or a
+# list of runs under [[scenarios]] that inherit the top-level values.
+
+MODELS = ('ode', 'sde-transmission', 'sde-birth')
+
+# Defaults of the interactive scripts
+DEFAULT_SCENARIO = {
+    'name': 'scenario',
+    'model': None,
+    'realizations': 10,
+    'seed': 0,
+    'workers': None,
+    'time': {'t_in': 0, 't_end': 5, 'N': 5000},
+    'parameters': {'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36, 'alpha': 0.728},
+    'initial_conditions': {'S0': 0.9988, 'I0': 0.0012, 'R0': 0.0},
+    # ODE solver (see rsv_sim.solvers.solve_sir) and SDE scheme (see rsv_sim.integrators.SCHEMES)
+    'solver': {'method': 'RK45', 'rtol': 1e-3, 'atol': 1e-6},
+    'scheme': 'euler_maruyama',
+    # Steps per window of a checkpointed SDE run (see rsv_sim.checkpoint.run_windowed), None for one pass
+    'window': None,
+    'checkpoint_every': 1,
+}
+
+def _merge(base, override):
+    """Recursively merge two scenario dictionaries, values of override win."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def load_scenarios(path, model=None):
+    """Read the scenarios declared in a TOML or JSON file.
+
+    Parameters:
+    - path (str): Scenario file.
+    - model (str): Model overriding the one of the file.
+
+    Returns:
+    - list: Complete scenario dictionaries, in file order.
+    """
+    path = Path(path)
+    if path.suffix == '.json':
+        config = json.loads(path.read_text())
+    else:
+        with open(path, 'rb') as file:
+            config = tomllib.load(file)
+
+    entries = config.pop('scenarios', [{}])
+    base = _merge(DEFAULT_SCENARIO, {'name': path.stem, **config})
+    scenarios = []
+    for index, entry in enumerate(entries):
+        scenario = _merge(base, entry)
+        if len(entries) > 1 and 'name' not in entry:
+            scenario['name'] = f"{base['name']}_{index}"
+        if model is not None:
+            scenario['model'] = model
+        if scenario['model'] not in MODELS:
+            raise ValueError(f"Scenario '{scenario['name']}': model must be one of {MODELS}, got {scenario['model']!r}")
+        scenarios.append(scenario)
+    return scenarios
+
+def sde_parameters(scenario):
+    """Keyword arguments of Euler_Maruyama_ensemble for a scenario.
+
+    Returns:
+    - dict: t_in, t_end, N, model parameters and S_in, I_in, R_in.
+    """
+    ic = scenario['initial_conditions']
+    return {**scenario['time'], **scenario['parameters'],
+            'S_in': ic['S0'], 'I_in': ic['I0'], 'R_in': ic['R0']}
+
+def run_scenario(scenario, directory, statistics=False):
+    """Simulate a scenario and write its results to a store (see rsv_sim.storage).
+
+    Parameters:
+    - scenario (dict): Scenario returned by load_scenarios.
+    - directory (str): Store directory of the scenario.
+    - statistics (bool): For the SDE models, keep only streamed ensemble statistics.
+
+    Returns:
+    - dict: 'time', 'store' (read-only memory maps, M = 1 for the ODE) or 'statistics',
+      and 'info' with run metadata.
+    """
+    from rsv_sim.sde import time_grid
+    from rsv_sim.storage import create_store, open_store, save_statistics, write_block
+
+    time = scenario['time']
+    _, t = time_grid(time['t_in'], time['t_end'], time['N'])
+    metadata = {'scenario': scenario['name'], 'model': scenario['model']}
+
+    if scenario['model'] == 'ode':
+        from rsv_sim.solvers import solve_deterministic
+        params = {k: v for k, v in scenario['parameters'].items() if k != 'alpha'}
+        # Scenarios that only differ in their SDE settings share one ODE solve
+        trajectories, solver_stats = solve_deterministic(t, params, scenario['initial_conditions'], **scenario['solver'])
+        store = create_store(directory, 1, t, {**metadata, 'parameters': params,
+                                               'initial_conditions': scenario['initial_conditions']})
+        write_block(store, 0, trajectories)
+        del store
+        return {'time': t, 'store': open_store(directory), 'info': solver_stats}
+
+    model = scenario['model'].split('-', 1)[1]
+    parameters = sde_parameters(scenario)
+    if statistics:
+        from rsv_sim.noise import root_entropy
+        from rsv_sim.statistics import stream_ensemble
+        seed = root_entropy(scenario['seed'])
+        TS, summary = stream_ensemble(scenario['realizations'], parameters, model=model, seed=seed,
+                                      scheme=scenario['scheme'])
+        create_store(directory, scenario['realizations'], TS,
+                     {**metadata, 'parameters': parameters, 'seed': seed}, columns=())
+        save_statistics(directory, summary)
+        return {'time': TS, 'statistics': summary, 'info': {}}
+
+    if scenario['window']:
+        from rsv_sim.checkpoint import run_windowed
+        if scenario['scheme'] != 'euler_maruyama':
+            raise ValueError(f"Scenario '{scenario['name']}': windowed runs need the euler_maruyama scheme")
+        # Resumes from the checkpoint left in directory by an interrupted run
+        store, stats = run_windowed(scenario['realizations'], parameters, directory, model=model,
+                                    seed=scenario['seed'], window=scenario['window'],
+                                    checkpoint_every=scenario['checkpoint_every'], metadata=metadata)
+        return {'time': store['time'], 'store': store, 'info': stats}
+
+    from rsv_sim.parallel import run_ensemble_to_store
+    store, stats = run_ensemble_to_store(scenario['realizations'], parameters, directory, model=model,
+                                         seed=scenario['seed'], workers=scenario['workers'], metadata=metadata,
+                                         scheme=scenario['scheme'])
+    return {'time': store['time'], 'store': store, 'info': stats}
+
+def save_scenario(result, scenario, directory):
+    """Write the resolved scenario and run metadata to directory/scenario.json."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / 'scenario.json').write_text(json.dumps({**scenario, 'info': result['info']}, indent=2))
@@ -0,0 +1,192 @@
+import numpy as np
+
+from rsv_sim import instrumentation
+from rsv_sim.kernels import COMPILED_CHUNKS, resolve_backend
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, increment_chunks, realization_streams, root_entropy
+
+#############################################################################################################
+# Batched Euler-Maruyama
+# All realizations of an ensemble are advanced together as an (M, 3) state array.
+
+# Number of Brownian increments drawn per realization and per step, in the order they enter the step.
+NOISE_DIMENSIONS = {
+    'transmission': 3,   # b0_tilde, S, I
+    'birth': 5,          # b0_tilde, mu_tilde, S, I, R
+}
+
+def transmission_step(t, dt, X, dW, mu, b0, b1, phi, gamma, ni, alpha):
+    """Advance every realization by one Euler-Maruyama step with transmission rate perturbation.
+
+    Parameters:
+    - t (float): Time at the beginning of the step.
+    - dt (float): Time step.
+    - X (numpy.ndarray): (M, 3) array of S, I, R values.
+    - dW (numpy.ndarray): (M, 3) array of Brownian increments.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+
+    Returns:
+    - numpy.ndarray: (M, 3) array of S, I, R values at t + dt.
+    """
+    S = X[:, 0]
+    I = X[:, 1]
+    R = X[:, 2]
+
+    b0_tilde = b0 + alpha * dW[:, 0]
+    beta = b0_tilde * (1 + b1 * np.cos(2 * np.pi * t + phi))
+
+    X_new = np.empty_like(X)
+    X_new[:, 0] = S + ((mu - mu * S - beta * S * I + gamma * R) * dt - (alpha / b0_tilde) * beta * S * I * dW[:, 1])
+    X_new[:, 1] = I + ((beta * S * I - ni * I - mu * I) * dt - (alpha / b0_tilde) * beta * S * I * dW[:, 2])
+    X_new[:, 2] = R + (ni * I - mu * R - gamma * R) * dt
+    return X_new
+
+def birth_step(t, dt, X, dW, mu, b0, b1, phi, gamma, ni, alpha):
+    """Advance every realization by one Euler-Maruyama step with birth rate perturbation.
+
+    Parameters:
+    - t (float): Time at the beginning of the step.
+    - dt (float): Time step.
+    - X (numpy.ndarray): (M, 3) array of S, I, R values.
+    - dW (numpy.ndarray): (M, 5) array of Brownian increments.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+
+    Returns:
+    - numpy.ndarray: (M, 3) array of S, I, R values at t + dt.
+    """
+    S = X[:, 0]
+    I = X[:, 1]
+    R = X[:, 2]
+
+    b0_tilde = b0 + alpha * dW[:, 0]
+    beta = b0_tilde * (1 + b1 * np.cos(2 * np.pi * t + phi))
+    mu_tilde = mu + alpha * dW[:, 1]
+
+    X_new = np.empty_like(X)
+    X_new[:, 0] = S + ((mu_tilde - mu*S - beta*S*I + gamma*R) * dt + alpha*(1-S) * dW[:, 2])
+    X_new[:, 1] = I + ((beta*S*I - ni*I - mu*I) * dt - alpha*I * dW[:, 3])
+    X_new[:, 2] = R + ((ni*I - mu*R - gamma*R) * dt - alpha*R * dW[:, 4])
+    return X_new
+
+STEPS = {
+    'transmission': transmission_step,
+    'birth': birth_step,
+}
+
+def numpy_chunk(step):
+    """Build a chunk kernel (see rsv_sim.kernels) that applies a vectorized step K times.
+
+    Parameters:
+    - step (function): transmission_step or birth_step.
+
+    Returns:
+    - function: Chunk kernel.
+    """
+    def advance(out, X0, step0, t_in, dt, increments, mu, b0, b1, phi, gamma, ni, alpha):
+        X = X0
+        for k in range(increments.shape[0]):
+            t = t_in + (step0 + k) * dt
+            X = step(t, dt, X, increments[k], mu, b0, b1, phi, gamma, ni, alpha)
+            out[:, k] = X
+    return advance
+
+CHUNKS = {
+    'numpy': {model: numpy_chunk(step) for model, step in STEPS.items()},
+    'numba': COMPILED_CHUNKS,
+}
+
+def time_grid(t_in, t_end, N):
+    """Build the time grid used by the Euler-Maruyama scripts.
+
+    Parameters:
+    - t_in (int): Initial time.
+    - t_end (int): End time.
+    - N (int): Number of steps.
+
+    Returns:
+    - float: Time step.
+    - numpy.ndarray: N + 1 time points.
+    """
+    dt = float((t_end - t_in) / N)
+    # Same points as np.arange(t_in, t_end + dt, dt), which can return N + 2 of them through rounding
+    TS = t_in + dt * np.arange(N + 1)
+    return dt, TS
+
+def advance_window(out, X0, step0, streams, t_in, dt, mu, b0, b1, phi, gamma, ni, alpha, model='transmission',
+                   chunk_size=DEFAULT_CHUNK_SIZE, backend=None):
+    """Advance every realization by out.shape[1] Euler-Maruyama steps, drawing from its own stream.
+
+    Consecutive windows continue the streams, so splitting a run in windows gives the same
+    trajectories as a single pass.
+
+    Parameters:
+    - out (numpy.ndarray): (M, K, 3) array receiving the states after steps step0 + 1, ..., step0 + K.
+    - X0 (numpy.ndarray): (M, 3) state after step0 steps.
+    - step0 (int): Number of steps already taken.
+    - streams (list): Generators returned by realization_streams, at their position after step0 steps.
+    - t_in (float): Initial time of the run.
+    - dt (float): Time step.
+    - mu, b0, b1, phi, gamma, ni, alpha: Model parameters.
+    - model (str): 'transmission' or 'birth' perturbation.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - backend (str): 'numba' or 'numpy' kernels, the fastest available if None.
+    """
+    advance = CHUNKS[resolve_backend(backend)][model]
+    previous = X0
+    i = 0
+    for increments in increment_chunks(streams, out.shape[1], NOISE_DIMENSIONS[model], dt, chunk_size):
+        K = increments.shape[0]
+        with instrumentation.timer('sde_step'):
+            advance(out[:, i:i + K], previous, step0 + i, t_in, dt, increments, mu, b0, b1, phi, gamma, ni, alpha)
+        previous = out[:, i + K - 1]
+        i += K
+
+def Euler_Maruyama_ensemble(M, t_in, t_end, N, mu, b0, b1, phi, gamma, ni, alpha, S_in, I_in, R_in,
+                            model='transmission', seed=None, first_realization=0, chunk_size=DEFAULT_CHUNK_SIZE,
+                            out=None, backend=None):
+    """Simulate M realizations of a stochastic SIR model at once using the Euler-Maruyama method.
+
+    Parameters:
+    - M (int): Number of realizations.
+    - t_in (int): Initial time.
+    - t_end (int): End time.
+    - N (int): Number of steps.
+    - mu (float): Parameter mu.
+    - b0 (float): Parameter b0.
+    - b1 (float): Parameter b1.
+    - phi (float): Parameter phi.
+    - gamma (float): Parameter gamma.
+    - ni (int): Parameter ni.
+    - alpha (float): Perturbation strength.
+    - S_in (float): Initial susceptible population.
+    - I_in (float): Initial infected population.
+    - R_in (float): Initial recovered population.
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble, realization r uses the r-th spawned stream.
+    - first_realization (int): Index of the first realization, to simulate a slice of a larger ensemble.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - out (numpy.ndarray): Optional (M, N + 1, 3) array the trajectories are written into.
+    - backend (str): 'numba' or 'numpy' kernels, the fastest available if None.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - numpy.ndarray: (M, N + 1, 3) array of simulated S, I, R populations.
+    """
+    if model not in STEPS:
+        raise ValueError(f"Unknown model '{model}', expected one of {sorted(STEPS)}")
+
+    dt, TS = time_grid(t_in, t_end, N)
+    streams = realization_streams(root_entropy(seed), range(first_realization, first_realization + M))
+
+    results = np.empty((M, TS.size, 3)) if out is None else out
+    results[:, 0, 0] = S_in
+    results[:, 0, 1] = I_in
+    results[:, 0, 2] = R_in
+
+    with instrumentation.timer('ensemble'):
+        advance_window(results[:, 1:], results[:, 0], 0, streams, t_in, dt, mu, b0, b1, phi, gamma, ni, alpha,
+                       model=model, chunk_size=chunk_size, backend=backend)
+    instrumentation.count('sde_steps', N)
+    instrumentation.count('sde_realization_steps', N * M)
+    instrumentation.count('realizations', M)
+
+    return TS, results
@@ -0,0 +1,311 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import qmc
+
+from rsv_sim.ode import solve_sir_sweep
+from rsv_sim.sde import Euler_Maruyama_ensemble
+
+#############################################################################################################
+# Global sensitivity analysis of the seasonal peak
+# Designs over the model parameters (Saltelli for Sobol indices, Morris trajectories for elementary
+# effects) are evaluated in chunks of parameter sets, each chunk one batched run: the RK4 sweep of
+# rsv_sim.ode for the deterministic model, or one Euler-Maruyama ensemble with a parameter set per
+# realization for the SDE. Chunks are spread over processes. The outputs are the time and height of
+# the epidemic peak in the last simulated year, the cycle the model has settled on by then.
+
+PARAMETERS = ('mu', 'b0', 'b1', 'phi', 'gamma', 'ni', 'alpha')
+
+# Ranges around the article's values; phi stays within one winter so the peak time does not wrap
+DEFAULT_BOUNDS = {
+    'mu': (0.005, 0.015),
+    'b0': (20.0, 60.0),
+    'b1': (0.1, 0.6),
+    'phi': (0.5, 1.6),
+    'gamma': (0.9, 3.6),
+    'ni': (18.0, 54.0),
+    'alpha': (0.0, 1.5),
+}
+DEFAULT_FIXED = {'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36, 'alpha': 0.728}
+
+OUTPUTS = ('peak_time', 'peak_size')
+BACKENDS = ('ode', 'sde')
+
+# Parameter sets evaluated by one task
+DEFAULT_CHUNK_SIZE = 1000
+
+def peak_outputs(Y, t):
+    """Peak time and size of trajectories over their last year.
+
+    Parameters:
+    - Y (numpy.ndarray): (P, len(t), 3) trajectories.
+    - t (numpy.ndarray): Time grid.
+
+    Returns:
+    - numpy.ndarray: (P, 2) peak time in years from January 1 (in [-0.5, 0.5)) and peak of I.
+    """
+    last = t >= t[-1] - 1
+    I = Y[:, last, 1]
+    peak = np.argmax(I, axis=1)
+    time = (t[last][peak] + 0.5) % 1 - 0.5
+    return np.stack([time, I[np.arange(I.shape[0]), peak]], axis=1)
+
+def simulate_chunk(X, names, fixed, backend='ode', t_end=5, steps_per_year=365, replicates=1, seed=0,
+                   first=0, initial_conditions=(0.9988, 0.0012, 0.0)):
+    """Trajectories for a chunk of parameter sets in one batched run.
+
+    Parameters:
+    - X (numpy.ndarray): (n, len(names)) parameter values.
+    - names (tuple): Parameters varied, the others are taken from fixed.
+    - fixed (dict): Values of the parameters not in names.
+    - backend (str): 'ode' (batched RK4) or 'sde' (transmission-perturbation Euler-Maruyama).
+    - t_end (int): Years simulated.
+    - steps_per_year (int): Output points (and steps) per year.
+    - replicates (int): SDE realizations per parameter set.
+    - seed (int): Seed of the SDE; parameter set i uses the streams of realizations
+      (first + i) * replicates onwards, so results do not depend on the chunking.
+    - first (int): Index of the chunk's first parameter set in the design.
+    - initial_conditions (tuple): S0, I0, R0.
+
+    Returns:
+    - numpy.ndarray: Time grid.
+    - numpy.ndarray: (n, len(t), 3) trajectories, or (n, replicates, len(t), 3) for the SDE.
+    """
+    params = {**fixed, **{name: X[:, k] for k, name in enumerate(names)}}
+    S0, I0, R0 = initial_conditions
+    N = int(t_end * steps_per_year)
+    if backend == 'ode':
+        t = np.linspace(0, t_end, N + 1)
+        return t, solve_sir_sweep(t, params['b0'], params['b1'], params['phi'], params['mu'], params['gamma'],
+                                  params['ni'], S0, I0, R0)
+    if backend != 'sde':
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    # One realization per (parameter set, replicate), parameters broadcast over realizations
+    repeated = {name: np.repeat(np.broadcast_to(params[name], X.shape[0]), replicates)
+                for name in ('mu', 'b0', 'b1', 'phi', 'gamma', 'ni', 'alpha')}
+    t, Y = Euler_Maruyama_ensemble(X.shape[0] * replicates, 0, t_end, N, **repeated, S_in=S0, I_in=I0, R_in=R0,
+                                   seed=seed, first_realization=first * replicates, backend='numpy')
+    return t, Y.reshape(X.shape[0], replicates, t.size, 3)
+
+def evaluate_chunk(X, names, fixed, backend='ode', **options):
+    """Peak outputs for a chunk of parameter sets, averaged over the SDE replicates.
+
+    Parameters:
+    - X, names, fixed, backend: See simulate_chunk.
+    - options: Passed to simulate_chunk.
+
+    Returns:
+    - numpy.ndarray: (n, 2) outputs in the order of OUTPUTS.
+    """
+    t, Y = simulate_chunk(X, names, fixed, backend, **options)
+    if backend == 'ode':
+        return peak_outputs(Y, t)
+    return peak_outputs(Y.reshape(-1, t.size, 3), t).reshape(X.shape[0], -1, 2).mean(axis=1)
+
+def _evaluate_task(task):
+    """Worker: evaluate one chunk."""
+    X, first, options = task
+    return evaluate_chunk(X, first=first, **options)
+
+def evaluate_design(X, names, fixed=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    """Peak outputs for every row of a design, in chunks spread over processes.
+
+    Parameters:
+    - X (numpy.ndarray): (n, len(names)) parameter values.
+    - names (tuple): Parameters varied.
+    - fixed (dict): Values of the other parameters, DEFAULT_FIXED if None.
+    - workers (int): Number of processes, all the available cores if None.
+    - chunk_size (int): Parameter sets per batched run.
+    - options: Passed to evaluate_chunk (backend, t_end, replicates, seed...).
+
+    Returns:
+    - numpy.ndarray: (n, 2) outputs in the order of OUTPUTS.
+    """
+    options = {'names': tuple(names), 'fixed': {**DEFAULT_FIXED, **(fixed or {})}, **options}
+    tasks = [(X[start:start + chunk_size], start, options) for start in range(0, X.shape[0], chunk_size)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        return np.concatenate([_evaluate_task(task) for task in tasks])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(_evaluate_task, tasks)))
+
+def _scale(unit, names, bounds):
+    """Map points of the unit hypercube to the parameter bounds."""
+    lower, upper = np.array([bounds[name] for name in names]).T
+    return lower + unit * (upper - lower)
+
+def saltelli_design(N, names, bounds=None, seed=0):
+    """Saltelli design for first-order and total Sobol indices.
+
+    Parameters:
+    - N (int): Base sample size, a power of 2 keeps the Sobol sequence balanced.
+    - names (tuple): Parameters varied (d of them).
+    - bounds (dict): Range of every parameter, DEFAULT_BOUNDS if None.
+    - seed (int): Seed of the scrambled Sobol sequence.
+
+    Returns:
+    - numpy.ndarray: (N (d + 2), d) design: the N rows of A, the N rows of B, then for every
+      parameter i the N rows of A with column i taken from B.
+    """
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    d = len(names)
+    base = qmc.Sobol(2 * d, scramble=True, seed=seed).random(N)
+    A, B = base[:, :d], base[:, d:]
+    AB = np.repeat(A[None], d, axis=0)
+    AB[np.arange(d), :, np.arange(d)] = B.T
+    return _scale(np.concatenate([A, B, AB.reshape(d * N, d)]), names, bounds)
+
+def sobol_indices(Y, d, n_bootstrap=1000, confidence=0.95, seed=0):
+    """First-order and total Sobol indices of the outputs of a Saltelli design.
+
+    Estimators of Saltelli (2010) for S1 and Jansen for ST; the confidence intervals are percentiles
+    of the indices recomputed on bootstrap resamples of the N base rows.
+
+    Parameters:
+    - Y (numpy.ndarray): (N (d + 2),) or (N (d + 2), k) outputs in the order of saltelli_design.
+    - d (int): Number of parameters.
+    - n_bootstrap (int): Bootstrap resamples.
+    - confidence (float): Level of the intervals.
+    - seed (int): Seed of the bootstrap.
+
+    Returns:
+    - dict: 'S1' and 'ST' as (d,) or (d, k) arrays, 'S1_conf' and 'ST_conf' with a leading axis of
+      2 (lower, upper).
+    """
+    Y = np.asarray(Y, dtype=float)
+    N = Y.shape[0] // (d + 2)
+    shape = Y.shape[1:]
+    A, B, AB = Y[:N].reshape(N, -1), Y[N:2 * N].reshape(N, -1), Y[2 * N:].reshape(d, N, -1)
+    # Every estimator is a function of means over the base rows, so a resample is a weighted mean:
+    # the resampling counts times a table of per-row terms
+    terms = np.concatenate([A, B, A ** 2, B ** 2, (B * (AB - A)).transpose(1, 0, 2).reshape(N, -1),
+                            ((A - AB) ** 2).transpose(1, 0, 2).reshape(N, -1)], axis=1)
+
+    def indices(means):
+        k = A.shape[1]
+        a, b, a2, b2 = (means[..., i * k:(i + 1) * k] for i in range(4))
+        variance = (a2 + b2) / 2 - ((a + b) / 2) ** 2
+        first = means[..., 4 * k:(4 + d) * k].reshape(means.shape[:-1] + (d, k)) / variance[..., None, :]
+        total = 0.5 * means[..., (4 + d) * k:].reshape(means.shape[:-1] + (d, k)) / variance[..., None, :]
+        return first.reshape(means.shape[:-1] + (d,) + shape), total.reshape(means.shape[:-1] + (d,) + shape)
+
+    first, total = indices(terms.mean(axis=0))
+    rng = np.random.default_rng(seed)
+    tails = [(1 - confidence) / 2, (1 + confidence) / 2]
+    means = np.empty((n_bootstrap, terms.shape[1]))
+    for start in range(0, n_bootstrap, 100):
+        counts = np.stack([np.bincount(rng.integers(0, N, N), minlength=N) for _ in range(min(100, n_bootstrap - start))])
+        means[start:start + counts.shape[0]] = counts @ terms / N
+    boot_first, boot_total = indices(means)
+    return {
+        'S1': first,
+        'ST': total,
+        'S1_conf': np.quantile(boot_first, tails, axis=0),
+        'ST_conf': np.quantile(boot_total, tails, axis=0),
+    }
+
+def morris_design(trajectories, names, bounds=None, levels=4, seed=0):
+    """Morris one-at-a-time trajectories on a grid of levels.
+
+    Parameters:
+    - trajectories (int): Number of trajectories r.
+    - names (tuple): Parameters varied (d of them).
+    - bounds (dict): Range of every parameter, DEFAULT_BOUNDS if None.
+    - levels (int): Grid levels per parameter (even).
+    - seed (int): Seed of the design.
+
+    Returns:
+    - numpy.ndarray: (r (d + 1), d) design, trajectory after trajectory.
+    - numpy.ndarray: (r, d) index of the parameter changed at each step of each trajectory.
+    - numpy.ndarray: (r, d) signed change of that parameter in units of its range.
+    """
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    d = len(names)
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    # Start on the lower half of the grid so that start + delta stays inside [0, 1]
+    start = rng.integers(0, levels // 2, (trajectories, d)) / (levels - 1)
+    order = np.argsort(rng.random((trajectories, d)), axis=1)
+    sign = rng.choice([-1.0, 1.0], (trajectories, d))
+    points = np.empty((trajectories, d + 1, d))
+    # A negative step starts from the upper end, so every point stays on the grid
+    current = np.where(sign < 0, start + delta, start)
+    points[:, 0] = current
+    steps = np.zeros((trajectories, d))
+    for j in range(d):
+        index = order[:, j]
+        change = sign[np.arange(trajectories), index] * delta
+        current = current.copy()
+        current[np.arange(trajectories), index] += change
+        points[:, j + 1] = current
+        steps[:, j] = change
+    return _scale(points.reshape(-1, d), names, bounds), order, steps
+
+def morris_effects(Y, order, steps, n_bootstrap=1000, confidence=0.95, seed=0):
+    """Elementary effects of a Morris design.
+
+    Parameters:
+    - Y (numpy.ndarray): (r (d + 1),) or (r (d + 1), k) outputs in the order of morris_design.
+    - order, steps: Returned by morris_design.
+    - n_bootstrap (int): Bootstrap resamples of the trajectories.
+    - confidence (float): Level of the interval of mu_star.
+    - seed (int): Seed of the bootstrap.
+
+    Returns:
+    - dict: 'mu', 'mu_star' (mean absolute effect) and 'sigma' as (d,) or (d, k) arrays, and
+      'mu_star_conf' with a leading axis of 2 (lower, upper).
+    """
+    r, d = order.shape
+    Y = np.asarray(Y, dtype=float).reshape((r, d + 1) + np.shape(Y)[1:])
+    differences = np.diff(Y, axis=1) / steps.reshape((r, d) + (1,) * (Y.ndim - 2))
+    effects = np.empty_like(differences)
+    trajectory = np.arange(r)[:, None]
+    # Effect of parameter order[t, j] measured at step j of trajectory t
+    effects[trajectory, order] = differences
+    rng = np.random.default_rng(seed)
+    resampled = np.abs(effects)[rng.integers(0, r, (n_bootstrap, r))].mean(axis=1)
+    return {
+        'mu': effects.mean(axis=0),
+        'mu_star': np.abs(effects).mean(axis=0),
+        'sigma': effects.std(axis=0, ddof=1),
+        'mu_star_conf': np.quantile(resampled, [(1 - confidence) / 2, (1 + confidence) / 2], axis=0),
+    }
+
+def sensitivity_analysis(method='sobol', samples=1024, names=None, bounds=None, backend='ode', seed=0,
+                         n_bootstrap=1000, confidence=0.95, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         **options):
+    """Design, evaluation and indices of a global sensitivity analysis of the peak time and size.
+
+    Parameters:
+    - method (str): 'sobol' (N (d + 2) runs) or 'morris' (r (d + 1) runs).
+    - samples (int): Base sample size N, or number of Morris trajectories r.
+    - names (tuple): Parameters varied, PARAMETERS (without alpha for the ODE) if None.
+    - bounds (dict): Ranges of the parameters, DEFAULT_BOUNDS if None.
+    - backend (str): 'ode' or 'sde'.
+    - seed (int): Seed of the design, the bootstrap and the SDE.
+    - n_bootstrap (int): Bootstrap resamples of the confidence intervals.
+    - confidence (float): Level of the intervals.
+    - workers (int): Number of processes, all the available cores if None.
+    - chunk_size (int): Parameter sets per batched run.
+    - options: Passed to evaluate_chunk (fixed, t_end, steps_per_year, replicates...).
+
+    Returns:
+    - dict: 'names', 'outputs', 'X' and 'Y' of the design, and the indices of sobol_indices or
+      morris_effects, with an output axis in the order of OUTPUTS.
+    """
+    if names is None:
+        names = PARAMETERS if backend == 'sde' else tuple(p for p in PARAMETERS if p != 'alpha')
+    names = tuple(names)
+    if method == 'sobol':
+        X = saltelli_design(samples, names, bounds, seed)
+    elif method == 'morris':
+        X, order, steps = morris_design(samples, names, bounds, seed=seed)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'sobol' or 'morris'")
+    Y = evaluate_design(X, names, backend=backend, seed=seed, workers=workers, chunk_size=chunk_size, **options)
+    if method == 'sobol':
+        indices = sobol_indices(Y, len(names), n_bootstrap, confidence, seed)
+    else:
+        indices = morris_effects(Y, order, steps, n_bootstrap, confidence, seed)
+    return {'method': method, 'names': names, 'outputs': OUTPUTS, 'X': X, 'Y': Y, **indices}
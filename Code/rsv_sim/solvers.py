@@ -0,0 +1,214 @@
+from collections import OrderedDict
+
+import numpy as np
+import scipy.integrate
+from scipy import sparse
+
+from rsv_sim import instrumentation
+from rsv_sim.cache import cache_key
+from rsv_sim.integrators import drift_jacobian
+from rsv_sim.ode import PARAMETER_NAMES, sir_model_batch, sweep_arrays
+
+#############################################################################################################
+# Solver selection for the deterministic SIR model
+# The recovery rate ni = 36 is the fastest time scale of the model and bounds the step of explicit
+# Runge-Kutta methods wherever it dominates; LSODA switches to BDF there, BDF and Radau are never
+# bounded by it. The implicit solvers get the analytic Jacobian and its structure. P parameter sets
+# are stacked as a (P, 3) state, so the Jacobian is block diagonal with 3 x 3 blocks: sparse for BDF
+# and Radau, banded for LSODA and odeint.
+
+SOLVE_IVP_METHODS = ('RK45', 'RK23', 'DOP853', 'LSODA', 'BDF', 'Radau')
+SOLVERS = SOLVE_IVP_METHODS + ('odeint',)
+IMPLICIT_SOLVERS = ('LSODA', 'BDF', 'Radau', 'odeint')
+
+# Structural non-zeros of d(dS, dI, dR)/d(S, I, R)
+JACOBIAN_PATTERN = np.array([[1, 1, 1],
+                             [1, 1, 0],
+                             [0, 1, 1]])
+
+# Lower and upper bandwidth of the stacked Jacobian
+BANDWIDTH = 2
+
+def jacobian_sparsity(P):
+    """Sparsity structure of the Jacobian of P stacked systems.
+
+    Returns:
+    - scipy.sparse.csc_matrix: (3P, 3P) pattern.
+    """
+    return sparse.kron(sparse.identity(P), JACOBIAN_PATTERN, format='csc')
+
+def jacobian_blocks(t, y, params):
+    """Analytic Jacobian blocks of the stacked system.
+
+    Parameters:
+    - t (float): Time.
+    - y (numpy.ndarray): (3P,) state laid out as (P, 3).
+    - params (dict): (P,) parameter arrays by name.
+
+    Returns:
+    - numpy.ndarray: (P, 3, 3) array of d(dS, dI, dR)/d(S, I, R) for each system.
+    """
+    P = params['b0'].size
+    return drift_jacobian(t, y.reshape(P, 3), params['mu'], params['b0'], params['b1'], params['phi'],
+                          params['gamma'], params['ni'])
+
+def banded(blocks):
+    """Pack block-diagonal Jacobian blocks in the LAPACK banded layout, J[i, j] at [BANDWIDTH + i - j, j].
+
+    Returns:
+    - numpy.ndarray: (2 * BANDWIDTH + 1, 3P) array.
+    """
+    P = blocks.shape[0]
+    packed = np.zeros((2 * BANDWIDTH + 1, P, 3))
+    for i in range(3):
+        for j in range(3):
+            packed[BANDWIDTH + i - j, :, j] = blocks[:, i, j]
+    return packed.reshape(2 * BANDWIDTH + 1, 3 * P)
+
+def _stacked_rhs(params):
+    """Right-hand side of the stacked (P, 3) system, vectorized over columns of y."""
+    args = tuple(params[name] for name in PARAMETER_NAMES)
+    P = params['b0'].size
+
+    def fun(t, y):
+        Y = y.reshape((P, 3) + y.shape[1:]).swapaxes(0, 1)
+        return sir_model_batch(t, Y, *args).swapaxes(0, 1).reshape(y.shape)
+    return fun
+
+def _solve_ivp_stepping(t, fun, y0, method, jacobian, params, rtol, atol, options):
+    """Step a scipy OdeSolver through t, interpolating the output times.
+
+    Returns:
+    - numpy.ndarray: (len(t), 3P) solution.
+    - dict: Solver statistics.
+    """
+    P = y0.size // 3
+    if method in IMPLICIT_SOLVERS:
+        if method == 'LSODA':
+            options = {'lband': BANDWIDTH, 'uband': BANDWIDTH, **options}
+            if jacobian:
+                options['jac'] = lambda t, y: banded(jacobian_blocks(t, y, params))
+        elif jacobian:
+            indices = np.arange(P)
+            options['jac'] = lambda t, y: sparse.bsr_matrix((jacobian_blocks(t, y, params), indices,
+                                                             np.arange(P + 1)), shape=(3 * P, 3 * P)).tocsc()
+        else:
+            options['jac_sparsity'] = jacobian_sparsity(P)
+    solver = getattr(scipy.integrate, method)(fun, t[0], y0, t[-1], rtol=rtol, atol=atol,
+                                              vectorized=True, **options)
+    # Explicit Runge-Kutta methods evaluate n_stages right-hand sides per attempted step, so the
+    # evaluations counted during a step tell how many attempts were rejected
+    n_stages = getattr(solver, 'n_stages', None) if instrumentation.enabled() else None
+    out = np.empty((t.size, y0.size))
+    out[0] = y0
+    steps = 0
+    j = 1
+    while j < t.size:
+        before = instrumentation.value('rhs_evaluations')
+        message = solver.step()
+        if solver.status == 'failed':
+            raise RuntimeError(message)
+        if n_stages:
+            instrumentation.count('ode_rejected_steps',
+                                  (instrumentation.value('rhs_evaluations') - before) // n_stages - 1)
+        steps += 1
+        k = np.searchsorted(t, solver.t, side='right')
+        if k > j:
+            out[j:k] = solver.dense_output()(t[j:k]).T
+            j = k
+    return out, {'steps': steps, 'nfev': int(solver.nfev), 'njev': int(solver.njev), 'nlu': int(solver.nlu)}
+
+def _odeint(t, fun, y0, jacobian, params, rtol, atol, options):
+    """Solve with odeint (LSODA) and the banded Jacobian.
+
+    Returns:
+    - numpy.ndarray: (len(t), 3P) solution.
+    - dict: Solver statistics.
+    """
+    Dfun = (lambda t, y: banded(jacobian_blocks(t, y, params))) if jacobian else None
+    out, info = scipy.integrate.odeint(fun, y0, t, Dfun=Dfun, ml=BANDWIDTH, mu=BANDWIDTH, rtol=rtol, atol=atol,
+                                       full_output=True, tfirst=True, **options)
+    if info['message'] != 'Integration successful.':
+        raise RuntimeError(info['message'])
+    # odeint does not report its LU decompositions
+    return out, {'steps': int(info['nst'][-1]), 'nfev': int(info['nfe'][-1]), 'njev': int(info['nje'][-1]),
+                 'nlu': None}
+
+def solve_sir(t, b0, b1, phi, mu, gamma, ni, S0, I0, R0, method='LSODA', jacobian=True,
+              rtol=1e-6, atol=1e-9, **options):
+    """Solve the deterministic SIR model with a chosen solver and report its work.
+
+    Every argument from b0 to R0 may be a scalar or an array, broadcast to P parameter sets as in
+    rsv_sim.ode.solve_sir_sweep.
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - b0, b1, phi, mu, gamma, ni: Model parameters.
+    - S0, I0, R0: Initial conditions.
+    - method (str): One of SOLVERS; LSODA, BDF, Radau or odeint for long horizons.
+    - jacobian (bool): Give the implicit solvers the analytic Jacobian; if False they estimate it
+      by finite differences using its sparsity.
+    - rtol, atol (float): Tolerances of the solver.
+    - options: Passed to the solver (max_step, first_step...).
+
+    Returns:
+    - numpy.ndarray: (P, len(t), 3) array of S, I, R for every parameter set.
+    - dict: 'method', accepted 'steps', right-hand side evaluations 'nfev' (one per state column for
+      vectorized calls), Jacobian evaluations 'njev' and LU decompositions 'nlu' (None for odeint,
+      which does not report them).
+    """
+    if method not in SOLVERS:
+        raise ValueError(f"Unknown solver '{method}', expected one of {SOLVERS}")
+    t = np.asarray(t, dtype=float)
+    params, Y0 = sweep_arrays(b0, b1, phi, mu, gamma, ni, S0, I0, R0)
+    y0 = Y0.T.ravel()
+    fun = instrumentation.counted(_stacked_rhs(params), columns=True)
+    with instrumentation.timer('ode_solve'):
+        if method == 'odeint':
+            out, stats = _odeint(t, fun, y0, jacobian, params, rtol, atol, options)
+        else:
+            out, stats = _solve_ivp_stepping(t, fun, y0, method, jacobian, params, rtol, atol, options)
+    instrumentation.record_solver(stats)
+    return out.reshape(t.size, -1, 3).transpose(1, 0, 2), {'method': method, **stats}
+
+#############################################################################################################
+# Shared deterministic runs
+# The ODE has no randomness, so a problem solved once serves every later request for it: plotting
+# S, I and R, several "simulations" of the same inputs, statistics and storage. Solutions are kept
+# in memory by content key and returned read-only so all the consumers can share one array.
+
+# Number of distinct problems kept in memory
+MEMO_SIZE = 32
+
+_solutions = OrderedDict()
+
+def solve_deterministic(t, params, initial_conditions, method='RK45', **options):
+    """Solve the deterministic model on the output times, reusing the solution of an identical problem.
+
+    The solver steps straight onto t (no global interpolant is built).
+
+    Parameters:
+    - t (numpy.ndarray): Output times.
+    - params (dict): b0, b1, phi, mu, gamma, ni (scalars or arrays, see solve_sir).
+    - initial_conditions (dict): S0, I0, R0.
+    - method (str): One of SOLVERS.
+    - options: Passed to solve_sir (jacobian, rtol, atol...).
+
+    Returns:
+    - numpy.ndarray: Read-only (P, len(t), 3) array of S, I, R.
+    - dict: Solver statistics of the solve that produced it, with 'reused' True if it was shared.
+    """
+    t = np.asarray(t, dtype=float)
+    params = {name: params[name] for name in PARAMETER_NAMES}
+    key = cache_key(kind='ode', t=t, parameters=params, initial_conditions=initial_conditions,
+                    method=method, options=options)
+    if key in _solutions:
+        _solutions.move_to_end(key)
+        solution, stats = _solutions[key]
+        return solution, {**stats, 'reused': True}
+    solution, stats = solve_sir(t, **params, **initial_conditions, method=method, **options)
+    solution.flags.writeable = False
+    _solutions[key] = solution, stats
+    while len(_solutions) > MEMO_SIZE:
+        _solutions.popitem(last=False)
+    return solution, {**stats, 'reused': False}
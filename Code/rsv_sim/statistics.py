@@ -0,0 +1,182 @@
+import numpy as np
+
+from rsv_sim.noise import DEFAULT_CHUNK_SIZE, root_entropy
+from rsv_sim.integrators import simulate_ensemble
+
+#############################################################################################################
+# Streaming ensemble statistics
+# Realizations are folded into running statistics block by block, so memory depends on the
+# block size and the time grid but not on the number of realizations.
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+
+# Infectives below this fraction of the population count as extinct.
+DEFAULT_EXTINCTION_THRESHOLD = 1e-6
+
+class P2Quantile:
+    """P-square estimate of one quantile, kept independently for every cell of an array.
+
+    Jain & Chlamtac (1985): five markers per cell track the minimum, the p/2, p and (1+p)/2
+    quantiles and the maximum, and are moved with a piecewise-parabolic formula as
+    observations arrive.
+    """
+
+    def __init__(self, p, shape):
+        """Parameters:
+        - p (float): Quantile in (0, 1).
+        - shape (tuple): Shape of one observation.
+        """
+        self.p = p
+        self.count = 0
+        self.q = np.empty((5,) + tuple(shape))     # marker heights
+        self.n = np.empty((5,) + tuple(shape))     # marker positions
+        self.desired = np.array([0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0])
+        self.increment = np.array([0.0, p / 2, p, (1 + p) / 2, 1.0])
+
+    def add(self, x):
+        """Add one observation.
+
+        Parameters:
+        - x (numpy.ndarray): Observation with the shape given at construction.
+        """
+        q, n = self.q, self.n
+        if self.count < 5:
+            q[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                q.sort(axis=0)
+                n[:] = np.arange(5).reshape((5,) + (1,) * (n.ndim - 1))
+            return
+        self.count += 1
+
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        # Markers strictly above the cell of x move one position to the right
+        for i in range(1, 5):
+            n[i] += x < q[i] if i < 4 else 1
+        self.desired += self.increment
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+            if not move.any():
+                continue
+            d = np.sign(d)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                linear = np.where(d > 0,
+                                  q[i] + (q[i + 1] - q[i]) / (n[i + 1] - n[i]),
+                                  q[i] - (q[i - 1] - q[i]) / (n[i - 1] - n[i]))
+            inside = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+            q[i] = np.where(move, np.where(inside, parabolic, linear), q[i])
+            n[i] += np.where(move, d, 0)
+
+    def value(self):
+        """Current estimate of the quantile.
+
+        Returns:
+        - numpy.ndarray: Estimate for every cell (exact while fewer than five observations).
+        """
+        if self.count == 0:
+            raise ValueError("No observations")
+        if self.count < 5:
+            return np.quantile(self.q[:self.count], self.p, axis=0)
+        return self.q[2].copy()
+
+class EnsembleStatistics:
+    """Running statistics of an ensemble of (N + 1, 3) trajectories.
+
+    Keeps the mean and variance per time point (Welford updates merged block by block),
+    P-square quantiles and the number of realizations in which the infectives have gone
+    extinct by each time point.
+    """
+
+    def __init__(self, shape, quantiles=DEFAULT_QUANTILES, extinction_threshold=DEFAULT_EXTINCTION_THRESHOLD):
+        """Parameters:
+        - shape (tuple): Shape of one trajectory, (N + 1, 3).
+        - quantiles (tuple): Quantiles to estimate.
+        - extinction_threshold (float): Infectives below this value count as extinct.
+        """
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)
+        self.quantiles = {p: P2Quantile(p, shape) for p in quantiles}
+        self.extinction_threshold = extinction_threshold
+        self.extinct = np.zeros(shape[0], dtype=np.int64)
+
+    def update(self, block):
+        """Fold a block of realizations into the statistics.
+
+        Parameters:
+        - block (numpy.ndarray): (m, N + 1, 3) array of trajectories.
+        """
+        m = block.shape[0]
+        if m == 0:
+            return
+        # Chan et al. merge of the block's mean and sum of squares into the running ones
+        block_mean = block.mean(axis=0)
+        block_M2 = ((block - block_mean) ** 2).sum(axis=0)
+        total = self.count + m
+        delta = block_mean - self.mean
+        self.mean += delta * (m / total)
+        self.M2 += block_M2 + delta ** 2 * (self.count * m / total)
+        self.count = total
+
+        for estimator in self.quantiles.values():
+            for trajectory in block:
+                estimator.add(trajectory)
+
+        extinct = np.logical_or.accumulate(block[:, :, 1] < self.extinction_threshold, axis=1)
+        self.extinct += extinct.sum(axis=0)
+
+    def summary(self):
+        """Collect the statistics.
+
+        Returns:
+        - dict: 'count', 'mean', 'variance' ((N + 1, 3) arrays), 'quantiles' (dict of (N + 1, 3)
+          arrays by quantile), 'extinct' (counts per time point) and 'extinction_probability'.
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean.copy(),
+            'variance': self.M2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.M2),
+            'quantiles': {p: estimator.value() for p, estimator in self.quantiles.items()},
+            'extinct': self.extinct.copy(),
+            'extinction_probability': self.extinct / max(self.count, 1),
+        }
+
+def stream_ensemble(M, parameters, model='transmission', seed=None, block_size=256,
+                    quantiles=DEFAULT_QUANTILES, extinction_threshold=DEFAULT_EXTINCTION_THRESHOLD,
+                    chunk_size=DEFAULT_CHUNK_SIZE, scheme='euler_maruyama'):
+    """Simulate an SDE ensemble keeping only its statistics.
+
+    Realizations are simulated block_size at a time with the same streams as
+    simulate_ensemble(M, **parameters, model=model, scheme=scheme, seed=seed).
+
+    Parameters:
+    - M (int): Number of realizations.
+    - parameters (dict): Parameters of Euler_Maruyama_ensemble (t_in, t_end, N, mu, ..., R_in).
+    - model (str): 'transmission' or 'birth' perturbation.
+    - seed (int): Seed of the ensemble.
+    - block_size (int): Number of realizations held in memory at once.
+    - quantiles (tuple): Quantiles to estimate.
+    - extinction_threshold (float): Infectives below this value count as extinct.
+    - chunk_size (int): Number of steps whose Brownian increments are drawn at once.
+    - scheme (str): Integration scheme, see rsv_sim.integrators.SCHEMES.
+
+    Returns:
+    - numpy.ndarray: Time steps.
+    - dict: Statistics, see EnsembleStatistics.summary.
+    """
+    seed = root_entropy(seed)
+    block = np.empty((min(block_size, M), parameters['N'] + 1, 3))
+    stats = EnsembleStatistics(block.shape[1:], quantiles, extinction_threshold)
+    TS = None
+    for first in range(0, M, block_size):
+        count = min(block_size, M - first)
+        TS, _ = simulate_ensemble(count, **parameters, model=model, scheme=scheme, seed=seed, first_realization=first,
+                                  chunk_size=chunk_size, out=block[:count])
+        stats.update(block[:count])
+    return TS, stats.summary()
@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+#############################################################################################################
+# Trajectory store
+# A store is a directory with one .npy file per compartment, each an (M, T) float64 array with
+# realizations as rows, the time grid in time.npy and a metadata.json sidecar with the model,
+# parameters and seed. Files are opened as memory maps, so readers only touch the pages of the
+# realizations and time window they slice.
+
+FORMAT = 'rsv_sim-npy-1'
+COLUMNS = ('S', 'I', 'R')
+STATISTICS_DIRECTORY = 'statistics'
+
+def create_store(directory, M, t, metadata=None, columns=COLUMNS):
+    """Create an empty store for M trajectories on the time grid t.
+
+    Parameters:
+    - directory (str): Store directory, created if needed.
+    - M (int): Number of realizations.
+    - t (numpy.ndarray): Time grid.
+    - metadata (dict): Model, parameters, seed... saved in metadata.json.
+    - columns (tuple): Columns to create, none for a store holding only statistics.
+
+    Returns:
+    - dict: Writable memory maps by column name, plus 'time'.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    t = np.asarray(t, dtype=float)
+    np.save(directory / 'time.npy', t)
+    store = {'time': t}
+    for column in columns:
+        store[column] = np.lib.format.open_memmap(directory / f'{column}.npy', mode='w+',
+                                                  dtype=np.float64, shape=(M, t.size))
+    sidecar = {'format': FORMAT, 'realizations': M, 'time_points': t.size, 'columns': list(columns),
+               **(metadata or {})}
+    (directory / 'metadata.json').write_text(json.dumps(sidecar, indent=2, default=_json_default))
+    return store
+
+def _json_default(value):
+    """Serialize NumPy scalars and arrays in the sidecar."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def write_block(store, first, block):
+    """Write a block of trajectories into a store.
+
+    Parameters:
+    - store (dict): Store returned by create_store or open_store(mode='r+').
+    - first (int): Index of the first realization of the block.
+    - block (numpy.ndarray): (m, T, 3) array of S, I, R.
+    """
+    for c, column in enumerate(COLUMNS):
+        store[column][first:first + block.shape[0]] = block[:, :, c]
+
+def open_store(directory, mode='r'):
+    """Open a store as memory maps.
+
+    Parameters:
+    - directory (str): Store directory.
+    - mode (str): 'r' to read, 'r+' to write into an existing store.
+
+    Returns:
+    - dict: Memory maps by column name, 'time' and the 'metadata' sidecar.
+    """
+    directory = Path(directory)
+    metadata = json.loads((directory / 'metadata.json').read_text())
+    if metadata.get('format') != FORMAT:
+        raise ValueError(f"{directory} is not a {FORMAT} store")
+    store = {'time': np.load(directory / 'time.npy'), 'metadata': metadata}
+    for column in metadata['columns']:
+        store[column] = np.load(directory / f'{column}.npy', mmap_mode=mode)
+    return store
+
+def read_window(directory, column, realizations=slice(None), t_start=None, t_stop=None):
+    """Read a slice of realizations over a time window, without loading the rest of the store.
+
+    Parameters:
+    - directory (str): Store directory.
+    - column (str): 'S', 'I' or 'R'.
+    - realizations (slice or array): Realizations to read.
+    - t_start (float): Start of the window (inclusive), beginning of the grid if None.
+    - t_stop (float): End of the window (inclusive), end of the grid if None.
+
+    Returns:
+    - numpy.ndarray: Times of the window.
+    - numpy.ndarray: (m, window) array of values.
+    """
+    store = open_store(directory)
+    t = store['time']
+    first = 0 if t_start is None else np.searchsorted(t, t_start, side='left')
+    last = t.size if t_stop is None else np.searchsorted(t, t_stop, side='right')
+    return t[first:last], np.array(store[column][realizations, first:last])
+
+def save_statistics(directory, summary):
+    """Save a statistics summary (see EnsembleStatistics.summary) as .npy files of the store.
+
+    Parameters:
+    - directory (str): Store directory.
+    - summary (dict): Ensemble statistics.
+    """
+    directory = Path(directory) / STATISTICS_DIRECTORY
+    directory.mkdir(parents=True, exist_ok=True)
+    for key, value in summary.items():
+        if key == 'quantiles':
+            for p, array in value.items():
+                np.save(directory / f'quantile_{p:g}.npy', array)
+        else:
+            np.save(directory / f'{key}.npy', np.asarray(value))
+
+def load_statistics(directory, mmap_mode='r'):
+    """Load the statistics saved by save_statistics.
+
+    Returns:
+    - dict: Statistics with the layout of EnsembleStatistics.summary.
+    """
+    summary = {'quantiles': {}}
+    for path in sorted((Path(directory) / STATISTICS_DIRECTORY).glob('*.npy')):
+        array = np.load(path, mmap_mode=mmap_mode)
+        if path.stem.startswith('quantile_'):
+            summary['quantiles'][float(path.stem[len('quantile_'):])] = array
+        else:
+            summary[path.stem] = array[()] if array.ndim == 0 else array
+    return summary
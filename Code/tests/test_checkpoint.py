@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from rsv_sim import checkpoint
+from rsv_sim.checkpoint import run_windowed
+from rsv_sim.sde import Euler_Maruyama_ensemble
+
+PARAMETERS = {'t_in': 0, 't_end': 1, 'N': 1000, 'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8,
+              'ni': 36, 'alpha': 0.728, 'S_in': 0.9988, 'I_in': 0.0012, 'R_in': 0.0}
+OPTIONS = {'model': 'transmission', 'seed': 7, 'window': 100, 'checkpoint_every': 2}
+
+class Killed(Exception):
+    pass
+
+def test_resumed_run_equals_an_uninterrupted_one(tmp_path, monkeypatch):
+    save_checkpoint = checkpoint.save_checkpoint
+
+    def killed_at_step_400(directory, step, *args):
+        # Killed after the windows up to step 400 were written, before their checkpoint
+        if step == 400:
+            raise Killed
+        save_checkpoint(directory, step, *args)
+
+    monkeypatch.setattr(checkpoint, 'save_checkpoint', killed_at_step_400)
+    with pytest.raises(Killed):
+        run_windowed(8, PARAMETERS, tmp_path / 'resumed', **OPTIONS)
+    monkeypatch.undo()
+
+    resumed, info = run_windowed(8, PARAMETERS, tmp_path / 'resumed', **OPTIONS)
+    assert info['resumed_from'] == 200
+    uninterrupted, _ = run_windowed(8, PARAMETERS, tmp_path / 'uninterrupted', **OPTIONS)
+    _, results = Euler_Maruyama_ensemble(8, **PARAMETERS, model='transmission', seed=7)
+    for c, column in enumerate(('S', 'I', 'R')):
+        np.testing.assert_array_equal(resumed[column], uninterrupted[column])
+        np.testing.assert_array_equal(resumed[column], results[:, :, c])
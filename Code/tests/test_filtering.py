@@ -0,0 +1,20 @@
+import numpy as np
+
+from rsv_sim.filtering import ParticleFilter, assimilate
+
+PARAMETERS = {'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36, 'alpha': 0.728}
+OPTIONS = {'M': 200, 'parameters': PARAMETERS, 'scale': 1e4, 'seed': 0, 'steps_per_month': 20, 'dispersion': 5.0}
+OBSERVED = np.array([40, 25, 12, 8, 6, 9, 20, 60, 150, 220])
+
+def test_resumed_assimilation_equals_an_uninterrupted_run(tmp_path):
+    assimilate(tmp_path, OBSERVED[:6], **OPTIONS)
+    resumed, records = assimilate(tmp_path, OBSERVED)
+    assert [record['month'] for record in records] == [6, 7, 8, 9]
+
+    uninterrupted = ParticleFilter(**OPTIONS)
+    for cases in OBSERVED:
+        uninterrupted.update(cases)
+    np.testing.assert_array_equal(resumed.particles, uninterrupted.particles)
+    np.testing.assert_array_equal(resumed.log_weights, uninterrupted.log_weights)
+    assert resumed.t == uninterrupted.t
+    assert resumed.history == uninterrupted.history
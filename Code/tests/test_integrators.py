@@ -0,0 +1,27 @@
+import pytest
+
+from rsv_sim.integrators import convergence_study
+
+# Strong noise over a quarter of a year, so the noise terms dominate the error of every scheme
+PARAMETERS = {'t_in': 0, 't_end': 0.25, 'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36,
+              'alpha': 2.0, 'S_in': 0.9988, 'I_in': 0.0012, 'R_in': 0.0}
+
+def test_strong_orders_of_the_birth_model():
+    study = convergence_study(PARAMETERS, model='birth', M=100, seed=0)
+    assert study['euler_maruyama']['order'] == pytest.approx(0.5, abs=0.15)
+    assert study['milstein']['order'] == pytest.approx(1.0, abs=0.15)
+    assert study['taylor15']['order'] == pytest.approx(1.5, abs=0.15)
+
+# The transmission noise alone (no drift), so the order is set by the Levy areas of the Milstein scheme
+TRANSMISSION_NOISE = {**PARAMETERS, 'mu': 0.0, 'b0': 1e-3, 'b1': 0.0, 'phi': 0.0, 'gamma': 0.0, 'ni': 0.0,
+                      'S_in': 0.5, 'I_in': 0.5}
+
+def test_strong_orders_of_the_transmission_model():
+    # The default of fixed_step_ensemble, no term of the Levy area series
+    study = convergence_study(TRANSMISSION_NOISE, model='transmission', M=100, seed=0)
+    assert study['euler_maruyama']['order'] == pytest.approx(0.5, abs=0.15)
+    assert study['milstein']['order'] == pytest.approx(0.5, abs=0.15)
+    # Terms growing as 1 / dt restore order 1
+    study = convergence_study(TRANSMISSION_NOISE, model='transmission', schemes=('milstein',),
+                              levels=(16, 32, 64, 128, 256), M=100, seed=0, levy_terms='scaled')
+    assert study['milstein']['order'] == pytest.approx(1.0, abs=0.15)
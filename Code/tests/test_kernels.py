@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from rsv_sim.kernels import COMPILED_CHUNKS, rk4_sweep_compiled
+from rsv_sim.ode import PARAMETER_NAMES, rk4_sweep
+from rsv_sim.sde import NOISE_DIMENSIONS, STEPS
+
+PARAMETERS = {'mu': 0.009, 'b0': 36.4, 'b1': 0.38, 'phi': 1.07, 'gamma': 1.8, 'ni': 36, 'alpha': 0.728}
+
+# The compiled kernels evaluate the same expressions in the same order as the NumPy code, so they
+# agree to rounding (bitwise on x86-64 today); the tolerance only leaves room for a different libm
+RTOL = 1e-12
+
+@pytest.mark.parametrize('model', sorted(STEPS))
+def test_compiled_chunk_matches_numpy_step(model):
+    rng = np.random.default_rng(0)
+    M, K, dt, t_in, step0 = 7, 50, 1e-3, 0.25, 13
+    X0 = np.column_stack([rng.uniform(0.8, 1, M), rng.uniform(0, 0.01, M), rng.uniform(0, 0.1, M)])
+    increments = np.sqrt(dt) * rng.standard_normal((K, M, NOISE_DIMENSIONS[model]))
+    p = PARAMETERS
+    args = (p['mu'], p['b0'], p['b1'], p['phi'], p['gamma'], p['ni'], p['alpha'])
+
+    compiled = np.empty((M, K, 3))
+    COMPILED_CHUNKS[model](compiled, X0, step0, t_in, dt, increments, *args)
+
+    reference = np.empty((M, K, 3))
+    X = X0
+    for k in range(K):
+        X = STEPS[model](t_in + (step0 + k) * dt, dt, X, increments[k], *args)
+        reference[:, k] = X
+    np.testing.assert_allclose(compiled, reference, rtol=RTOL, atol=0)
+
+def test_compiled_rk4_sweep_matches_numpy():
+    rng = np.random.default_rng(1)
+    P = 5
+    params = {'b0': rng.uniform(30, 45, P), 'b1': rng.uniform(0.2, 0.5, P), 'phi': rng.uniform(0, 2 * np.pi, P),
+              'mu': np.full(P, 0.009), 'gamma': rng.uniform(1, 3, P), 'ni': np.full(P, 36.0)}
+    Y0 = np.tile([[0.9988], [0.0012], [0.0]], (1, P))
+    t = np.linspace(0, 2, 97)
+
+    compiled = rk4_sweep_compiled(t, Y0, 3, *(params[name] for name in PARAMETER_NAMES))
+    reference = rk4_sweep(t, params, Y0, substeps=3, backend='numpy')
+    np.testing.assert_allclose(compiled, reference, rtol=RTOL, atol=0)